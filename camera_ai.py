@@ -16,6 +16,8 @@ FACE_DB_DIR = "authorized_faces"
 # API 认证信息
 USERNAME = "admin"
 PASSWORD = "admin123"
+# 设备 Key（python manage.py issue_device_key <customer_id> CAM-01 签发），配置后优先使用
+DEVICE_KEY = os.environ.get("DEVICE_KEY", "")
 
 # --- 1. 加载人脸数据库 (带内存修复) ---
 print(f"🔄 Loading Employee Database from '{FACE_DB_DIR}'...")
@@ -173,7 +175,11 @@ while True:
                 'person_id': who_id
             }
             # 发送请求（带认证）
-            response = requests.post(SERVER_URL, data=data, files=files, auth=(USERNAME, PASSWORD))
+            if DEVICE_KEY:
+                auth_kwargs = {'headers': {'Authorization': f'Device {DEVICE_KEY}'}}
+            else:
+                auth_kwargs = {'auth': (USERNAME, PASSWORD)}
+            response = requests.post(SERVER_URL, data=data, files=files, **auth_kwargs)
             if response.status_code in [200, 201]:
                 print("✅ Alert Sent to Django!")
             else:
@@ -1,6 +1,7 @@
 """
 摄像头模拟器 - 模拟 AI 摄像头向服务器发送 PPE 检测数据
 """
+import os
 import requests
 import random
 import json
@@ -12,6 +13,10 @@ USERNAME = 'admin'
 PASSWORD = 'admin123'
 IMAGE_PATH = 'test.png'
 
+# 设备 Key（python manage.py issue_device_key <customer_id> <camera_id> 签发）
+# 配置后走设备认证，不再每次请求都跑 PBKDF2；未配置时回退到 Basic Auth
+DEVICE_KEY = os.environ.get('DEVICE_KEY', '')
+
 # 可选的摄像头 ID
 CAMERA_IDS = ['CAM-01', 'CAM-02', 'CAM-03']
 
@@ -55,11 +60,15 @@ def send_detection_event():
             }
             
             # 发送 POST 请求
+            if DEVICE_KEY:
+                auth_kwargs = {'headers': {'Authorization': f'Device {DEVICE_KEY}'}}
+            else:
+                auth_kwargs = {'auth': (USERNAME, PASSWORD)}  # Basic Auth
             response = requests.post(
                 API_URL,
                 data=data,
                 files=files,
-                auth=(USERNAME, PASSWORD)  # Basic Auth
+                **auth_kwargs
             )
         
         # 打印结果
@@ -92,7 +101,7 @@ def main():
     print("=" * 50)
     print("PPE 摄像头模拟器启动")
     print(f"API: {API_URL}")
-    print(f"User: {USERNAME}")
+    print(f"Auth: {'Device Key' if DEVICE_KEY else USERNAME}")
     print("=" * 50)
     print()
     
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+import sys
 import dj_database_url
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +28,9 @@ SECRET_KEY = "django-insecure-9%^*ep!_#*)r0^@k-5ek%5eo7t@bwz%#3=#l^8zmb+ee&zy&x$
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = 'RENDER' not in os.environ
 
+# 是否在跑测试（python manage.py test）
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -46,7 +51,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # WhiteNoise 静态文件服务（必须在 SecurityMiddleware 之后）
+    "core.middleware.AsyncWhiteNoiseMiddleware",  # WhiteNoise 静态文件服务（必须在 SecurityMiddleware 之后；支持 ASGI，中间件链不降级为同步）
+    "core.profiling.ProfilingMiddleware",  # 请求性能分析（REQUEST_PROFILING=1 时才启用）
+    "core.db_router.ReplicaPinMiddleware",  # 读自己的写：有写操作后短时间内分析查询不走只读副本
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -75,6 +82,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+# 生产环境通过 ASGI 运行（见 Procfile），异步上报接口 /api/v1/ppe/events/ingest/ 依赖它
+ASGI_APPLICATION = "config.asgi.application"
 
 
 # Database
@@ -91,9 +100,46 @@ DATABASES={'default': {
 }
 }
 
+# 连接复用（默认关闭，即每个请求新建连接）：
+# - DB_CONN_MAX_AGE: 持久连接的秒数，适合 WSGI（每个线程一条长连接）
+#   ASGI 下同步代码每个请求换一个线程，持久连接复用不了，应改用连接池
+# - DB_POOL: PostgreSQL 连接池（psycopg 3 + psycopg-pool），ASGI 部署用这个；启用时 CONN_MAX_AGE 必须为 0
+# - DB_CONN_HEALTH_CHECKS: 复用连接前先检查是否可用（数据库重启 / 连接超时后不会报错）
+# 各 worker 的连接数 / 连接池统计见 /admin/db-stats/
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', '1').lower() in ('1', 'true', 'yes')
+DB_POOL = os.environ.get('DB_POOL', '').lower() in ('1', 'true', 'yes')
+
 # ✅ 修改后的代码（新的）
-db_from_env = dj_database_url.config(conn_max_age=0)
+db_from_env = dj_database_url.config(conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS)
 DATABASES['default'].update(db_from_env)
+DATABASES['default'].setdefault('CONN_MAX_AGE', DB_CONN_MAX_AGE)
+DATABASES['default'].setdefault('CONN_HEALTH_CHECKS', DB_CONN_HEALTH_CHECKS)
+
+if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # 等待空闲连接的最长秒数
+    }
+
+# 只读副本（可选）：DATABASE_REPLICA_URL 格式同 DATABASE_URL
+# dashboard 统计、日报、导出、后台大表列表页的读查询走副本，见 core/db_router.py
+# 用户自己有写操作后 REPLICA_PIN_SECONDS 秒内仍读主库（读自己的写）
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+DATABASE_REPLICA_ALIAS = 'replica' if DATABASE_REPLICA_URL else None
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS
+    )
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}):
+        DATABASES['replica']['CONN_MAX_AGE'] = 0
+        DATABASES['replica'].setdefault('OPTIONS', {})['pool'] = DATABASES['default']['OPTIONS']['pool']
+    # 测试时副本指向测试库，不单独建库
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -145,14 +191,108 @@ LOGOUT_REDIRECT_URL = 'login'  # 登出后跳回登录页
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'core.authentication.DeviceKeyAuthentication',  # 摄像头设备 Key（放最前，不走 PBKDF2）
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # 没有单独设置 permission_classes 的视图只允许用户调用；设备可以调用的视图自己声明 DeviceWriteOnly
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+        'core.authentication.NotDevice',
     ],
 }
 
+# 设备 Key 校验结果在进程内缓存的秒数（吊销后其它 worker 最长延迟这么久生效）
+DEVICE_KEY_CACHE_TTL = int(os.environ.get('DEVICE_KEY_CACHE_TTL', 300))
+# 无效 Key 的缓存条数上限（超出时淘汰最早的）
+DEVICE_KEY_CACHE_MAX_MISSES = int(os.environ.get('DEVICE_KEY_CACHE_MAX_MISSES', 10000))
+
+# 客户授权状态（订阅）缓存秒数；Customer / Subscription 变更时由 signals 立即失效，TTL 只是兜底
+ENTITLEMENT_CACHE_TTL = int(os.environ.get('ENTITLEMENT_CACHE_TTL', 300))
+
+
+# 缩略图后台线程池：线程数 / 最多排队的任务数（排不上的由 generate_image_variants 命令补齐）
+# 0 表示不用线程池，事件提交后同步生成；跑测试时默认 0，后台线程不会和测试争用数据库
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 0 if TESTING else 2))
+IMAGE_VARIANT_MAX_PENDING = int(os.environ.get('IMAGE_VARIANT_MAX_PENDING', 200))
+
+# 报警发送后台线程池：线程数 / 最多排队的报警数
+NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', 4))
+NOTIFICATION_MAX_PENDING = int(os.environ.get('NOTIFICATION_MAX_PENDING', 500))
+
+
+# 缓存：默认进程内缓存；多进程部署设置 REDIS_URL 共用 Redis（数据版本号、dashboard 缓存才能跨进程生效）
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# 数据版本号（dashboard 缓存、ETag / 304、已保存报告的复用）要求缓存由所有 worker 共用：
+# 进程内缓存下每个 worker 各有一份版本号，其它 worker 写入后这里的缓存不会失效。
+# 默认：设置了 REDIS_URL 或本地开发（runserver 单进程）时启用；生产环境没有 REDIS_URL 时关闭（启动时有系统检查警告）
+DATA_VERSION_CACHE = os.environ.get(
+    'DATA_VERSION_CACHE', '1' if os.environ.get('REDIS_URL') or DEBUG else '0'
+).lower() in ('1', 'true', 'yes')
+
+# Dashboard 统计缓存时间（秒）；数据变化时靠版本号立即失效，TTL 只是兜底
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 3600))
+
+# 数据保留：Customer.retention_days 未设置时的默认保留天数（不设置则永久保留）
+EVENT_RETENTION_DAYS = int(os.environ['EVENT_RETENTION_DAYS']) if os.environ.get('EVENT_RETENTION_DAYS') else None
+
+# 归档目录：超过保留期的事件图片按天打包成 tar 存放在这里（可以挂载到冷存储）
+ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT', str(BASE_DIR / 'archive'))
+
+# 实时推送 (SSE)：每个客户缓冲的消息数（断线重连补发用） / keepalive 间隔 / 单个连接最长秒数（到期由浏览器重连）
+LIVE_FEED_BUFFER_SIZE = int(os.environ.get('LIVE_FEED_BUFFER_SIZE', 1000))
+LIVE_FEED_KEEPALIVE = int(os.environ.get('LIVE_FEED_KEEPALIVE', 15))
+LIVE_FEED_MAX_SECONDS = int(os.environ.get('LIVE_FEED_MAX_SECONDS', 300))
+
+# 请求性能分析：默认关闭（关闭时中间件不进入调用链）；每个接口保留最近多少个请求；同一条 SQL 重复多少次视为疑似 N+1
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '').lower() in ('1', 'true', 'yes')
+REQUEST_PROFILING_WINDOW = int(os.environ.get('REQUEST_PROFILING_WINDOW', 200))
+REQUEST_PROFILING_N_PLUS_ONE = int(os.environ.get('REQUEST_PROFILING_N_PLUS_ONE', 5))
+
+# 日志：每条一行 JSON 输出到 stdout（后台线程写出，不阻塞请求）
+# LOG_SAMPLE_RATES 按 logger 名前缀对 INFO 及以下抽样（WARNING 及以上全部保留），
+# 可用环境变量覆盖，例如 LOG_SAMPLE_RATES='{"core.middleware": 0.1}'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATES = {
+    'core.middleware': 0.01,  # 每个被拦截的请求一条
+    **json.loads(os.environ.get('LOG_SAMPLE_RATES', '{}')),
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.logging_utils.JsonFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'core.logging_utils.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'console': {
+            'class': 'core.logging_utils.QueueStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
+            'filters': ['sampling'],
+        },
+    },
+    'root': {'handlers': ['console'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # LLM API Configuration
 # 支持从环境变量读取，如果没有则使用默认值
@@ -165,6 +305,9 @@ import os
 LLM_API_KEY = os.environ.get('LLM_API_KEY', 'ollama')  # Ollama 不需要真实 Key，填字符串即可
 LLM_API_BASE = os.environ.get('LLM_API_BASE', 'http://127.0.0.1:11434/v1')  # Ollama 本地地址
 LLM_MODEL = os.environ.get('LLM_MODEL', 'llama3.2')  # 本地模型名称（如 llama3.2, mistral, qwen2.5）
+# 连接超时（秒）：LLM 服务不可达时很快改用模板报告；读取超时（秒）：两次输出之间最长等待时间
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 3))
+LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', 120))
 
 # 如果需要切换回 DeepSeek/OpenAI，取消下面的注释并注释掉上面的配置
 # LLM_API_KEY = os.environ.get('LLM_API_KEY', 'sk-7e9fe2396f184bf8959c1e6ba3597bb3')
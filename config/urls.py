@@ -20,10 +20,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 
-from core.views import index, service_suspended
+from core.views import index, db_stats, profiling_stats, service_suspended
 
 urlpatterns = [
     path("", index, name='index'),  # 首页
+    path("admin/profiling/", admin.site.admin_view(profiling_stats), name='profiling-stats'),  # 请求性能统计（仅 staff）
+    path("admin/db-stats/", admin.site.admin_view(db_stats), name='db-stats'),  # 数据库连接 / 连接池统计（仅 staff）
     path("admin/", admin.site.urls),
     path("login/", auth_views.LoginView.as_view(template_name='login.html'), name='login'),
     path("logout/", auth_views.LogoutView.as_view(next_page='login'), name='logout'),
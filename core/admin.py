@@ -1,11 +1,11 @@
-from django.contrib import admin
-from .models import Customer, UserProfile, Module, Subscription
+from django.contrib import admin, messages
+from .models import Customer, UserProfile, Module, Subscription, DeviceCredential, GeneratedReport
 
 # 注册 Customer 表到后台
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
     # 后台列表显示哪些字段
-    list_display = ('name', 'license_key', 'is_active', 'created_at')
+    list_display = ('name', 'license_key', 'is_active', 'retention_days', 'created_at')
     # 允许搜索公司名
     search_fields = ('name',)
     # 允许按激活状态过滤
@@ -50,4 +50,53 @@ class SubscriptionAdmin(admin.ModelAdmin):
         """显示订阅是否有效"""
         return obj.is_valid
     is_valid_display.boolean = True
-    is_valid_display.short_description = 'Valid'
\ No newline at end of file
+    is_valid_display.short_description = 'Valid'
+
+
+# 注册 DeviceCredential 表到后台
+@admin.register(DeviceCredential)
+class DeviceCredentialAdmin(admin.ModelAdmin):
+    # 后台列表显示哪些字段
+    list_display = ('customer', 'camera_id', 'key_prefix', 'is_active', 'created_at')
+    # 允许搜索客户名和摄像头编号
+    search_fields = ('customer__name', 'camera_id')
+    # 允许按激活状态过滤
+    list_filter = ('is_active',)
+    actions = ['rotate_keys']
+
+    def save_model(self, request, obj, form, change):
+        """新建时自动签发 Key，并把明文 Key 显示一次"""
+        if change:
+            super().save_model(request, obj, form, change)
+            return
+        credential, raw_key = DeviceCredential.issue(obj.customer, obj.camera_id)
+        obj.pk = credential.pk
+        obj.key_prefix = credential.key_prefix
+        self.message_user(
+            request,
+            f"Device key for {credential.camera_id} (shown only once): {raw_key}",
+            messages.WARNING,
+        )
+
+    @admin.action(description='Rotate key for selected devices')
+    def rotate_keys(self, request, queryset):
+        """轮换选中设备的 Key，旧 Key 立即失效"""
+        for credential in queryset.select_related('customer'):
+            _, raw_key = DeviceCredential.issue(credential.customer, credential.camera_id)
+            self.message_user(
+                request,
+                f"New key for {credential.customer.name} / {credential.camera_id}: {raw_key}",
+                messages.WARNING,
+            )
+
+
+# 注册 GeneratedReport 表到后台（只读，由报告生成时写入）
+@admin.register(GeneratedReport)
+class GeneratedReportAdmin(admin.ModelAdmin):
+    list_display = ('customer', 'period', 'date', 'source', 'updated_at')
+    list_filter = ('period', 'source')
+    search_fields = ('customer__name',)
+    readonly_fields = ('customer', 'period', 'date', 'data_version', 'stats_hash', 'content', 'source', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = "core"
+
+    def ready(self):
+        # 注册信号处理（缓存失效等）
+        from . import signals  # noqa: F401
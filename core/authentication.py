@@ -0,0 +1,204 @@
+"""
+摄像头设备认证
+摄像头用 DeviceCredential 签发的 API Key 认证，替代共用 admin 账号的 Basic Auth：
+- Basic Auth 每个请求都要跑一次 PBKDF2（几十毫秒 CPU），设备 Key 只需一次 SHA-256
+- 校验结果缓存在进程内，命中缓存时不查数据库
+- 直接解析到 Customer，不再经过 user.userprofile.customer
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission, SAFE_METHODS
+
+from .models import DeviceCredential
+
+
+class DeviceUser:
+    """
+    设备请求的 request.user。
+    只携带 customer / camera_id，满足 IsAuthenticated 的判断。
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    pk = None
+    id = None
+
+    def __init__(self, credential):
+        self.credential = credential
+        self.customer = credential.customer
+        self.camera_id = credential.camera_id
+        self.username = f"device:{credential.camera_id}"
+
+    def __str__(self):
+        return self.username
+
+
+class DeviceKeyCache:
+    """
+    进程内的设备 Key 缓存: key_hash -> (DeviceCredential 或 None, 过期时间)
+    有效 Key 最多与 DeviceCredential 行数一样多；无效 Key（None）同样缓存，防止错误 Key 反复打到数据库，
+    但单独存放、最多 DEVICE_KEY_CACHE_MAX_MISSES 条，超出时淘汰最早写入的，随机 Key 刷不爆内存。
+    DeviceCredential / Customer 变更时由 signals 主动失效；多进程之间靠 TTL 兜底。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'DEVICE_KEY_CACHE_TTL', 300)
+
+    @property
+    def max_misses(self):
+        return getattr(settings, 'DEVICE_KEY_CACHE_MAX_MISSES', 10000)
+
+    def _cached(self, key_hash):
+        """返回 (是否命中, DeviceCredential 或 None)"""
+        now = time.monotonic()
+        entry = self._entries.get(key_hash)
+        if entry is not None and entry[1] > now:
+            return True, entry[0]
+        expires = self._misses.get(key_hash)
+        if expires is not None and expires > now:
+            return True, None
+        return False, None
+
+    def resolve(self, raw_key):
+        """校验明文 Key，返回有效的 DeviceCredential，无效返回 None"""
+        key_hash = DeviceCredential.hash_key(raw_key)
+        hit, credential = self._cached(key_hash)
+        if hit:
+            return credential
+
+        credential = self._load(raw_key, key_hash)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if credential is not None:
+                self._entries[key_hash] = (credential, expires)
+                self._misses.pop(key_hash, None)
+            else:
+                self._entries.pop(key_hash, None)
+                # 重新插入放到末尾，淘汰时按写入顺序从最早的开始
+                self._misses.pop(key_hash, None)
+                while self._misses and len(self._misses) >= self.max_misses:
+                    del self._misses[next(iter(self._misses))]
+                self._misses[key_hash] = expires
+        return credential
+
+    async def aresolve(self, raw_key):
+        """resolve() 的异步版本：命中缓存时不切线程，未命中才到线程里查库"""
+        hit, credential = self._cached(DeviceCredential.hash_key(raw_key))
+        if hit:
+            return credential
+        return await sync_to_async(self.resolve)(raw_key)
+
+    def _load(self, raw_key, key_hash):
+        license_hex, _, secret = raw_key.partition('.')
+        if not secret:
+            return None
+        try:
+            credential = DeviceCredential.objects.select_related('customer').get(
+                key_hash=key_hash,
+                is_active=True,
+                customer__is_active=True,
+            )
+        except DeviceCredential.DoesNotExist:
+            return None
+        # Key 前半段必须与所属客户的 License Key 一致
+        if credential.customer.license_key.hex != license_hex:
+            return None
+        return credential
+
+    def invalidate(self, key_hash=None, customer_id=None):
+        """
+        按 key_hash 或 customer 失效；都不传则全部清空
+        按 customer 失效时无效 Key 也全部清空（无法知道它们属于哪个客户，例如客户重新启用）
+        """
+        with self._lock:
+            if key_hash is None and customer_id is None:
+                self._entries.clear()
+                self._misses.clear()
+                return
+            self._misses.pop(key_hash, None)
+            if customer_id is not None:
+                self._misses.clear()
+            for cached_hash, (credential, _) in list(self._entries.items()):
+                if cached_hash == key_hash or credential.customer_id == customer_id:
+                    del self._entries[cached_hash]
+
+
+device_key_cache = DeviceKeyCache()
+
+
+def get_device_key(meta):
+    """从请求头读取设备 Key（Authorization: Device <key> 或 X-Device-Key），没有返回空串"""
+    raw_key = meta.get('HTTP_X_DEVICE_KEY', '')
+    if not raw_key:
+        auth = meta.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) != 2 or auth[0] != DeviceKeyAuthentication.keyword:
+            return ''
+        raw_key = auth[1]
+    return raw_key.strip()
+
+
+class DeviceKeyAuthentication(BaseAuthentication):
+    """
+    DRF 认证类 - 读取设备 Key
+    支持两种请求头:
+    - Authorization: Device <key>
+    - X-Device-Key: <key>
+    没有携带设备 Key 时返回 None，交给后面的 Basic / Session 认证。
+    """
+    keyword = 'Device'
+
+    def authenticate(self, request):
+        raw_key = get_device_key(request.META)
+        if not raw_key:
+            return None
+
+        credential = device_key_cache.resolve(raw_key)
+        if credential is None:
+            raise AuthenticationFailed('Invalid or revoked device key.')
+        return (DeviceUser(credential), credential)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class DeviceWriteOnly(BasePermission):
+    """设备 Key 只允许上报事件（写），不允许读取客户的数据"""
+
+    def has_permission(self, request, view):
+        if isinstance(request.auth, DeviceCredential):
+            return request.method not in SAFE_METHODS
+        return True
+
+
+class NotDevice(BasePermission):
+    """只允许用户调用（设备 Key 不能调用，例如批量处理事件）"""
+
+    def has_permission(self, request, view):
+        return not isinstance(request.auth, DeviceCredential)
+
+
+def get_request_customer(request):
+    """
+    获取请求所属的 Customer：设备请求直接取凭证上的 customer，
+    普通用户取 request.tenant（与中间件共用一次加载），没有经过中间件时走 userprofile
+    """
+    if isinstance(request.auth, DeviceCredential):
+        return request.auth.customer
+    tenant = getattr(request, 'tenant', None)
+    customer = tenant.customer if tenant is not None else None
+    if customer is None:
+        return request.user.userprofile.customer
+    return customer
@@ -0,0 +1,60 @@
+"""
+数据库连接指标（每个 worker 进程各自统计）
+- 新建连接数：connection_created 信号，每次握手 +1；与请求数对比就能看出持久连接 / 连接池是否生效
+- 连接池（PostgreSQL + DB_POOL）：psycopg_pool 的 get_stats()，包括池大小、空闲连接数、等待次数和等待时间
+"""
+import os
+import threading
+from collections import Counter
+
+from django.db import connections
+
+_lock = threading.Lock()
+_connections_opened = Counter()
+_requests = 0
+
+
+def record_connection(alias):
+    with _lock:
+        _connections_opened[alias] += 1
+
+
+def record_request():
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def _pool_stats(connection):
+    """连接池统计；没有启用连接池（或不是 PostgreSQL）时返回 None"""
+    if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+        return None
+    pool = getattr(connection, 'pool', None)
+    return pool.get_stats() if pool is not None else None
+
+
+def snapshot():
+    with _lock:
+        opened = dict(_connections_opened)
+        requests = _requests
+    return {
+        'pid': os.getpid(),
+        'requests': requests,
+        'databases': {
+            connection.alias: {
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+                'conn_health_checks': connection.settings_dict.get('CONN_HEALTH_CHECKS'),
+                'connections_opened': opened.get(connection.alias, 0),
+                'pool': _pool_stats(connection),
+            }
+            for connection in connections.all()
+        },
+    }
+
+
+def reset():
+    global _requests
+    with _lock:
+        _connections_opened.clear()
+        _requests = 0
@@ -0,0 +1,148 @@
+"""
+只读副本路由（配置 DATABASE_REPLICA_URL 后启用）
+- 只有包在 analytics_reads() 里的读查询才走副本：导出、后台大表列表页
+  其余读写一律走 default，主从延迟不会影响普通页面和接口
+- 结果会按数据版本号缓存的查询（dashboard 统计、报告）不要走副本：副本落后时，
+  旧结果会被记在新的版本号下，直到下一次数据变更都不会纠正
+- 读自己的写：请求里有写操作时，响应带上 REPLICA_PIN_COOKIE（REPLICA_PIN_SECONDS 秒），
+  期间这个浏览器的分析查询也走 default，刚处理的事件立即能在 dashboard 上看到
+- 在事务里（default 上有未提交的写）也不走副本
+本地测试：DATABASE_REPLICA_URL 指向同一个库即可得到两个别名
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_PIN_COOKIE = 'db_pin'
+
+
+@dataclass
+class RoutingState:
+    """一个请求的路由状态（中间件创建；路由器在上面记录是否有写操作）"""
+    pinned: bool = False
+    wrote: bool = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+_analytics = ContextVar('db_analytics_reads', default=False)
+
+
+def replica_alias():
+    """配置了副本且当前请求没有被固定到主库时返回副本别名，否则 None"""
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    if not alias:
+        return None
+    state = _state.get()
+    if state is not None and state.pinned:
+        return None
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    return alias
+
+
+def analytics_db():
+    """分析查询应使用的库（流式导出等在 analytics_reads() 之外执行的查询用 .using() 指定）"""
+    return replica_alias() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def analytics_reads():
+    """块内的读查询走副本（可用时）；也可以当装饰器用"""
+    token = _analytics.set(True)
+    try:
+        yield
+    finally:
+        _analytics.reset(token)
+
+
+class ReplicaRouter:
+    """settings.DATABASE_ROUTERS 中引用"""
+
+    def db_for_read(self, model, **hints):
+        if _analytics.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """
+    读自己的写：请求带着未过期的 pin cookie 时分析查询走主库；
+    本次请求有写操作时设置 / 续期 cookie
+    路由状态是可变对象，异步请求里 sync_to_async 复制上下文后，视图线程记录的写操作这里也能看到
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned=self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    @staticmethod
+    def _pinned(request):
+        try:
+            return int(request.COOKIES.get(REPLICA_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _pin(state, response):
+        if state.wrote:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+class ReplicaChangeListMixin:
+    """后台列表页（GET）的查询走副本；POST（批量操作、list_editable）仍走主库"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with analytics_reads():
+            response = super().changelist_view(request, extra_context)
+            # TemplateResponse 默认在返回之后才渲染，列表的查询要在这里执行
+            if hasattr(response, 'render'):
+                response.render()
+            return response
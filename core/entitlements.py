@@ -0,0 +1,162 @@
+"""
+客户授权（订阅）状态缓存
+中间件、上下文处理器、模块权限检查每个请求都要用，原来各自查库；现在：
+- 一条查询（Customer LEFT JOIN 有效的 Subscription + Module）取出客户状态和各模块的到期时间
+- 结果按客户放进缓存（ENTITLEMENT_CACHE_TTL 秒），Customer / Subscription / Module 变更时由 signals 删除
+- 缓存里存的是到期时间而不是 "是否过期"，读取时再和当前时间比较，订阅到期不需要等缓存失效
+- 用户 -> 客户的对应关系同样缓存，UserProfile 变更时删除
+- 每个请求上挂一个 Tenant（request.tenant，由 SubscriptionCheckMiddleware 设置），第一次用到时才加载，
+  中间件、上下文处理器、视图共用同一份结果
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FilteredRelation, Q
+from django.utils import timezone
+
+from .models import Customer, Subscription, UserProfile
+
+# 用户没有 UserProfile（例如只用于后台的管理员账号）时缓存的占位值
+NO_CUSTOMER = 0
+
+
+def _ttl():
+    return getattr(settings, 'ENTITLEMENT_CACHE_TTL', 300)
+
+
+def _customer_key(customer_id):
+    return f"core:entitlements:{customer_id}"
+
+
+def _user_key(user_id):
+    return f"core:user-customer:{user_id}"
+
+
+class Entitlements:
+    """某个客户的授权状态：Customer 实例 + 每个有效（is_active）订阅模块的到期时间"""
+
+    def __init__(self, customer, modules):
+        self.customer = customer
+        self.customer_active = customer.is_active
+        self.modules = modules  # {module_slug: expiration_date}
+
+    def has_module(self, slug, now=None):
+        """是否拥有某个模块（订阅启用且未到期）"""
+        now = now or timezone.now()
+        expiration = self.modules.get(slug)
+        return self.customer_active and expiration is not None and expiration > now
+
+    def active_modules(self, now=None):
+        """当前有效的模块 slug 列表"""
+        now = now or timezone.now()
+        if not self.customer_active:
+            return []
+        return sorted(slug for slug, expiration in self.modules.items() if expiration > now)
+
+    def is_suspended(self, today=None):
+        """
+        服务是否暂停：客户停用，或没有任何未过期的订阅
+        到期当天仍然可以使用（按日期比较）
+        """
+        today = today or timezone.now().date()
+        if not self.customer_active:
+            return True
+        return not any(expiration.date() >= today for expiration in self.modules.values())
+
+
+def _load(customer_id):
+    """一条查询取出客户和所有有效订阅（每个订阅一行），客户不存在返回 None"""
+    rows = list(
+        Customer.objects.filter(pk=customer_id)
+        .annotate(active_sub=FilteredRelation('subscriptions', condition=Q(subscriptions__is_active=True)))
+        .annotate(module_slug=F('active_sub__module__slug'), expiration=F('active_sub__expiration_date'))
+    )
+    if not rows:
+        return None
+    modules = {row.module_slug: row.expiration for row in rows if row.module_slug is not None}
+    return Entitlements(rows[0], modules)
+
+
+def get_customer_entitlements(customer_id):
+    """客户的授权状态（优先读缓存），客户不存在返回 None"""
+    key = _customer_key(customer_id)
+    entitlements = cache.get(key)
+    if entitlements is None:
+        entitlements = _load(customer_id)
+        if entitlements is not None:
+            cache.set(key, entitlements, _ttl())
+    return entitlements
+
+
+def get_user_customer_id(user):
+    """用户所属客户的 id（优先读缓存），未登录、设备用户或没有 UserProfile 返回 None"""
+    if not user.is_authenticated or user.pk is None:
+        return None
+    key = _user_key(user.pk)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        customer_id = (
+            UserProfile.objects.filter(user_id=user.pk).values_list('customer_id', flat=True).first()
+            or NO_CUSTOMER
+        )
+        cache.set(key, customer_id, _ttl())
+    return customer_id or None
+
+
+def get_user_entitlements(user):
+    """用户所属客户的授权状态，没有 UserProfile 返回 None"""
+    customer_id = get_user_customer_id(user)
+    if customer_id is None:
+        return None
+    return get_customer_entitlements(customer_id)
+
+
+class Tenant:
+    """
+    当前请求所属的客户和授权状态（request.tenant）
+    第一次访问时按 request.user 加载；DRF 认证后 request.user 变了会重新加载
+    """
+
+    def __init__(self, request):
+        self._request = request
+        self._user = None
+        self._entitlements = None
+
+    @property
+    def entitlements(self):
+        """没有所属客户时为 None"""
+        user = self._request.user
+        if user is not self._user:
+            self._user, self._entitlements = user, get_user_entitlements(user)
+        return self._entitlements
+
+    @property
+    def customer(self):
+        entitlements = self.entitlements
+        return entitlements.customer if entitlements else None
+
+    def has_module(self, slug):
+        entitlements = self.entitlements
+        return entitlements is not None and entitlements.has_module(slug)
+
+    def active_modules(self):
+        entitlements = self.entitlements
+        return entitlements.active_modules() if entitlements else []
+
+    def is_suspended(self):
+        """没有所属客户的用户（例如只用于后台的管理员账号）不算暂停"""
+        entitlements = self.entitlements
+        return entitlements is not None and entitlements.is_suspended()
+
+
+def invalidate_customer(customer_id):
+    cache.delete(_customer_key(customer_id))
+
+
+def invalidate_module(module):
+    """模块 slug 修改：订阅了该模块的客户全部失效"""
+    customer_ids = Subscription.objects.filter(module=module).values_list('customer_id', flat=True)
+    cache.delete_many([_customer_key(customer_id) for customer_id in customer_ids])
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id))
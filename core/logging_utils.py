@@ -0,0 +1,117 @@
+"""
+日志工具（在 settings.LOGGING 中引用）
+- JsonFormatter: 每条日志输出一行 JSON，extra={...} 传入的字段原样带上，方便按字段过滤
+- SamplingFilter: 按 logger 名前缀对 INFO 及以下的日志抽样（WARNING 及以上全部保留），热点路径不刷屏
+- QueueStreamHandler: 调用方只把记录放进队列，格式化和写 stdout 在后台线程做，不阻塞请求线程
+"""
+import copy
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# LogRecord 自带的属性，其余的都是 extra 传入的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """输出 {"ts", "level", "logger", "message", ...extra, "exc"} 一行 JSON"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 logger 名前缀抽样，例如 rates={'core.middleware': 0.01} 只保留 1%
+    最长的匹配前缀生效；WARNING 及以上不抽样
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def _rate(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    非阻塞的 StreamHandler：emit() 只入队，由 QueueListener 线程写出
+    队列满时丢弃日志（计入 dropped），不会让请求等待日志 I/O
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream)
+        self.listener = QueueListener(self.queue, self.target)
+        self._running = False
+        self._start()
+
+    def _start(self):
+        if not self._running:
+            self.listener.start()
+            self._running = True
+
+    def _stop(self):
+        if self._running:
+            self.listener.stop()
+            self._running = False
+
+    def setFormatter(self, fmt):
+        # 格式化在后台线程由 target 做
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """只固定消息参数和异常文本（它们引用的对象之后可能变化），不在调用方线程格式化"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """等待队列中的日志全部写出（测试 / 退出前用）"""
+        if self._running:
+            self._stop()
+            self._start()
+
+    def close(self):
+        # logging.shutdown()（进程退出时）会调用 close，剩余日志在这里写完
+        self._stop()
+        self.target.close()
+        super().close()
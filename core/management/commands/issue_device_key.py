@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Customer, DeviceCredential
+
+
+class Command(BaseCommand):
+    help = "为摄像头签发（或轮换）设备 API Key，明文 Key 只显示这一次"
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_id', type=int, help='Customer ID')
+        parser.add_argument('camera_id', help='摄像头编号，例如 CAM-01')
+
+    def handle(self, *args, **options):
+        try:
+            customer = Customer.objects.get(pk=options['customer_id'])
+        except Customer.DoesNotExist:
+            raise CommandError(f"Customer {options['customer_id']} does not exist")
+
+        credential, raw_key = DeviceCredential.issue(customer, options['camera_id'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Device key for {customer.name} / {credential.camera_id}:"
+        ))
+        self.stdout.write(raw_key)
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from core.models import Customer, GeneratedReport
+from core.utils.report_generator import PERIODS, generate_report, report_period
+
+
+class Command(BaseCommand):
+    help = (
+        "预先生成报告（默认：所有启用客户前一天的日报），用户打开 dashboard 时直接读取已保存的报告。"
+        "建议每天零点后由 cron 执行，例如: 10 0 * * * python manage.py pregenerate_reports"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help='报告日期 YYYY-MM-DD（默认昨天）')
+        parser.add_argument('--period', choices=list(PERIODS), default='daily', help='报告周期（默认 daily）')
+        parser.add_argument('--customer', type=int, action='append', help='只处理指定客户（可重复传入）')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='同时生成的报告数（默认 4）；每个线程占一个数据库连接和一个 LLM 请求，1 表示依次生成',
+        )
+        parser.add_argument('--refresh', action='store_true', help='忽略已保存的报告，全部重新生成')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        day = options['date'] or timezone.now().date() - timedelta(days=1)
+        period = options['period']
+
+        customers = Customer.objects.filter(is_active=True).order_by('pk')
+        if options['customer']:
+            customers = customers.filter(pk__in=options['customer'])
+        customers = list(customers)
+
+        def generate(customer):
+            return self._generate(customer, period, day, options['refresh'])
+
+        if options['workers'] == 1:
+            results = map(generate, customers)
+        else:
+            pool = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='report')
+            results = pool.map(self._in_thread(generate), customers)
+
+        saved = failed = 0
+        for customer, (source, error) in zip(customers, results):
+            if error is not None:
+                failed += 1
+                self.stderr.write(f"  {customer.name}: failed ({error})")
+            elif source is None:
+                self.stdout.write(f"  {customer.name}: not saved (LLM unavailable, will retry on next run)")
+            else:
+                saved += 1
+                self.stdout.write(f"  {customer.name}: {source}")
+        if options['workers'] > 1:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{period} reports for {day}: {saved} saved, {len(customers) - saved - failed} not saved, {failed} failed"
+        ))
+
+    @staticmethod
+    def _generate(customer, period, day, refresh):
+        """生成一个客户的报告，返回 (保存的来源 llm / template / None, 错误)"""
+        try:
+            generate_report(customer, period, day, refresh=refresh)
+        except Exception as exc:
+            return None, exc
+        source = (
+            GeneratedReport.objects.filter(customer=customer, period=period, date=report_period(period, day)[0])
+            .values_list('source', flat=True).first()
+        )
+        return source, None
+
+    @staticmethod
+    def _in_thread(func):
+        """线程池中的线程各自打开数据库连接，任务结束时关闭"""
+        def wrapper(*args):
+            try:
+                return func(*args)
+            finally:
+                connections.close_all()
+        return wrapper
@@ -1,6 +1,12 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
-from django.utils import timezone
-from django.urls import resolve
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .entitlements import Tenant
+
+logger = logging.getLogger(__name__)
 
 
 class SubscriptionCheckMiddleware:
@@ -19,6 +25,9 @@ class SubscriptionCheckMiddleware:
     - /service-suspended/ (服务暂停页本身，避免死循环)
     - 静态文件 (/static/, /media/)
     - 超级管理员不受限制
+
+    同时给每个请求挂上 request.tenant（所属客户 + 授权状态，第一次访问时才加载），
+    上下文处理器、check_module_permission、API 视图都从这里取，一个请求只加载一次
     """
     
     # 白名单路径前缀
@@ -31,49 +40,47 @@ class SubscriptionCheckMiddleware:
         '/media/',
     ]
     
+    # 同时支持 WSGI 和 ASGI（异步上报接口不需要为这个中间件切换线程）
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
     
     def __call__(self, request):
-        print(f"\n{'='*60}")
-        print(f"DEBUG: SubscriptionCheckMiddleware - Request Path: {request.path}")
-        print(f"DEBUG: User is {request.user}")
-        print(f"DEBUG: Is Authenticated? {request.user.is_authenticated}")
-        print(f"DEBUG: Is Superuser? {request.user.is_superuser}")
-        
-        # 检查是否在白名单中
-        is_exempt = self._is_exempt_path(request.path)
-        print(f"DEBUG: Is Exempt Path? {is_exempt}")
-        if is_exempt:
-            print(f"DEBUG: Path is exempt, skipping subscription check")
-            return self.get_response(request)
-        
-        # 检查用户是否已登录
-        if not request.user.is_authenticated:
-            print(f"DEBUG: User not authenticated, skipping subscription check")
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.tenant = Tenant(request)
+
+        # 白名单、未登录、超级管理员不检查
+        if self._is_exempt_path(request.path):
             return self.get_response(request)
-        
-        # 超级管理员不受限制
-        if request.user.is_superuser:
-            print(f"DEBUG: User is superuser, skipping subscription check")
+        if not request.user.is_authenticated or request.user.is_superuser:
             return self.get_response(request)
-        
-        # 检查订阅状态
-        print(f"DEBUG: Checking subscription status...")
-        is_expired = self._is_subscription_expired(request.user)
-        print(f"DEBUG: Subscription Expired? {is_expired}")
-        
-        if is_expired:
-            # 如果已经在服务暂停页面，避免重定向循环
-            if request.path != '/service-suspended/':
-                print(f"DEBUG: Redirecting to /service-suspended/")
-                return redirect('/service-suspended/')
-            else:
-                print(f"DEBUG: Already on /service-suspended/, allowing access")
-        
-        print(f"{'='*60}\n")
+
+        # 检查订阅状态（读缓存，见 core/entitlements.py）
+        if self._is_subscription_expired(request) and request.path != '/service-suspended/':
+            return redirect('/service-suspended/')
+
         return self.get_response(request)
     
+    async def __acall__(self, request):
+        """异步版本，判断逻辑与 __call__ 相同"""
+        request.tenant = Tenant(request)
+        if self._is_exempt_path(request.path):
+            return await self.get_response(request)
+
+        user = await request.auser()
+        if user.is_authenticated and not user.is_superuser:
+            is_expired = await sync_to_async(self._is_subscription_expired)(request)
+            if is_expired and request.path != '/service-suspended/':
+                return redirect('/service-suspended/')
+
+        return await self.get_response(request)
+    
     def _is_exempt_path(self, path):
         """
         检查路径是否在白名单中
@@ -95,86 +102,51 @@ class SubscriptionCheckMiddleware:
         
         return False
     
-    def _is_subscription_expired(self, user):
+    def _is_subscription_expired(self, request):
         """
         检查用户的订阅是否过期
         
         判断条件：
         1. Customer.is_active = False
-        2. 或者 Subscription.expiration_date < today
-        3. 或者 Subscription.is_active = False
+        2. 或者没有任何 is_active = True 且 expiration_date >= today 的 Subscription
+        用户没有 UserProfile 时不拦截
         """
-        try:
-            from .models import UserProfile, Customer, Subscription
-            
-            print(f"  DEBUG: _is_subscription_expired - Starting check for user: {user.username}")
-            
-            # 获取用户档案
-            try:
-                user_profile = user.userprofile
-                print(f"  DEBUG: UserProfile found: {user_profile}")
-            except UserProfile.DoesNotExist:
-                print(f"  DEBUG: UserProfile.DoesNotExist - User has no profile")
-                return False
-            
-            customer = user_profile.customer
-            print(f"  DEBUG: Customer: {customer.name} (ID: {customer.id})")
-            print(f"  DEBUG: Customer.is_active: {customer.is_active}")
-            
-            # 检查 Customer 是否激活
-            if not customer.is_active:
-                print(f"  DEBUG: Customer is not active, subscription EXPIRED")
-                return True
-            
-            # 检查是否有任何有效的订阅
-            today = timezone.now().date()
-            print(f"  DEBUG: Today's date: {today}")
-            
-            # 获取该客户的所有订阅
-            subscriptions = Subscription.objects.filter(customer=customer)
-            subscription_count = subscriptions.count()
-            print(f"  DEBUG: Total subscriptions found: {subscription_count}")
-            
-            # 如果没有订阅，视为过期
-            if not subscriptions.exists():
-                print(f"  DEBUG: No subscriptions found, subscription EXPIRED")
-                return True
-            
-            # 打印所有订阅的详细信息
-            print(f"  DEBUG: Listing all subscriptions:")
-            for idx, sub in enumerate(subscriptions, 1):
-                expiration_date = sub.expiration_date.date()
-                print(f"    [{idx}] Module: {sub.module.name}, is_active: {sub.is_active}, expiration_date: {expiration_date}")
-            
-            # 检查是否有至少一个有效订阅（激活且未过期）
-            # 注意：expiration_date 是 DateTimeField，需要转换为日期进行比较
-            valid_subscriptions = subscriptions.filter(
-                is_active=True
+        suspended = request.tenant.is_suspended()
+        if suspended:
+            logger.info(
+                "Subscription suspended, redirecting",
+                extra={'path': request.path, 'customer_id': getattr(request.tenant.customer, 'pk', None)},
             )
-            valid_count = valid_subscriptions.count()
-            print(f"  DEBUG: Active subscriptions count: {valid_count}")
-            
-            # 检查是否有未过期的订阅
-            has_valid_subscription = False
-            for subscription in valid_subscriptions:
-                # 将 DateTimeField 转换为日期进行比较
-                expiration_date = subscription.expiration_date.date()
-                is_not_expired = expiration_date >= today
-                print(f"  DEBUG: Subscription '{subscription.module.name}': expiration_date={expiration_date}, today={today}, is_not_expired={is_not_expired}")
-                if is_not_expired:
-                    has_valid_subscription = True
-                    print(f"  DEBUG: Found valid subscription: {subscription.module.name}")
-                    break
-            
-            # 如果没有有效订阅，返回 True（已过期）
-            result = not has_valid_subscription
-            print(f"  DEBUG: Final result - Subscription Expired: {result}")
-            return result
-            
-        except Exception as e:
-            # 如果出现任何错误（如用户没有 UserProfile），默认允许访问
-            # 在生产环境中，你可能想要记录这个错误
-            print(f"  DEBUG: Exception occurred: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"  DEBUG: Traceback:\n{traceback.format_exc()}")
-            return False
+        return suspended
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    同时支持 WSGI 和 ASGI 的 WhiteNoise
+    WhiteNoiseMiddleware 只支持同步，ASGI 下 Django 会把它之后的整条中间件链和异步视图
+    都包进 async_to_sync / sync_to_async，异步上报接口和 SSE 长连接因此占着线程。
+    这里非静态文件请求直接 await 下一层；静态文件的查找和打开文件放到线程里执行。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # 每次请求都要查文件系统（DEBUG 下默认开启）
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_module_subscription"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeviceCredential",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("camera_id", models.CharField(max_length=50)),
+                ("key_prefix", models.CharField(editable=False, max_length=8)),
+                (
+                    "key_hash",
+                    models.CharField(editable=False, max_length=64, unique=True),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="device_credentials",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Device Credential",
+                "verbose_name_plural": "Device Credentials",
+                "unique_together": {("customer", "camera_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_devicecredential"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="retention_days",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_customer_retention_days"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeneratedReport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("daily", "Daily"),
+                            ("weekly", "Weekly"),
+                            ("monthly", "Monthly"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("data_version", models.BigIntegerField()),
+                ("stats_hash", models.CharField(max_length=40)),
+                ("content", models.TextField()),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("llm", "LLM"), ("template", "Template")],
+                        max_length=10,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="generated_reports",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Generated Report",
+                "verbose_name_plural": "Generated Reports",
+                "unique_together": {("customer", "period", "date")},
+            },
+        ),
+    ]
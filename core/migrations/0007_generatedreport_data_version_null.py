@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_generated_report"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="generatedreport",
+            name="data_version",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
+import hashlib
+import secrets
 
 # 这就是我们的“租户”模型
 class Customer(models.Model):
@@ -16,9 +18,20 @@ class Customer(models.Model):
     # 创建时间
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 检测事件保留天数 (超过的由 archive_events 命令归档；留空则使用 EVENT_RETENTION_DAYS 配置)
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+
     def __str__(self):
         return f"{self.name} ({str(self.license_key)[:8]}...)"
 
+    @property
+    def effective_retention_days(self):
+        """实际生效的保留天数，None 表示永久保留"""
+        from django.conf import settings
+        if self.retention_days is not None:
+            return self.retention_days
+        return getattr(settings, 'EVENT_RETENTION_DAYS', None)
+
 
 # 用户档案模型 - 建立 User 和 Customer 的强关联
 class UserProfile(models.Model):
@@ -100,4 +113,110 @@ class Subscription(models.Model):
     def is_valid(self):
         """检查订阅是否有效（激活且未过期）"""
         from django.utils import timezone
-        return self.is_active and self.expiration_date > timezone.now()
\ No newline at end of file
+        return self.is_active and self.expiration_date > timezone.now()
+
+# 摄像头设备凭证 - 每台摄像头一把 API Key（替代共用 admin 账号的 Basic Auth）
+class DeviceCredential(models.Model):
+    # 关联客户（设备请求直接解析到 Customer，不再经过 user.userprofile.customer）
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='device_credentials'
+    )
+
+    # 摄像头编号 (例如 "CAM-01")
+    camera_id = models.CharField(max_length=50)
+
+    # Key 的明文前缀，仅用于后台辨认是哪一把 Key
+    key_prefix = models.CharField(max_length=8, editable=False)
+
+    # Key 的 SHA-256 摘要（数据库不保存明文 Key）
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+
+    # 是否启用 (摄像头丢失/报废时取消勾选即可吊销)
+    is_active = models.BooleanField(default=True)
+
+    # 创建时间
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # 同一个客户的同一台摄像头只有一把有效 Key，重新签发即轮换
+        unique_together = ['customer', 'camera_id']
+        verbose_name = 'Device Credential'
+        verbose_name_plural = 'Device Credentials'
+
+    def __str__(self):
+        return f"{self.customer.name} - {self.camera_id} ({self.key_prefix}...)"
+
+    @staticmethod
+    def hash_key(raw_key):
+        """
+        计算 Key 的摘要。
+        Key 本身是 256 bit 随机数，不需要 PBKDF2 这类慢哈希，SHA-256 即可。
+        """
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def issue(cls, customer, camera_id):
+        """
+        为摄像头签发（或轮换）一把 Key。
+        Key 格式: <customer.license_key 的 hex>.<随机串>，明文只在此处返回一次。
+
+        Returns:
+            tuple: (DeviceCredential, raw_key)
+        """
+        secret = secrets.token_urlsafe(32)
+        raw_key = f"{customer.license_key.hex}.{secret}"
+        credential, _ = cls.objects.update_or_create(
+            customer=customer,
+            camera_id=camera_id,
+            defaults={
+                'key_prefix': secret[:8],
+                'key_hash': cls.hash_key(raw_key),
+                'is_active': True,
+            }
+        )
+        return credential, raw_key
+
+
+# 已生成的安全报告 - 数据没变时直接返回，不再重新聚合、调用 LLM（见 core/utils/report_generator.py）
+class GeneratedReport(models.Model):
+    PERIOD_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    SOURCE_CHOICES = [
+        ('llm', 'LLM'),
+        ('template', 'Template'),
+    ]
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='generated_reports'
+    )
+
+    # 报告周期，以及周期的第一天（日报即当天）
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    date = models.DateField()
+
+    # 生成时客户的数据版本号（ppe/caching.py），版本号没变说明数据没变；未启用版本号时为空
+    data_version = models.BigIntegerField(null=True, blank=True)
+
+    # 报告输入（统计结果）的摘要；版本号变了但统计结果相同（例如只有其它日期的新事件）时仍可复用
+    stats_hash = models.CharField(max_length=40)
+
+    # 报告内容 (Markdown) 及来源
+    content = models.TextField()
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['customer', 'period', 'date']
+        verbose_name = 'Generated Report'
+        verbose_name_plural = 'Generated Reports'
+
+    def __str__(self):
+        return f"{self.customer.name} - {self.period} {self.date}"
@@ -0,0 +1,171 @@
+"""
+请求性能分析（默认关闭，设置 REQUEST_PROFILING=1 打开）
+- 每个请求记录耗时、SQL 条数、SQL 总耗时（connection.execute_wrapper，不依赖 DEBUG）
+- 同一条 SQL（参数化后的语句）在一个请求里执行 REQUEST_PROFILING_N_PLUS_ONE 次及以上，视为疑似 N+1，记一条 WARNING
+- 按接口（URL 路由 + 方法）保留最近 REQUEST_PROFILING_WINDOW 个请求，统计 p50 / p95 等，在后台 /admin/profiling/ 查看
+关闭时 __init__ 抛 MiddlewareNotUsed，Django 直接把中间件移出调用链，没有任何开销。
+统计保存在进程内，多进程部署时每个 worker 各自统计。
+"""
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """execute_wrapper：记录一个请求内执行的 SQL 条数、耗时、重复次数"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """执行次数 >= threshold 的语句 [(sql, 次数), ...]，次数多的在前"""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class EndpointStats:
+    """每个接口最近 window 个请求的样本（进程内，线程安全）"""
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = {}
+        self._repeated = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, wall, queries, db_time, repeated):
+        with self._lock:
+            samples = self._samples.setdefault(endpoint, deque(maxlen=self.window))
+            samples.append((wall, queries, db_time, bool(repeated)))
+            if repeated:
+                counter = self._repeated.setdefault(endpoint, Counter())
+                for sql, n in repeated:
+                    counter[sql] = max(counter[sql], n)
+
+    def snapshot(self):
+        """[{endpoint, requests, wall_ms: {avg, p50, p95, max}, queries: {...}, db_ms_avg, n_plus_one: {...}}]"""
+        with self._lock:
+            items = [(endpoint, list(samples)) for endpoint, samples in self._samples.items()]
+            repeated = {endpoint: counter.most_common(5) for endpoint, counter in self._repeated.items()}
+
+        result = []
+        for endpoint, samples in items:
+            walls = sorted(s[0] * 1000 for s in samples)
+            queries = sorted(s[1] for s in samples)
+            result.append({
+                'endpoint': endpoint,
+                'requests': len(samples),
+                'wall_ms': {
+                    'avg': round(sum(walls) / len(walls), 2),
+                    'p50': round(_percentile(walls, 50), 2),
+                    'p95': round(_percentile(walls, 95), 2),
+                    'max': round(walls[-1], 2),
+                },
+                'queries': {
+                    'avg': round(sum(queries) / len(queries), 2),
+                    'p95': _percentile(queries, 95),
+                    'max': queries[-1],
+                },
+                'db_ms_avg': round(sum(s[2] for s in samples) * 1000 / len(samples), 2),
+                'n_plus_one': {
+                    'requests': sum(1 for s in samples if s[3]),
+                    'statements': [{'sql': sql, 'max_repeats': n} for sql, n in repeated.get(endpoint, [])],
+                },
+            })
+        return sorted(result, key=lambda r: -r['wall_ms']['p95'])
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._repeated.clear()
+
+
+endpoint_stats = EndpointStats(getattr(settings, 'REQUEST_PROFILING_WINDOW', 200))
+
+
+def endpoint_name(request):
+    """接口名：URL 路由模板 + 方法（例如 "GET api/v1/ppe/events/"），未匹配到路由时用路径"""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else request.path
+    return f"{request.method} {route}"
+
+
+class ProfilingMiddleware:
+    """
+    放在 MIDDLEWARE 靠前的位置，session / 认证 / 订阅检查的查询也会算进去
+    同时支持 WSGI 和 ASGI：数据库连接按线程区分，异步请求的查询都在 sync_to_async
+    （thread_sensitive）的同一个线程里执行，execute_wrapper 也在那个线程里挂上和卸下
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'REQUEST_PROFILING_N_PLUS_ONE', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self._recording(recorder):
+            response = self.get_response(request)
+        self._record(request, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        recording = await sync_to_async(self._recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        self._record(request, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _recording(recorder):
+        """在所有连接上挂上 recorder，返回的 ExitStack 关闭时卸下"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def _record(self, request, recorder, wall):
+        endpoint = endpoint_name(request)
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            logger.warning(
+                "Possible N+1 queries",
+                extra={'endpoint': endpoint, 'statements': [{'sql': sql, 'repeats': n} for sql, n in repeated]},
+            )
+        endpoint_stats.record(endpoint, wall, recorder.count, recorder.duration, repeated)
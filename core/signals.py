@@ -0,0 +1,59 @@
+"""
+core 应用的信号处理
+"""
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import db_metrics, entitlements
+from .models import Customer, DeviceCredential, Module, Subscription, UserProfile
+from .authentication import device_key_cache
+
+
+@receiver([post_save, post_delete], sender=DeviceCredential)
+def invalidate_device_credential(sender, instance, **kwargs):
+    """设备 Key 签发/轮换/吊销后，立即失效本进程的缓存"""
+    device_key_cache.invalidate(key_hash=instance.key_hash, customer_id=instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_customer_devices(sender, instance, **kwargs):
+    """客户停用后，该客户的所有设备 Key 立即失效"""
+    device_key_cache.invalidate(customer_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_customer_entitlements(sender, instance, **kwargs):
+    """客户启用 / 停用后，授权状态立即生效"""
+    entitlements.invalidate_customer(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_subscription_entitlements(sender, instance, **kwargs):
+    """订阅新增 / 续期 / 停用 / 删除后，授权状态立即生效"""
+    entitlements.invalidate_customer(instance.customer_id)
+
+
+@receiver(post_save, sender=Module)
+def invalidate_module_entitlements(sender, instance, created, **kwargs):
+    """模块 slug 修改后，订阅了它的客户重新加载（删除模块时级联删除订阅，由上面的信号处理）"""
+    if not created:
+        entitlements.invalidate_module(instance)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_user_customer(sender, instance, **kwargs):
+    """用户换到其它客户 / 删除档案后，重新查找所属客户"""
+    entitlements.invalidate_user(instance.user_id)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    """数据库新建连接（一次握手）计数，见 core/db_metrics.py"""
+    db_metrics.record_connection(connection.alias)
+
+
+@receiver(request_finished)
+def count_request(sender, **kwargs):
+    db_metrics.record_request()
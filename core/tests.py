@@ -1,3 +1,388 @@
-from django.test import TestCase
+import io
+import json
+import logging
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import db_metrics, db_router
+from .authentication import DeviceKeyCache, DeviceWriteOnly, device_key_cache
+from .entitlements import get_user_entitlements
+from .profiling import QueryRecorder, endpoint_stats
+from .logging_utils import JsonFormatter, QueueStreamHandler, SamplingFilter
+from .models import Customer, DeviceCredential, UserProfile, Module, Subscription
+
+
+class EntitlementCacheTests(TestCase):
+    """订阅检查：一条查询算出授权状态并缓存，Subscription / Customer 变更后立即生效"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Entitled Co')
+        self.ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        self.llm = Module.objects.create(name='AI Reporting', slug='ppe_llm')
+        self.subscription = Subscription.objects.create(
+            customer=self.customer, module=self.ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        Subscription.objects.create(
+            customer=self.customer, module=self.llm, expiration_date=timezone.now() - timedelta(days=3)
+        )
+        self.user = User.objects.create_user('supervisor', password='pass-1234')
+        UserProfile.objects.create(user=self.user, customer=self.customer)
+        self.client.force_login(self.user)
+
+    def test_entitlements_loaded_in_one_query_then_cached(self):
+        with self.assertNumQueries(2):  # UserProfile -> customer_id，授权状态
+            entitlements = get_user_entitlements(self.user)
+        self.assertEqual(entitlements.active_modules(), ['ppe'])
+        self.assertFalse(entitlements.has_module('ppe_llm'))
+        self.assertFalse(entitlements.is_suspended())
+
+        with self.assertNumQueries(0):
+            get_user_entitlements(self.user)
+
+    def test_middleware_uses_cache_on_hot_path(self):
+        self.client.get('/api/v1/violations/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/violations/')
+        self.assertEqual(response.status_code, 200)
+        subscription_table = connection.ops.quote_name(Subscription._meta.db_table)
+        self.assertFalse([q for q in ctx.captured_queries if subscription_table in q['sql']])
+
+    def test_signals_invalidate_cache(self):
+        self.assertEqual(self.client.get('/api/v1/violations/').status_code, 200)
+
+        self.subscription.is_active = False
+        self.subscription.save()
+        self.assertRedirects(
+            self.client.get('/api/v1/violations/'), '/service-suspended/', fetch_redirect_response=False
+        )
+
+        self.subscription.is_active = True
+        self.subscription.save()
+        self.assertEqual(self.client.get('/api/v1/violations/').status_code, 200)
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertRedirects(
+            self.client.get('/api/v1/violations/'), '/service-suspended/', fetch_redirect_response=False
+        )
+
+
+class DeviceKeyTests(TestCase):
+    """设备 Key：签发 / 轮换、校验、进程内缓存的过期与失效、只允许写"""
+
+    def setUp(self):
+        device_key_cache.invalidate()
+        self.customer = Customer.objects.create(name='Device Co')
+        self.credential, self.raw_key = DeviceCredential.issue(self.customer, 'CAM-01')
+
+    def test_issue_stores_only_the_hash_and_rotates(self):
+        license_hex, _, secret = self.raw_key.partition('.')
+        self.assertEqual(license_hex, self.customer.license_key.hex)
+        self.assertEqual(self.credential.key_prefix, secret[:8])
+        self.assertEqual(self.credential.key_hash, DeviceCredential.hash_key(self.raw_key))
+        self.assertNotIn(secret, self.credential.key_hash)
+
+        rotated, new_key = DeviceCredential.issue(self.customer, 'CAM-01')
+        self.assertEqual(rotated.pk, self.credential.pk)
+        self.assertNotEqual(new_key, self.raw_key)
+        self.assertIsNone(device_key_cache.resolve(self.raw_key))
+        self.assertEqual(device_key_cache.resolve(new_key).pk, self.credential.pk)
+
+    def test_resolve_rejects_invalid_keys(self):
+        keys = DeviceKeyCache()
+        self.assertEqual(keys.resolve(self.raw_key), self.credential)
+        self.assertIsNone(keys.resolve(self.raw_key + 'x'))
+        self.assertIsNone(keys.resolve(self.raw_key.partition('.')[0]))
+
+        # 哈希对得上但前半段不是所属客户的 License Key
+        other = Customer.objects.create(name='Other Co')
+        forged = f"{other.license_key.hex}.{self.raw_key.partition('.')[2]}"
+        DeviceCredential.objects.filter(pk=self.credential.pk).update(key_hash=DeviceCredential.hash_key(forged))
+        self.assertIsNone(DeviceKeyCache().resolve(forged))
+
+        DeviceCredential.objects.filter(pk=self.credential.pk).update(
+            key_hash=self.credential.key_hash, is_active=False
+        )
+        self.assertIsNone(DeviceKeyCache().resolve(self.raw_key))
+
+        DeviceCredential.objects.filter(pk=self.credential.pk).update(is_active=True)
+        Customer.objects.filter(pk=self.customer.pk).update(is_active=False)
+        self.assertIsNone(DeviceKeyCache().resolve(self.raw_key))
+
+    @override_settings(DEVICE_KEY_CACHE_TTL=60)
+    def test_results_are_cached_until_ttl(self):
+        keys = DeviceKeyCache()
+        with mock.patch('core.authentication.time') as clock:
+            clock.monotonic.return_value = 1000
+            with self.assertNumQueries(2):
+                keys.resolve(self.raw_key)
+                keys.resolve('bad.key')
+            with self.assertNumQueries(0):
+                self.assertEqual(keys.resolve(self.raw_key), self.credential)
+                self.assertIsNone(keys.resolve('bad.key'))
+                self.assertEqual(async_to_sync(keys.aresolve)(self.raw_key), self.credential)
+
+            clock.monotonic.return_value = 1061
+            with self.assertNumQueries(2):
+                keys.resolve(self.raw_key)
+                keys.resolve('bad.key')
+
+    @override_settings(DEVICE_KEY_CACHE_MAX_MISSES=3)
+    def test_invalid_keys_are_bounded(self):
+        keys = DeviceKeyCache()
+        keys.resolve(self.raw_key)
+        for i in range(5):
+            keys.resolve(f"bad.key-{i}")
+        self.assertEqual(len(keys._misses), 3)
+        self.assertEqual(len(keys._entries), 1)
+        with self.assertNumQueries(0):
+            keys.resolve('bad.key-4')
+            keys.resolve(self.raw_key)
+        # 最早写入的被淘汰
+        with self.assertNumQueries(1):
+            keys.resolve('bad.key-0')
+
+    def test_signals_invalidate_cache(self):
+        self.assertIsNotNone(device_key_cache.resolve(self.raw_key))
+        self.credential.is_active = False
+        self.credential.save()
+        self.assertIsNone(device_key_cache.resolve(self.raw_key))
+
+        # 重新启用：之前缓存的无效结果也失效
+        self.credential.is_active = True
+        self.credential.save()
+        self.assertIsNotNone(device_key_cache.resolve(self.raw_key))
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertIsNone(device_key_cache.resolve(self.raw_key))
+        self.customer.is_active = True
+        self.customer.save()
+        self.assertIsNotNone(device_key_cache.resolve(self.raw_key))
+
+        self.credential.delete()
+        self.assertIsNone(device_key_cache.resolve(self.raw_key))
+
+    def test_device_keys_are_forbidden_on_user_only_endpoints(self):
+        headers = {'Authorization': f'Device {self.raw_key}'}
+        for path in ('/api/v1/profile/', '/api/v1/ppe/dashboard/', '/api/v1/ppe/dashboard/cache-stats/'):
+            self.assertEqual(self.client.get(path, headers=headers).status_code, 403, path)
+        response = self.client.post(
+            '/api/v1/ppe/events/bulk-resolve/', {'camera_id': 'CAM-01'},
+            content_type='application/json', headers={'X-Device-Key': self.raw_key},
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_device_keys_can_write_but_not_read(self):
+        headers = {'Authorization': f'Device {self.raw_key}'}
+        self.assertEqual(self.client.get('/api/v1/ppe/events/', headers=headers).status_code, 403)
+        # 通过权限检查，因为缺少图片返回 400
+        response = self.client.post('/api/v1/ppe/events/', {}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+        self.assertEqual(
+            self.client.get('/api/v1/ppe/events/', headers={'X-Device-Key': self.raw_key + 'x'}).status_code, 401
+        )
+
+        permission = DeviceWriteOnly()
+        user_request = RequestFactory().get('/')
+        user_request.auth = None
+        self.assertTrue(permission.has_permission(user_request, None))
+
+
+class RequestTenantTests(TestCase):
+    """request.tenant：中间件、上下文处理器、check_module_permission、API 视图共用一次加载"""
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(name='Tenant Co')
+        for slug in ('ppe', 'ppe_llm'):
+            Subscription.objects.create(
+                customer=customer,
+                module=Module.objects.create(name=slug, slug=slug),
+                expiration_date=timezone.now() + timedelta(days=30),
+            )
+        user = User.objects.create_user('supervisor', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=customer)
+        self.client.force_login(user)
+
+    def test_dashboard_page_query_count(self):
+        # 冷缓存：session、user、UserProfile、客户 + 订阅各一条
+        with self.assertNumQueries(4):
+            response = self.client.get('/')
+        self.assertTrue(response.context['has_llm_permission'])
+        self.assertFalse(response.context['has_drone_permission'])
+        self.assertEqual(response.context['subscribed_modules'], ['ppe', 'ppe_llm'])
+
+        # 热缓存：只剩 session 和 user
+        with self.assertNumQueries(2):
+            self.client.get('/')
+
+    def test_api_view_reuses_tenant(self):
+        self.client.get('/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        for model in (Customer, UserProfile, Subscription):
+            table = connection.ops.quote_name(model._meta.db_table)
+            self.assertFalse([q for q in ctx.captured_queries if f'FROM {table}' in q['sql']])
+
+
+class StructuredLoggingTests(TestCase):
+    """JSON 日志：extra 字段原样输出，热点 logger 按比例抽样，WARNING 不抽样"""
+
+    def test_queue_handler_writes_json_and_samples(self):
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(SamplingFilter({'hot.path': 0.0}))
+        logger = logging.getLogger('structured-logging-test')
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("Queue full for %s", 'CAM-01', extra={'event_id': 7})
+            for name, level, msg in [('hot.path.child', logging.INFO, 'sampled away'), ('hot.path', logging.ERROR, 'kept')]:
+                handler.handle(logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level), 'msg': msg}))
+            handler.flush()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['message'] for r in records], ['Queue full for CAM-01', 'kept'])
+        self.assertEqual(records[0]['event_id'], 7)
+        self.assertEqual(records[0]['level'], 'WARNING')
+
+
+@override_settings(REQUEST_PROFILING=True)
+class ProfilingTests(TestCase):
+    """请求性能分析：按接口汇总耗时和 SQL 条数，重复 SQL 标记为疑似 N+1"""
+
+    def setUp(self):
+        cache.clear()
+        endpoint_stats.reset()
+        self.customer = Customer.objects.create(name='Profiled Co')
+        Subscription.objects.create(
+            customer=self.customer,
+            module=Module.objects.create(name='PPE Detection', slug='ppe'),
+            expiration_date=timezone.now() + timedelta(days=30),
+        )
+        staff = User.objects.create_user('ops', password='pass-1234', is_staff=True)
+        UserProfile.objects.create(user=staff, customer=self.customer)
+        self.client.force_login(staff)
+
+    def test_recorder_flags_repeated_statements(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for _ in range(6):
+                Customer.objects.filter(pk=self.customer.pk).exists()
+            UserProfile.objects.count()
+        self.assertEqual(recorder.count, 7)
+        [(sql, repeats)] = recorder.repeated(5)
+        self.assertEqual(repeats, 6)
+        self.assertIn(Customer._meta.db_table, sql)
+
+    def test_stats_page_and_json_export(self):
+        self.client.get('/api/v1/violations/')
+        data = self.client.get('/admin/profiling/?format=json').json()
+        self.assertTrue(data['enabled'])
+        [row] = [r for r in data['endpoints'] if r['endpoint'] == 'GET api/v1/violations/']
+        self.assertEqual(row['requests'], 1)
+        self.assertGreater(row['queries']['max'], 0)
+
+        self.assertContains(self.client.get('/admin/profiling/'), 'api/v1/violations/')
+        self.client.post('/admin/profiling/')
+        self.assertEqual(
+            [r['endpoint'] for r in self.client.get('/admin/profiling/?format=json').json()['endpoints']],
+            ['POST admin/profiling/'],
+        )
+
+    async def test_async_requests_are_profiled(self):
+        self.async_client.cookies = self.client.cookies
+        await self.async_client.get('/api/v1/violations/')
+        [row] = [r for r in endpoint_stats.snapshot() if r['endpoint'] == 'GET api/v1/violations/']
+        self.assertGreater(row['queries']['max'], 0)
+
+
+class DbMetricsTests(TestCase):
+    """数据库连接指标：新建连接数、请求数（进程内）"""
+
+    def setUp(self):
+        db_metrics.reset()
+        staff = User.objects.create_user('dba', password='pass-1234', is_staff=True)
+        self.client.force_login(staff)
+
+    def test_counts_connections_and_requests(self):
+        connection_created.send(sender=connection.__class__, connection=connection)
+        self.client.get('/admin/db-stats/')
+        data = self.client.get('/admin/db-stats/').json()
+        self.assertEqual(data['requests'], 1)
+        default = data['databases']['default']
+        self.assertEqual(default['connections_opened'], 1)
+        self.assertEqual(default['vendor'], connection.vendor)
+        self.assertIsNone(default['pool'])
+
+        self.client.post('/admin/db-stats/')
+        self.assertEqual(db_metrics.snapshot()['databases']['default']['connections_opened'], 0)
+
+
+@override_settings(DATABASE_REPLICA_ALIAS='replica', REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    """只读副本路由：只有分析查询走副本；自己写过之后短时间内固定读主库"""
+
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+
+    def test_only_analytics_reads_use_replica(self):
+        self.assertIsNone(self.router.db_for_read(Customer))
+        with db_router.analytics_reads():
+            self.assertEqual(self.router.db_for_read(Customer), 'replica')
+            self.assertEqual(self.router.db_for_write(Customer), 'default')
+        self.assertIsNone(self.router.db_for_read(Customer))
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+
+    @override_settings(DATABASE_REPLICA_ALIAS=None)
+    def test_without_replica_everything_uses_default(self):
+        with db_router.analytics_reads():
+            self.assertIsNone(self.router.db_for_read(Customer))
+            self.assertEqual(db_router.analytics_db(), 'default')
+
+    def test_read_your_writes(self):
+        seen = []
+
+        def view(request):
+            with db_router.analytics_reads():
+                seen.append(self.router.db_for_read(Customer))
+            if request.method == 'POST':
+                self.router.db_for_write(Customer)
+            return HttpResponse()
+
+        middleware = db_router.ReplicaPinMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn(db_router.REPLICA_PIN_COOKIE, middleware(factory.get('/')).cookies)
+
+        response = middleware(factory.post('/'))
+        cookie = response.cookies[db_router.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        pinned = factory.get('/')
+        pinned.COOKIES[db_router.REPLICA_PIN_COOKIE] = cookie.value
+        middleware(pinned)
+        expired = factory.get('/')
+        expired.COOKIES[db_router.REPLICA_PIN_COOKIE] = '1'
+        middleware(expired)
+        self.assertEqual(seen, ['replica', 'replica', None, 'replica'])
@@ -2,9 +2,12 @@
 DJI 无人机控制服务
 用于触发无人机任务（Trespasser Alert）
 """
+import logging
+
 import requests
 import json
-import traceback
+
+logger = logging.getLogger(__name__)
 
 # ================= 配置区域 =================
 DJI_API_URL = "https://es-flight-api-us.djigate.com/openapi/v0.1/workflow"
@@ -39,9 +42,9 @@ def trigger_mission():
         }
     }
     try:
-        print(f"\n🚀 [DroneService] Calling DJI API...")
+        logger.info("Calling DJI API")
         response = requests.post(DJI_API_URL, headers=headers, json=payload_data, timeout=10)
-        print(f"⬅️ Status: {response.status_code}")
+        logger.info("DJI API responded", extra={'status': response.status_code})
         
         if response.status_code == 200:
             data = response.json()
@@ -52,5 +55,5 @@ def trigger_mission():
         else:
             return {"status": "error", "msg": f"HTTP Error {response.status_code}"}
     except Exception as e:
-        print(f"[DroneService] Exception: {traceback.format_exc()}")
+        logger.exception("DJI API call failed")
         return {"status": "error", "msg": str(e)}
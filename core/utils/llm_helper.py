@@ -2,10 +2,14 @@
 LLM 辅助工具
 用于生成简短的安全建议（实时报警场景）
 """
+import logging
+
 import requests
 import json
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 def get_safety_advice(violation_type, camera_name):
     """
@@ -58,11 +62,11 @@ def get_safety_advice(violation_type, camera_name):
                 if content:
                     return content
     except requests.exceptions.Timeout:
-        print(f"⚠️ AI Advice Failed: Timeout (10s exceeded)")
+        logger.warning("AI advice failed: timeout (10s exceeded)")
     except requests.exceptions.RequestException as e:
-        print(f"⚠️ AI Advice Failed: {e}")
+        logger.warning("AI advice failed: %s", e)
     except Exception as e:
-        print(f"⚠️ AI Advice Failed: {e}")
+        logger.warning("AI advice failed: %s", e)
     
     # 默认建议
     return "Please verify safety compliance immediately."
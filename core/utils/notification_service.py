@@ -2,15 +2,30 @@
 通知服务层 - 处理实时报警（WhatsApp、Email、SMS 等）
 目前为模拟实现，预留真实 API 接入位置
 """
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # 强制读取 .env 文件（无论在哪里运行都能读到）
 load_dotenv()
 
 from django.conf import settings
+from django.db import close_old_connections
 from core.utils.llm_helper import get_safety_advice
 from core.utils.whatsapp_sender import send_real_whatsapp
+from ppe.violations import extract_violation_items, violation_label
+
+logger = logging.getLogger(__name__)
+
+# 报警发送线程池（LLM 建议 + WhatsApp 调用都很慢，不能占用请求线程）
+_alert_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'NOTIFICATION_WORKERS', 4),
+    thread_name_prefix='notifications',
+)
+# 排队上限，防止外部 API 卡死时任务无限堆积
+_alert_slots = threading.BoundedSemaphore(getattr(settings, 'NOTIFICATION_MAX_PENDING', 500))
 
 
 class NotificationService:
@@ -29,27 +44,43 @@ class NotificationService:
         if not isinstance(detections, dict):
             return "Unknown violation"
         
-        # 尝试从 items 数组中提取
-        items = detections.get("items", [])
-        if items and isinstance(items, list):
-            violation_types = []
-            for item in items:
-                if isinstance(item, dict):
-                    v_type = item.get("class") or item.get("violation")
-                    if v_type:
-                        # 转换为可读格式：no_helmet -> No Helmet
-                        readable = str(v_type).replace("_", " ").title()
-                        violation_types.append(readable)
-            if violation_types:
-                return ", ".join(violation_types)
-        
-        # 尝试直接获取 violation 或 class
-        violation = detections.get("violation") or detections.get("class")
-        if violation:
-            return str(violation).replace("_", " ").title()
+        # 统一由 ppe.violations 解析（items 数组 / violation / class 三种格式）
+        # 有 items 时只看 items，顶层的 violation / class 不再作为后备
+        # 转换为可读格式：no_helmet -> No Helmet
+        violation_types = [
+            violation_label(item['violation_class'])
+            for item in extract_violation_items(detections)
+        ]
+        if violation_types:
+            return ", ".join(violation_types)
         
         return "Safety violation detected"
     
+    @staticmethod
+    def enqueue_whatsapp_alert(event):
+        """
+        把报警放进后台线程池发送，立即返回（不阻塞请求 / 事件循环）
+
+        Returns:
+            bool: 是否成功入队；队列已满时丢弃并返回 False
+        """
+        if not _alert_slots.acquire(blocking=False):
+            logger.warning("Alert queue full, dropped alert", extra={'event_id': event.id})
+            return False
+        _alert_executor.submit(NotificationService._send_in_background, event)
+        return True
+
+    @staticmethod
+    def _send_in_background(event):
+        close_old_connections()
+        try:
+            NotificationService.send_whatsapp_alert(event)
+        except Exception:
+            logger.exception("Failed to send alert", extra={'event_id': event.id})
+        finally:
+            close_old_connections()
+            _alert_slots.release()
+
     @staticmethod
     def send_whatsapp_alert(event):
         """
@@ -58,7 +89,7 @@ class NotificationService:
         Args:
             event: DetectionEvent 对象
         
-        目前为模拟实现，打印到控制台
+        目前为模拟实现，写到日志
         未来可替换为 Twilio / WhatsApp Business API
         """
         # 提取违规详情
@@ -68,7 +99,7 @@ class NotificationService:
         try:
             advice = get_safety_advice(violation_details, event.camera_id)
         except Exception as e:
-            print(f"[Notification] Failed to get AI advice: {e}")
+            logger.warning("Failed to get AI advice: %s", e, extra={'event_id': event.id})
             advice = "Please verify safety compliance immediately."
         
         # 格式化时间
@@ -83,17 +114,17 @@ Customer: {event.customer.name}
 AI Advice: {advice}"""
         
         # ========== 模拟发送（当前实现）==========
-        log_message = f"[WhatsApp] Sending to Manager: SECURITY ALERT! Type: {violation_details}"
-        # 如果识别到员工身份，添加到日志中
-        if hasattr(event, 'person_name') and event.person_name and event.person_name != "Unknown":
-            log_message += f". Employee: {event.person_name}"
-            if hasattr(event, 'person_id') and event.person_id and event.person_id != "N/A":
-                log_message += f" (ID: {event.person_id})"
-        log_message += f". AI Advice: {advice}"
-        print(log_message)
-        print(f"[WhatsApp] Image URL: {event.image.url if event.image else 'N/A'}")
-        print(f"[WhatsApp] Event ID: {event.id}")
-        print("-" * 60)
+        logger.info(
+            "Sending alert to manager: %s", violation_details,
+            extra={
+                'event_id': event.id,
+                'camera_id': event.camera_id,
+                'person_name': getattr(event, 'person_name', None),
+                'person_id': getattr(event, 'person_id', None),
+                'advice': advice,
+                'image_url': event.image.url if event.image else None,
+            },
+        )
         
         # ========== 真实 WhatsApp 发送（CallMeBot API）==========
         # 构造简洁的报警消息（用于 WhatsApp 发送，纯文本格式，无 Emoji）
@@ -112,7 +143,7 @@ AI Advice: {advice}"""
             send_real_whatsapp(alert_message)
         except Exception as e:
             # 即使真实发送失败，也不影响事件保存
-            print(f"[Notification] Failed to send real WhatsApp: {e}")
+            logger.warning("Failed to send real WhatsApp: %s", e, extra={'event_id': event.id})
         
         # ========== Twilio WhatsApp Business API ==========
         try:
@@ -126,7 +157,11 @@ AI Advice: {advice}"""
             
             # 检查配置
             if not all([sid, token, from_number, to_number]):
-                print(f"[WARNING] Twilio config missing in .env. SID found: {bool(sid)}, Token found: {bool(token)}, From found: {bool(from_number)}, To found: {bool(to_number)}")
+                logger.warning(
+                    "Twilio config missing in .env",
+                    extra={'sid_found': bool(sid), 'token_found': bool(token),
+                           'from_found': bool(from_number), 'to_found': bool(to_number)},
+                )
                 return True
             
             client = Client(sid, token)
@@ -153,7 +188,7 @@ AI Advice: {advice}"""
                 # 拼接完整图片链接
                 full_image_url = f"{base_url}{image_url}"
                 media_urls = [full_image_url]
-                print(f"[INFO] Image Link: {full_image_url}")
+                logger.debug("Twilio image link: %s", full_image_url, extra={'event_id': event.id})
             
             # 4. 发送消息（带图片，如果有）
             message_params = {
@@ -167,13 +202,13 @@ AI Advice: {advice}"""
                 message_params['media_url'] = media_urls
             
             message = client.messages.create(**message_params)
-            print(f"[SUCCESS] WhatsApp Sent via Twilio! SID: {message.sid}")
+            logger.info("WhatsApp sent via Twilio", extra={'event_id': event.id, 'sid': message.sid})
             
         except ImportError:
-            print("[WARNING] Twilio library not installed. Install with: pip install twilio")
+            logger.warning("Twilio library not installed. Install with: pip install twilio")
         except Exception as e:
             # 错误日志也不能包含 Emoji
-            print(f"[ERROR] WhatsApp Error (Twilio): {e}")
+            logger.error("WhatsApp error (Twilio): %s", e, extra={'event_id': event.id})
         
         return True
     
@@ -1,81 +1,277 @@
 """
 LLM 智能报告生成器
-基于当日违规数据生成 Markdown 格式的安全报告（接入 OpenAI/DeepSeek API）
+基于违规数据生成 Markdown 格式的安全报告（接入 OpenAI/DeepSeek API），支持日报 / 周报 / 月报
+统计全部在数据库里聚合（ViolationItem 按类型、DetectionEvent 按摄像头），内存占用与时间范围无关
+生成结果保存在 GeneratedReport，数据没变时直接返回；pregenerate_reports 命令每天预先生成前一天的日报
 """
+import hashlib
 import json
+import logging
+import time
 import requests
 from collections import Counter
+from datetime import timedelta
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db.models import Count, Exists, OuterRef
 from django.utils import timezone
 
 # 使用 DetectionEvent（ppe 应用中的检测事件模型）
-from ppe.models import DetectionEvent
+from ppe.caching import get_data_version
+from ppe.models import DetectionEvent, ViolationItem, day_bounds
+from ppe.violations import normalize_violation_class, violation_label
+
+from core.models import GeneratedReport
+
+logger = logging.getLogger(__name__)
+
+# 报告周期: (标题, 摘要开头, 描述范围的短语)
+PERIODS = {
+    'daily': ('Daily', 'Today', 'today'),
+    'weekly': ('Weekly', 'This week', 'this week'),
+    'monthly': ('Monthly', 'This month', 'this month'),
+}
 
 
 def _normalize_violation_label(raw: str) -> str:
     """将 raw 违规类型转为可读标签，如 no_helmet -> No Helmet"""
     if not raw:
         return "Unknown"
-    s = str(raw).strip().lower().replace("_", " ").replace("-", " ")
-    return s.title() if s else "Unknown"
+    return violation_label(normalize_violation_class(raw))
 
 
-def _extract_violations_from_detections(detections) -> list[str]:
+def report_period(period, day):
     """
-    从 detections JSON 中提取违规类型列表。
-    支持格式: {'items': [{'class': '...'}, ...]} 或 {'violation': '...'} 或单条 {'class': '...'}
+    报告覆盖的日期 [first_day, last_day]（当前时区）
+    - daily: 当天；weekly: day 所在的周（周一到周日）；monthly: day 所在的自然月
     """
-    out = []
-    if not isinstance(detections, dict):
-        return out
-    items = detections.get("items")
-    if items and isinstance(items, list):
-        for it in items:
-            if isinstance(it, dict):
-                label = it.get("class") or it.get("violation")
-                if label:
-                    out.append(str(label).strip())
-    else:
-        label = detections.get("class") or detections.get("violation")
-        if label:
-            out.append(str(label).strip())
-    return out
+    if period == 'daily':
+        return day, day
+    if period == 'weekly':
+        first_day = day - timedelta(days=day.weekday())
+        return first_day, first_day + timedelta(days=6)
+    if period == 'monthly':
+        first_day = day.replace(day=1)
+        next_month = (first_day + timedelta(days=32)).replace(day=1)
+        return first_day, next_month - timedelta(days=1)
+    raise ValueError(f"Unknown report period: {period!r}")
 
 
-def generate_daily_report(customer):
+def aggregate_violations(customer, start, end):
     """
-    生成指定客户当日的安全报告（Markdown 文本）。
-    数据来源: DetectionEvent（当日、该客户）。
+    时间范围 [start, end) 内的违规统计，只返回聚合结果
+    Returns:
+        dict: {'total_violations', 'type_counts': [(label, count), ...] 数量多的在前, 'hotspot_camera'}
+    没有违规明细的事件按 1 次 "General" 违规计
     """
-    today = timezone.now().date()
-    events = DetectionEvent.objects.filter(
-        customer=customer,
-        timestamp__date=today,
-    ).order_by("-timestamp")
+    events = DetectionEvent.objects.for_customer(customer).between(start, end)
 
-    total_violations = 0
     type_counts: Counter = Counter()
-    camera_counts: Counter = Counter()
-
-    for ev in events:
-        camera_counts[ev.camera_id] += 1
-        violations = _extract_violations_from_detections(ev.detections)
-        if violations:
-            for v in violations:
-                type_counts[_normalize_violation_label(v)] += 1
-                total_violations += 1
-        else:
-            # 无具体类型时，按事件计为 1 次违规
-            type_counts["General"] += 1
-            total_violations += 1
+    rows = (
+        ViolationItem.objects.filter(customer=customer, timestamp__gte=start, timestamp__lt=end)
+        .values('violation_class')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('violation_class', 'count')
+    )
+    for violation_class, count in rows:
+        type_counts[_normalize_violation_label(violation_class)] += count
+
+    general = events.filter(~Exists(ViolationItem.objects.filter(event=OuterRef('pk')))).count()
+    if general:
+        type_counts["General"] += general
+
+    hotspot = (
+        events.values('camera_id')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'camera_id')
+        .values_list('camera_id', flat=True)
+        .first()
+    )
+
+    return {
+        'total_violations': sum(type_counts.values()),
+        'type_counts': sorted(type_counts.items(), key=lambda item: (-item[1], item[0])),
+        'hotspot_camera': hotspot or "",
+    }
+
+
+def generate_daily_report(customer, day=None, refresh=False):
+    """生成指定客户某天（默认当天）的安全报告（Markdown 文本）"""
+    return generate_report(customer, 'daily', day, refresh)
+
+
+def generate_report(customer, period='daily', day=None, refresh=False):
+    """
+    生成指定客户的安全报告（Markdown 文本），一次性返回全文。
+    period: daily / weekly / monthly，覆盖 day（默认当天）所在的日 / 周 / 月
+    缓存规则见 ReportJob；需要边生成边显示时用 ReportJob(...).stream()
+    """
+    return ReportJob(customer, period, day, refresh).render()
+
+
+class ReportJob:
+    """
+    一次报告生成（整篇返回 render() 或流式输出 stream()）
+    结果按 (客户, 周期, 日期) 保存在 GeneratedReport，数据没变时直接返回（refresh=True 强制重新生成）：
+    1. 客户的数据版本号与生成时相同（且是同一天生成的）-> 不查询、不调用 LLM（未启用版本号时跳过这一步）
+    2. 版本号变了但本期统计结果相同 -> 只做聚合查询，不调用 LLM
+    LLM 已配置但调用失败时，模板报告不保存，下次再试 LLM
+    构造时完成缓存检查和聚合查询，之后只访问 LLM，结束时保存一次
+    """
+
+    def __init__(self, customer, period='daily', day=None, refresh=False):
+        today = timezone.now().date()
+        day = day or today
+        self.customer = customer
+        self.period = period
+        self.first_day, _ = report_period(period, day)
+        # 已保存且仍然有效的报告内容
+        self.content = None
+
+        # 先取版本号再聚合：聚合期间有新数据时，保存的版本号偏旧，下次会重新检查
+        self.version = get_data_version(customer.pk)
+        cached = GeneratedReport.objects.filter(customer=customer, period=period, date=self.first_day).first()
+        if cached is not None and not refresh:
+            if (
+                self.version is not None and cached.data_version == self.version
+                and timezone.localdate(cached.updated_at) == today
+            ):
+                self.content = cached.content
+                return
+
+        self.inputs = _report_inputs(customer, period, day)
+        self.stats_hash = hashlib.sha1(json.dumps(self.inputs, sort_keys=True).encode()).hexdigest()
+        if cached is not None and not refresh and cached.stats_hash == self.stats_hash:
+            cached.data_version = self.version
+            cached.save(update_fields=['data_version', 'updated_at'])
+            self.content = cached.content
+
+    def render(self):
+        """整篇报告"""
+        if self.content is not None:
+            return self.content
+        llm_report = _generate_report_with_llm(**self._llm_fields())
+        # 如果 LLM 调用成功，返回 AI 生成的报告；否则使用模板报告
+        content = llm_report or _render_template(self.inputs)
+        if llm_report or not _llm_configured():
+            self._save(content, 'llm' if llm_report else 'template')
+        return content
+
+    def stream(self):
+        """
+        逐段输出报告（Markdown 片段），用于 StreamingHttpResponse
+        已保存的报告、未配置 LLM、LLM 不可达时一次输出整篇；记录首个 token 的延迟（ttft_ms）
+        """
+        if self.content is not None:
+            yield self.content
+            return
+        if not _llm_configured():
+            content = _render_template(self.inputs)
+            self._save(content, 'template')
+            yield content
+            return
+
+        started = time.perf_counter()
+        ttft_ms = None
+        chunks = []
+        try:
+            for token in _stream_report_with_llm(**self._llm_fields()):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000)
+                    logger.info("LLM report first token", extra={'customer_id': self.customer.pk, 'ttft_ms': ttft_ms})
+                chunks.append(token)
+                yield token
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+            if not chunks:
+                logger.warning("LLM unavailable, using template fallback: %s", e)
+                yield _render_template(self.inputs)
+            else:
+                logger.warning("LLM report stream interrupted: %s", e)
+                yield "\n\n---\n*Report generation was interrupted. Please try again.*"
+            return
+
+        if not chunks:
+            logger.warning("Empty response from LLM API, using template fallback")
+            yield _render_template(self.inputs)
+            return
+        logger.info(
+            "LLM report streamed",
+            extra={
+                'customer_id': self.customer.pk,
+                'ttft_ms': ttft_ms,
+                'total_ms': round((time.perf_counter() - started) * 1000),
+                'chars': sum(len(c) for c in chunks),
+            },
+        )
+        self._save(''.join(chunks).strip(), 'llm')
+
+    async def astream(self):
+        """
+        stream() 的异步版本（ASGI）：Django 会把同步迭代器整个读完再发送，
+        这里每次在线程里取一段（等 LLM、保存报告都在线程里），取到就发给浏览器
+        """
+        tokens = self.stream()
+        next_token = sync_to_async(next)
+        try:
+            while (token := await next_token(tokens, None)) is not None:
+                yield token
+        finally:
+            # 浏览器中途断开时关闭 LLM 的连接
+            await sync_to_async(tokens.close)()
+
+    def _llm_fields(self):
+        inputs = self.inputs
+        return {
+            'customer_name': inputs['customer_name'],
+            'date': inputs['date_label'],
+            'total_violations': inputs['total_violations'],
+            'compliance_desc': inputs['compliance_desc'],
+            'violations_detail': inputs['violations_detail'],
+            'hotspot_camera': inputs['hotspot_camera'],
+            'key_violations_md': inputs['key_violations_md'],
+            'hotspot_md': inputs['hotspot_md'],
+            'report_title': f"{inputs['title']} Safety Report",
+        }
+
+    def _save(self, content, source):
+        GeneratedReport.objects.update_or_create(
+            customer=self.customer,
+            period=self.period,
+            date=self.first_day,
+            defaults={
+                'data_version': self.version,
+                'stats_hash': self.stats_hash,
+                'content': content,
+                'source': source,
+            },
+        )
 
-    # 违规最多的摄像头
-    hotspot_camera = ""
-    if camera_counts:
-        hotspot_camera = camera_counts.most_common(1)[0][0]
 
-    # 合规程度描述（基于当日违规数简单分级）
+def _report_inputs(customer, period, day):
+    """
+    报告的全部输入（统计结果 + 拼好的文字片段）
+    数据来源: DetectionEvent + ViolationItem（数据库聚合）。
+    读主库：报告按当前数据版本号保存，副本有延迟时旧统计会被当成最新结果一直返回。
+    """
+    title, summary_lead, period_phrase = PERIODS[period]
+    first_day, last_day = report_period(period, day)
+    if period == 'daily' and day != timezone.now().date():
+        # 补生成的历史日报
+        period_phrase = f"{day:%Y-%m-%d}"
+        summary_lead = f"On {period_phrase}"
+    stats = aggregate_violations(customer, day_bounds(first_day)[0], day_bounds(last_day)[1])
+
+    total_violations = stats['total_violations']
+    sorted_types = stats['type_counts']
+    hotspot_camera = stats['hotspot_camera']
+    if first_day == last_day:
+        date_label = first_day.strftime('%Y-%m-%d')
+    else:
+        date_label = f"{first_day:%Y-%m-%d} ~ {last_day:%Y-%m-%d}"
+
+    # 合规程度描述（基于违规数简单分级）
     if total_violations == 0:
         compliance_desc = "Excellent"
     elif total_violations <= 3:
@@ -86,7 +282,6 @@ def generate_daily_report(customer):
         compliance_desc = "Low"
 
     # 按数量排序的违规类型
-    sorted_types = type_counts.most_common()
     key_violations_lines = []
     for label, cnt in sorted_types:
         emphasis = " (Critical!)" if cnt >= 3 else ""
@@ -97,45 +292,42 @@ def generate_daily_report(customer):
     hotspot_md = (
         f"Most violations occurred at **{hotspot_camera}**. Please inspect this area."
         if hotspot_camera
-        else "No camera hotspot data available for today."
+        else f"No camera hotspot data available for {period_phrase}."
     )
 
     if total_violations == 0:
-        summary = "Today, we detected **no violations**. The safety compliance level is **Excellent**."
+        summary = f"{summary_lead}, we detected **no violations**. The safety compliance level is **Excellent**."
     else:
-        summary = f"Today, we detected a total of **{total_violations}** violation(s). The safety compliance level is **{compliance_desc}**."
+        summary = f"{summary_lead}, we detected a total of **{total_violations}** violation(s). The safety compliance level is **{compliance_desc}**."
+
+    return {
+        'customer_name': customer.name,
+        'title': title,
+        'date_label': date_label,
+        'total_violations': total_violations,
+        'compliance_desc': compliance_desc,
+        # 数据摘要（用于 LLM Prompt）
+        'violations_detail': ", ".join([f"{label}: {cnt}" for label, cnt in sorted_types]) if sorted_types else "None",
+        'hotspot_camera': hotspot_camera,
+        'summary': summary,
+        'key_violations_md': key_violations_md,
+        'hotspot_md': hotspot_md,
+    }
 
-    # 构建数据摘要（用于 LLM Prompt）
-    violations_detail = ", ".join([f"{label}: {cnt}" for label, cnt in sorted_types]) if sorted_types else "None"
-    
-    # 尝试调用 LLM API 生成报告
-    llm_report = _generate_report_with_llm(
-        customer_name=customer.name,
-        date=today.strftime('%Y-%m-%d'),
-        total_violations=total_violations,
-        compliance_desc=compliance_desc,
-        violations_detail=violations_detail,
-        hotspot_camera=hotspot_camera,
-        key_violations_md=key_violations_md,
-        hotspot_md=hotspot_md,
-    )
-    
-    # 如果 LLM 调用成功，返回 AI 生成的报告；否则使用模板报告
-    if llm_report:
-        return llm_report
-    
-    # Fallback: 使用硬编码模板
-    report = f"""## 🛡️ Daily Safety Report - {customer.name}
-**Date**: {today.strftime('%Y-%m-%d')}
+
+def _render_template(inputs):
+    """Fallback: 使用硬编码模板"""
+    report = f"""## 🛡️ {inputs['title']} Safety Report - {inputs['customer_name']}
+**Date**: {inputs['date_label']}
 
 ### 📊 Summary
-{summary}
+{inputs['summary']}
 
 ### 🚫 Key Violations
-{key_violations_md}
+{inputs['key_violations_md']}
 
 ### 📍 Hotspots
-{hotspot_md}
+{inputs['hotspot_md']}
 
 ---
 *Generated by AI Enterprise OS*
@@ -143,25 +335,29 @@ def generate_daily_report(customer):
     return report.strip()
 
 
-def _generate_report_with_llm(customer_name, date, total_violations, compliance_desc, 
-                                violations_detail, hotspot_camera, key_violations_md, hotspot_md):
+def _llm_configured():
+    return bool(getattr(settings, 'LLM_API_KEY', None))
+
+
+def _llm_request(customer_name, date, total_violations, compliance_desc,
+                 violations_detail, hotspot_camera, key_violations_md, hotspot_md,
+                 report_title="Daily Safety Report", stream=False):
     """
-    调用 LLM API 生成报告
-    
+    构建 LLM API（OpenAI 兼容）请求
+
     Returns:
-        str: AI 生成的报告文本，如果失败则返回 None
+        tuple: (url, headers, payload)，没有配置 API Key 时返回 None
     """
     # 检查是否有 API Key
     api_key = getattr(settings, 'LLM_API_KEY', None)
     if not api_key or api_key == '':
-        print("[Report Generator] No LLM API key configured, using template fallback")
         return None
     
     api_base = getattr(settings, 'LLM_API_BASE', 'https://api.openai.com/v1')
     model = getattr(settings, 'LLM_MODEL', 'gpt-4o-mini')
     
     # 构建 Prompt (English)
-    prompt = f"""You are a professional Safety Officer at a factory. Analyze the following violation data and generate a concise Daily Safety Report in Markdown format.
+    prompt = f"""You are a professional Safety Officer at a factory. Analyze the following violation data and generate a concise {report_title} in Markdown format.
 
 **Data Summary:**
 - Customer Name: {customer_name}
@@ -195,7 +391,7 @@ Please generate the report:"""
         "messages": [
             {
                 "role": "system",
-                "content": "You are a professional Safety Officer at a factory. Analyze violation data and generate concise Daily Safety Reports in Markdown format. Use professional tone. English only."
+                "content": "You are a professional Safety Officer at a factory. Analyze violation data and generate concise Safety Reports in Markdown format. Use professional tone. English only."
             },
             {
                 "role": "user",
@@ -204,13 +400,36 @@ Please generate the report:"""
         ],
         "temperature": 0.7,
         "max_tokens": 1000,
-        "stream": False  # DeepSeek 支持流式，这里设为 False 获取完整响应
+        "stream": stream  # True 时按 SSE 逐段返回（DeepSeek / Ollama 都支持）
     }
+    return url, headers, payload
+
+
+def _llm_timeout():
+    # (连接超时, 读取超时)：服务不可达时几秒内失败，生成慢时每段输出之间最多等 LLM_READ_TIMEOUT 秒
+    return (
+        getattr(settings, 'LLM_CONNECT_TIMEOUT', 3),
+        getattr(settings, 'LLM_READ_TIMEOUT', 120),
+    )
+
+
+def _generate_report_with_llm(**fields):
+    """
+    调用 LLM API 生成报告（一次性返回全文，用于预生成等后台任务）
+    参数见 _llm_request
+
+    Returns:
+        str: AI 生成的报告文本，如果失败则返回 None
+    """
+    request = _llm_request(**fields)
+    if request is None:
+        logger.info("No LLM API key configured, using template fallback")
+        return None
+    url, headers, payload = request
     
     try:
-        print(f"[Report Generator] Calling LLM API: {url} (model: {model})")
-        # 120 秒超时：本地 Ollama 可能需要更长时间，给予 2 分钟等待时间
-        response = requests.post(url, headers=headers, json=payload, timeout=120)
+        logger.info("Calling LLM API", extra={'url': url, 'model': payload['model']})
+        response = requests.post(url, headers=headers, json=payload, timeout=_llm_timeout())
         response.raise_for_status()
         
         result = response.json()
@@ -218,21 +437,44 @@ Please generate the report:"""
         # 提取生成的报告内容
         if 'choices' in result and len(result['choices']) > 0:
             report_content = result['choices'][0]['message']['content']
-            print("[Report Generator] LLM report generated successfully")
+            logger.info("LLM report generated")
             return report_content.strip()
         else:
-            print("[Report Generator] Invalid response format from LLM API")
+            logger.warning("Invalid response format from LLM API")
             return None
             
     except requests.exceptions.Timeout:
-        print(f"[Report Generator] LLM API request timeout (120s exceeded)")
+        logger.warning("LLM API request timeout")
         return None
     except requests.exceptions.RequestException as e:
-        print(f"[Report Generator] LLM API request failed: {e}")
+        logger.warning("LLM API request failed: %s", e)
         return None
     except (KeyError, IndexError, json.JSONDecodeError) as e:
-        print(f"[Report Generator] Failed to parse LLM response: {e}")
+        logger.warning("Failed to parse LLM response: %s", e)
         return None
-    except Exception as e:
-        print(f"[Report Generator] Unexpected error: {e}")
+    except Exception:
+        logger.exception("Unexpected error while generating LLM report")
         return None
+
+
+def _stream_report_with_llm(**fields):
+    """
+    流式调用 LLM API，逐段返回报告内容
+    响应为 SSE：每行 "data: {json}"，内容在 choices[0].delta.content，以 "data: [DONE]" 结束
+    连接失败、超时、格式错误等异常直接抛出，由调用方改用模板报告
+    """
+    url, headers, payload = _llm_request(**fields, stream=True)
+    logger.info("Calling LLM API (stream)", extra={'url': url, 'model': payload['model']})
+    with requests.post(url, headers=headers, json=payload, timeout=_llm_timeout(), stream=True) as response:
+        response.raise_for_status()
+        # text/event-stream 通常不带 charset，requests 会按 ISO-8859-1 解码
+        response.encoding = 'utf-8'
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            content = json.loads(data)['choices'][0].get('delta', {}).get('content')
+            if content:
+                yield content
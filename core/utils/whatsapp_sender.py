@@ -1,10 +1,14 @@
 """
 WhatsApp 发送器 - 使用 CallMeBot API 发送真实 WhatsApp 消息
 """
+import logging
+
 import requests
 import urllib.parse
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 def send_real_whatsapp(message):
     """
@@ -24,10 +28,10 @@ def send_real_whatsapp(message):
 
     # 简单的校验：如果没有配置 phone 或 key，就不发
     if not phone or not apikey or apikey == "WAITING_FOR_KEY":
-        print(f"⚠️ [WhatsApp] Config missing or Key not ready. Msg skipped: {message[:20]}...")
+        logger.warning("WhatsApp config missing or key not ready, message skipped: %s...", message[:20])
         return
 
-    print(f"📨 [WhatsApp] Sending to {phone}...")
+    logger.info("Sending WhatsApp message", extra={'phone': phone})
 
     try:
         # 构造 URL 参数
@@ -41,9 +45,9 @@ def send_real_whatsapp(message):
         response = requests.get("https://api.callmebot.com/whatsapp.php", params=params, timeout=10)
         
         if response.status_code == 200:
-            print("✅ [WhatsApp] Sent Successfully!")
+            logger.info("WhatsApp sent", extra={'phone': phone})
         else:
-            print(f"❌ [WhatsApp] Failed: {response.text}")
+            logger.error("WhatsApp send failed: %s", response.text, extra={'status': response.status_code})
 
     except Exception as e:
-        print(f"❌ [WhatsApp] Connection Error: {e}")
+        logger.error("WhatsApp connection error: %s", e)
@@ -1,38 +1,33 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.utils import timezone
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
-from .models import UserProfile, Subscription
+from .authentication import NotDevice
+from .models import UserProfile
+from . import db_metrics
+from .profiling import endpoint_stats
 from .serializers import UserProfileSerializer
-from .utils.report_generator import generate_daily_report
+from .utils.report_generator import PERIODS, ReportJob
 from .utils import drone_service
 
 
-def check_module_permission(user, module_slug):
-    """检查用户是否拥有指定模块的订阅权限"""
-    try:
-        customer = user.userprofile.customer
-        return Subscription.objects.filter(
-            customer=customer,
-            module__slug=module_slug,
-            is_active=True,
-            expiration_date__gt=timezone.now()
-        ).exists()
-    except (UserProfile.DoesNotExist, AttributeError):
-        return False
+def check_module_permission(request, module_slug):
+    """检查当前用户是否拥有指定模块的订阅权限（读 request.tenant，一个请求只加载一次）"""
+    return request.tenant.has_module(module_slug)
 
 
 @login_required
 def index(request):
     """首页 - 仪表盘"""
     # 检查高级模块权限
-    has_llm_permission = check_module_permission(request.user, 'ppe_llm')
-    has_drone_permission = check_module_permission(request.user, 'ppe_drone')
+    has_llm_permission = check_module_permission(request, 'ppe_llm')
+    has_drone_permission = check_module_permission(request, 'ppe_drone')
     
     context = {
         'has_llm_permission': has_llm_permission,
@@ -51,22 +46,35 @@ def violations(request):
 def generate_report_view(request):
     """
     LLM 智能报告生成接口。
-    要求用户拥有 ppe_llm 模块权限，返回当日 Markdown 报告。
+    要求用户拥有 ppe_llm 模块权限，返回 Markdown 报告。
+    ?period=daily（默认，当日）/ weekly（本周）/ monthly（本月）
+    数据没变时直接返回已保存的报告；?refresh=1 强制重新生成
+    ?stream=1: 以 text/markdown 流式返回，LLM 每输出一段就发给浏览器（dashboard 使用）；
+    LLM 不可达时立即返回模板报告
     """
-    if not check_module_permission(request.user, 'ppe_llm'):
+    if not check_module_permission(request, 'ppe_llm'):
         return JsonResponse(
             {'error': '此功能需要订阅 [AI Reporting] 模块，请联系销售。'},
             status=403
         )
-    try:
-        customer = request.user.userprofile.customer
-    except (UserProfile.DoesNotExist, AttributeError):
+    customer = request.tenant.customer
+    if customer is None:
         return JsonResponse(
             {'error': '用户档案或客户信息不存在。'},
             status=403
         )
-    report_text = generate_daily_report(customer)
-    return JsonResponse({'report': report_text})
+    period = request.GET.get('period', 'daily')
+    if period not in PERIODS:
+        return JsonResponse({'error': f"period 必须是 {' / '.join(PERIODS)}"}, status=400)
+    job = ReportJob(customer, period, refresh=request.GET.get('refresh') in ('1', 'true'))
+    if request.GET.get('stream') in ('1', 'true'):
+        # ASGI 用异步迭代器，否则 Django 会等整篇生成完才发送
+        tokens = job.astream() if isinstance(request, ASGIRequest) else job.stream()
+        response = StreamingHttpResponse(tokens, content_type='text/markdown; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    return JsonResponse({'report': job.render()})
 
 
 @login_required
@@ -78,7 +86,7 @@ def dispatch_drone_view(request):
     # 权限检查：ppe_drone 权限或 superuser
     has_permission = (
         request.user.is_superuser or 
-        check_module_permission(request.user, 'ppe_drone')
+        check_module_permission(request, 'ppe_drone')
     )
     
     if not has_permission:
@@ -101,9 +109,40 @@ def service_suspended(request):
     return render(request, 'core/suspended.html')
 
 
+def profiling_stats(request):
+    """
+    请求性能统计（后台页面，仅 staff，见 core/profiling.py）
+    - ?format=json 导出 JSON
+    - POST 清空统计
+    """
+    if request.method == 'POST':
+        endpoint_stats.reset()
+        return redirect(request.path)
+    stats = endpoint_stats.snapshot()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'enabled': getattr(settings, 'REQUEST_PROFILING', False),
+            'window': endpoint_stats.window,
+            'endpoints': stats,
+        })
+    return render(request, 'core/profiling.html', {
+        'title': 'Request profiling',
+        'enabled': getattr(settings, 'REQUEST_PROFILING', False),
+        'window': endpoint_stats.window,
+        'endpoints': stats,
+    })
+
+
+def db_stats(request):
+    """数据库连接 / 连接池统计（后台，仅 staff，本 worker 进程）；POST 清零计数"""
+    if request.method == 'POST':
+        db_metrics.reset()
+    return JsonResponse(db_metrics.snapshot())
+
+
 class MyProfileView(APIView):
-    """获取当前登录用户的档案信息"""
-    permission_classes = [IsAuthenticated]
+    """获取当前登录用户的档案信息（设备 Key 没有用户档案，不能调用）"""
+    permission_classes = [IsAuthenticated, NotDevice]
 
     def get(self, request):
         try:
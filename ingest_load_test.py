@@ -0,0 +1,128 @@
+"""
+事件上报压测脚本 - 模拟大量慢速摄像头同时上传抓拍，对比 WSGI 和 ASGI 的吞吐
+
+每个虚拟摄像头把 multipart 请求体切成小块，按 --upload-seconds 慢慢发完（模拟 4G 摄像头），
+统计成功数、吞吐 (req/s) 和延迟分位数。
+
+用法:
+    # 1. 签发设备 Key
+    python manage.py issue_device_key <customer_id> CAM-LOAD
+
+    # 2a. WSGI（同步接口，每个在途上传占用一个线程）
+    gunicorn config.wsgi -w 4 --threads 8
+    python ingest_load_test.py --url http://127.0.0.1:8000/api/v1/ppe/events/ --device-key <key>
+
+    # 2b. ASGI（异步接口，慢速上传不占线程）
+    gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker -w 4
+    python ingest_load_test.py --url http://127.0.0.1:8000/api/v1/ppe/events/ingest/ --device-key <key>
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+
+import aiohttp
+
+IMAGE_PATH = 'test.png'
+VIOLATION_TYPES = ['no_helmet', 'no_vest', 'no_gloves', 'no_goggles']
+
+
+def build_multipart(image_bytes):
+    """构造一个 multipart/form-data 请求体，返回 (body, content_type)"""
+    boundary = uuid.uuid4().hex
+    detections = json.dumps({
+        'violation': random.choice(VIOLATION_TYPES),
+        'confidence': round(random.uniform(0.85, 0.99), 2),
+    })
+    parts = []
+    for name, value in (('camera_id', 'CAM-LOAD'), ('detections', detections)):
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="capture.png"\r\n'
+        f'Content-Type: image/png\r\n\r\n'.encode()
+        + image_bytes + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+async def slow_body(body, upload_seconds, chunks=20):
+    """把请求体分块慢慢发出去"""
+    size = max(1, len(body) // chunks)
+    delay = upload_seconds / chunks
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+        await asyncio.sleep(delay)
+
+
+async def upload(session, args, image_bytes, latencies, statuses):
+    body, content_type = build_multipart(image_bytes)
+    headers = {
+        'Authorization': f'Device {args.device_key}',
+        'Content-Type': content_type,
+        'Content-Length': str(len(body)),
+    }
+    started = time.perf_counter()
+    try:
+        async with session.post(args.url, data=slow_body(body, args.upload_seconds), headers=headers) as resp:
+            await resp.read()
+            statuses[resp.status] += 1
+    except aiohttp.ClientError as e:
+        statuses[type(e).__name__] += 1
+        return
+    latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    with open(IMAGE_PATH, 'rb') as f:
+        image_bytes = f.read()
+
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            async with semaphore:
+                await upload(session, args, image_bytes, latencies, statuses)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    ok = statuses.get(201, 0)
+    print("=" * 50)
+    print(f"URL:          {args.url}")
+    print(f"Requests:     {args.requests} (concurrency {args.concurrency}, upload {args.upload_seconds}s each)")
+    print(f"Statuses:     {dict(statuses)}")
+    print(f"Elapsed:      {elapsed:.2f}s")
+    print(f"Throughput:   {ok / elapsed:.1f} events/s")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(f"Latency p50:  {statistics.median(latencies):.2f}s")
+        print(f"Latency p95:  {p95:.2f}s")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent slow-upload load test for event ingest')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api/v1/ppe/events/ingest/')
+    parser.add_argument('--device-key', required=True)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--upload-seconds', type=float, default=5.0, help='每个上传持续的秒数')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,23 @@
-from django.contrib import admin
-from .models import DetectionEvent
+from django.contrib import admin, messages
+from core.db_router import ReplicaChangeListMixin
+from .bulk_update import set_resolved
+from .models import DetectionEvent, ImageBlob, ViolationItem, ArchivedDetectionEvent
+
+
+class ViolationItemInline(admin.TabularInline):
+    # 入库时从 detections 拆出的违规明细（只读）
+    model = ViolationItem
+    fields = ('violation_class', 'confidence', 'bbox')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(DetectionEvent)
-class DetectionEventAdmin(admin.ModelAdmin):
+class DetectionEventAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     # 后台列表显示哪些字段
     list_display = ('customer', 'camera_id', 'timestamp', 'is_resolved')
     # 允许按客户和处理状态筛选
@@ -12,3 +26,39 @@ class DetectionEventAdmin(admin.ModelAdmin):
     search_fields = ('camera_id',)
     # 按时间倒序排列
     ordering = ('-timestamp',)
+    inlines = [ViolationItemInline]
+    actions = ['mark_resolved', 'mark_unresolved']
+
+    @admin.action(description='Mark selected events as resolved')
+    def mark_resolved(self, request, queryset):
+        # 一条 UPDATE 批量修改，汇总表和 dashboard 缓存同步更新
+        updated = set_resolved(queryset, resolved=True)
+        self.message_user(request, f"{updated} event(s) marked as resolved.", messages.SUCCESS)
+
+    @admin.action(description='Mark selected events as unresolved')
+    def mark_unresolved(self, request, queryset):
+        updated = set_resolved(queryset, resolved=False)
+        self.message_user(request, f"{updated} event(s) reopened.", messages.SUCCESS)
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    # 内容寻址存储的文件及引用计数（只读，由系统维护）
+    list_display = ('name', 'size', 'ref_count', 'last_referenced_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'size', 'ref_count', 'last_referenced_at')
+
+
+@admin.register(ArchivedDetectionEvent)
+class ArchivedDetectionEventAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    # 超过保留期的归档事件（只读，由 archive_events 命令写入）
+    list_display = ('id', 'customer', 'camera_id', 'timestamp', 'is_resolved', 'archived_at')
+    list_filter = ('customer',)
+    search_fields = ('camera_id', 'person_id')
+    ordering = ('-timestamp',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PpeConfig(AppConfig):
     name = "ppe"
+
+    def ready(self):
+        # 注册信号处理（图片引用计数等）
+        from . import signals  # noqa: F401
+        # 系统检查（生产环境缺少共用缓存时警告）
+        from . import checks  # noqa: F401
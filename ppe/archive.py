@@ -0,0 +1,204 @@
+"""
+检测事件归档
+超过保留期的事件从 DetectionEvent 移到 ArchivedDetectionEvent，图片按 客户 / 天 打包成 tar：
+- tar 不压缩（JPEG 本身已压缩），记录每张图片数据的偏移量和长度，读取时直接 seek，不用解析整个 tar
+- 先写 tar 再在一个事务里写归档行、删除原事件；中途失败重跑时 tar 里最多多一份重复数据
+- 写 tar 时对文件加排它锁（flock），多个归档进程同时追加同一天的文件时依次写入
+- 删除原事件走正常的 delete()，图片引用计数、ViolationItem 由信号 / 级联处理；
+  归档的事件仍然计入 dashboard / 人员汇总的总数（rebuild_event_rollups 也会统计归档表），删除时不从汇总表扣减，
+  但不再算作未处理：归档后无法再处理，未处理数按摄像头一次性扣减
+"""
+import io
+import os
+import tarfile
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境：不加文件锁
+    fcntl = None
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .live_feed import broker
+from .models import DetectionEvent, ArchivedDetectionEvent
+from .storage import VARIANT_SIZES, is_content_addressed, variant_name, variant_storage
+
+ARCHIVE_FIELDS = ('id', 'customer_id', 'camera_id', 'timestamp', 'detections',
+                  'is_resolved', 'person_name', 'person_id', 'image')
+
+
+_archiving = ContextVar('ppe_archiving', default=False)
+
+
+def is_archiving():
+    """当前的删除是否为归档（signals 据此跳过汇总表扣减和实时推送）"""
+    return _archiving.get()
+
+
+@contextmanager
+def archival_delete():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def archive_root():
+    return str(getattr(settings, 'ARCHIVE_ROOT'))
+
+
+def day_archive_name(customer_id, day):
+    """某客户某一天的图片归档文件（相对 ARCHIVE_ROOT）"""
+    return f"{customer_id}/{day:%Y/%m/%d}.tar"
+
+
+class DayArchive:
+    """
+    追加写入一个按天的 tar 文件
+    同一次归档中相同的图片（内容寻址存储里被多个事件引用）只写一份
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.path = os.path.join(archive_root(), name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        try:
+            if fcntl is not None:
+                # 锁到 close()：另一个进程要等这里写完才能打开同一个 tar 追加
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            # 空文件（新建的）不能用追加模式打开
+            mode = 'a' if os.fstat(self._file.fileno()).st_size else 'w'
+            self._tar = tarfile.open(fileobj=self._file, mode=mode, format=tarfile.PAX_FORMAT)
+        except BaseException:
+            self._file.close()
+            raise
+        self._written = {}
+
+    def add(self, image_name, storage):
+        """
+        把一张图片写入 tar
+        Returns:
+            (member, offset, size)，图片不存在时返回 None
+        """
+        if image_name in self._written:
+            return self._written[image_name]
+        try:
+            with storage.open(image_name, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        info = tarfile.TarInfo(image_name)
+        info.size = len(data)
+        info.mtime = int(timezone.now().timestamp())
+        header = info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        offset = self._tar.offset + len(header)
+        self._tar.addfile(info, io.BytesIO(data))
+
+        self._written[image_name] = (image_name, offset, len(data))
+        return self._written[image_name]
+
+    def close(self):
+        try:
+            self._tar.close()
+            # 写入的 tar 必须落盘后才能删除原图
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            # 关闭文件同时释放锁
+            self._file.close()
+
+
+def read_image(archived):
+    """读取归档事件的图片字节，没有图片返回 None"""
+    if not archived.image_archive:
+        return None
+    with open(os.path.join(archive_root(), archived.image_archive), 'rb') as f:
+        f.seek(archived.image_offset)
+        return f.read(archived.image_size)
+
+
+def archive_batch(customer, cutoff, batch_size):
+    """
+    归档该客户 cutoff 之前最早的一批事件
+    Returns:
+        int: 归档的事件数（0 表示已经没有需要归档的事件）
+    """
+    events = list(
+        DetectionEvent.objects.for_customer(customer)
+        .filter(timestamp__lt=cutoff)
+        .order_by('timestamp', 'id')
+        .values(*ARCHIVE_FIELDS)[:batch_size]
+    )
+    if not events:
+        return 0
+
+    storage = DetectionEvent._meta.get_field('image').storage
+    by_day = defaultdict(list)
+    for event in events:
+        by_day[timezone.localdate(event['timestamp'])].append(event)
+
+    # 1. 图片写入按天的 tar
+    archived = []
+    for day, day_events in by_day.items():
+        tar = DayArchive(day_archive_name(customer.pk, day))
+        try:
+            for event in day_events:
+                image = event.pop('image')
+                packed = tar.add(image, storage) if image else None
+                if packed:
+                    event['image_member'], event['image_offset'], event['image_size'] = packed
+                    event['image_archive'] = tar.name
+                archived.append((ArchivedDetectionEvent(**event), image))
+        finally:
+            tar.close()
+
+    # 2. 写归档行、删除原事件（信号负责图片引用计数；汇总表只扣减未处理数）
+    with transaction.atomic(), archival_delete():
+        ArchivedDetectionEvent.objects.bulk_create(
+            [row for row, _ in archived], ignore_conflicts=True
+        )
+        DetectionEvent.objects.filter(pk__in=[row.pk for row, _ in archived]).delete()
+        _remove_unresolved(customer.pk, [row for row, _ in archived])
+
+        # 老数据（detections/YYYY/MM/DD/）没有引用计数，提交后直接删除文件
+        legacy = [image for _, image in archived if image and not is_content_addressed(image)]
+        if legacy:
+            transaction.on_commit(lambda: _delete_files(storage, legacy))
+
+    return len(archived)
+
+
+def _remove_unresolved(customer_id, rows):
+    """归档的未处理事件从未处理数中扣除：每个摄像头一次 UPDATE，提交后推送统计增量"""
+    unresolved = Counter(
+        (row.camera_id, timezone.localdate(row.timestamp)) for row in rows if not row.is_resolved
+    )
+    if not unresolved:
+        return
+    per_camera = Counter()
+    for (camera_id, _), count in unresolved.items():
+        per_camera[camera_id] += count
+    for camera_id, count in per_camera.items():
+        rollups.adjust_unresolved(customer_id, camera_id, -count)
+
+    changes = [
+        {'camera_id': camera_id, 'date': day.isoformat(), 'total': 0, 'unresolved': -count}
+        for (camera_id, day), count in unresolved.items()
+    ]
+    transaction.on_commit(lambda: broker.publish(customer_id, 'stats', {'changes': changes}))
+
+
+def _delete_files(storage, names):
+    for name in set(names):
+        storage.delete(name)
+        for variant in VARIANT_SIZES:
+            variant_storage.delete(variant_name(name, variant))
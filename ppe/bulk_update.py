@@ -0,0 +1,81 @@
+"""
+批量修改检测事件
+不把事件读进 Python：先按 (客户, 摄像头, 日期) 聚合出要修改的行数，再用一条 UPDATE 修改，
+汇总表、数据版本号、实时推送按聚合结果一次性调整，与逐行 save 的结果一致。
+两条语句之间有其它请求改了这些事件时（UPDATE 的行数与聚合结果对不上），回滚重试；
+一直冲突时先锁住目标行再统计。
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from . import rollups
+from .caching import bump_data_version
+from .live_feed import broker
+
+# 乐观重试次数，之后改为先加行锁
+MAX_ATTEMPTS = 3
+
+
+class _ConcurrentChange(Exception):
+    """聚合之后、UPDATE 之前目标事件被其它事务修改"""
+
+
+def set_resolved(queryset, resolved=True):
+    """
+    把 queryset 中的事件批量设置为已处理 / 未处理
+    Returns:
+        int: 实际修改的行数（已经是目标状态的不计）
+    """
+    targets = queryset.filter(is_resolved=not resolved).order_by()
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _apply(targets, resolved)
+        except _ConcurrentChange:
+            continue
+    with transaction.atomic():
+        # PostgreSQL 不允许 GROUP BY 与 FOR UPDATE 同用，只能先单独锁行
+        list(targets.select_for_update().values_list('pk', flat=True))
+        return _apply(targets, resolved)
+
+
+def _pending_changes(targets):
+    """要修改的事件数: [(customer_id, camera_id, 本地日期, 行数)]"""
+    return list(
+        targets.values('customer_id', 'camera_id', day=TruncDate('timestamp'))
+        .annotate(count=Count('pk'))
+        .values_list('customer_id', 'camera_id', 'day', 'count')
+    )
+
+
+def _apply(targets, resolved):
+    groups = _pending_changes(targets)
+    expected = sum(count for *_, count in groups)
+    if not expected:
+        return 0
+    if targets.update(is_resolved=resolved) != expected:
+        raise _ConcurrentChange
+
+    # 汇总表：每个 (客户, 摄像头) 一次 UPDATE
+    sign = -1 if resolved else 1
+    per_camera = {}
+    for customer_id, camera_id, _, count in groups:
+        per_camera[customer_id, camera_id] = per_camera.get((customer_id, camera_id), 0) + count
+    for (customer_id, camera_id), count in per_camera.items():
+        rollups.adjust_unresolved(customer_id, camera_id, sign * count)
+
+    # 实时推送的统计增量：按 (客户, 摄像头, 日期)
+    changes = {}
+    for customer_id, camera_id, day, count in groups:
+        changes.setdefault(customer_id, []).append(
+            {'camera_id': camera_id, 'date': day.isoformat(), 'total': 0, 'unresolved': sign * count}
+        )
+    transaction.on_commit(lambda: _after_commit(changes))
+    return expected
+
+
+def _after_commit(changes):
+    for customer_id, customer_changes in changes.items():
+        bump_data_version(customer_id)
+        broker.publish(customer_id, 'stats', {'changes': customer_changes})
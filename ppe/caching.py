@@ -0,0 +1,149 @@
+"""
+按客户的数据版本号 + 响应缓存
+- 每个客户在缓存里有一个数据版本号，事件入库 / 处理 / 删除提交后递增（见 ppe/signals.py）
+- 缓存 key 带上版本号，数据没变时一直命中，数据一变旧 key 自然作废，不需要逐个删除
+- ETag 同样由版本号生成，浏览器带 If-None-Match 时不用查询就能判断是否 304
+- 命中次数、未命中次数、重算耗时记在缓存里，多个进程共用（Redis 下 incr 是原子的）
+版本号必须存在多个进程共用的缓存（REDIS_URL）里：进程内缓存下每个 worker 各有一个版本号，
+别的 worker 写入的数据不会让本 worker 的缓存失效，旧统计和 304 会一直返回。
+所以 DATA_VERSION_CACHE 关闭时（默认：没有 REDIS_URL 的生产环境）不使用版本号：
+get_data_version() 返回 None，不生成 ETag，dashboard 每次重新计算（汇总表查询本身很快）
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+STATS_FIELDS = ('hits', 'misses', 'recompute_us_total', 'last_recompute_us')
+
+
+def _version_key(customer_id):
+    return f"ppe:data-version:{customer_id}"
+
+
+def versioning_enabled():
+    """缓存是否为多个进程共用（见 settings.DATA_VERSION_CACHE）"""
+    return getattr(settings, 'DATA_VERSION_CACHE', True)
+
+
+def get_data_version(customer_id):
+    """
+    当前数据版本号；未启用版本号时返回 None
+    版本号被淘汰后用当前时间（纳秒）重新初始化，保证不会与之前用过的版本号重复
+    """
+    if not versioning_enabled():
+        return None
+    key = _version_key(customer_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(customer_id):
+    """数据已变更：递增版本号（应在事务提交后调用）"""
+    if not versioning_enabled():
+        return
+    key = _version_key(customer_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 版本号不存在（已被淘汰），重新初始化即可
+        cache.set(key, time.time_ns(), None)
+
+
+def data_etag(customer_id, *parts):
+    """
+    由数据版本号 + 请求参数生成 ETag（只读缓存，不查数据库）
+    数据没变、参数相同时 ETag 不变；未启用版本号时返回 None（不使用 ETag）
+    """
+    version = get_data_version(customer_id)
+    if version is None:
+        return None
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:16]
+    return f'"{customer_id}-{version}-{digest}"'
+
+
+def not_modified(request, etag):
+    """If-None-Match 命中时返回 304 响应，否则返回 None"""
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_etag(response, etag)
+    return response
+
+
+def set_etag(response, etag):
+    # private: 只允许浏览器缓存；no-cache: 每次使用前都带 If-None-Match 重新验证
+    if etag is not None:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class CacheStats:
+    """一类缓存的命中率和重算耗时"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _key(self, field):
+        return f"ppe:cache-stats:{self.name}:{field}"
+
+    def _incr(self, field, delta=1):
+        key = self._key(field)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            if not cache.add(key, delta, None):
+                cache.incr(key, delta)
+
+    def hit(self):
+        self._incr('hits')
+
+    def miss(self, recompute_seconds):
+        recompute_us = int(recompute_seconds * 1_000_000)
+        self._incr('misses')
+        self._incr('recompute_us_total', recompute_us)
+        cache.set(self._key('last_recompute_us'), recompute_us, None)
+
+    def snapshot(self):
+        values = cache.get_many([self._key(f) for f in STATS_FIELDS])
+        hits, misses, total_us, last_us = (values.get(self._key(f), 0) for f in STATS_FIELDS)
+        requests = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / requests, 4) if requests else None,
+            'avg_recompute_ms': round(total_us / misses / 1000, 2) if misses else None,
+            'last_recompute_ms': round(last_us / 1000, 2) if misses else None,
+        }
+
+    def reset(self):
+        cache.delete_many([self._key(f) for f in STATS_FIELDS])
+
+
+def get_or_compute(key, compute, stats, timeout):
+    """
+    读缓存，未命中时调用 compute() 重算并写入；key 为 None 时（未启用版本号）不缓存
+    Returns:
+        (value, hit)
+    """
+    value = cache.get(key) if key is not None else None
+    if value is not None:
+        stats.hit()
+        return value, True
+
+    started = time.perf_counter()
+    value = compute()
+    stats.miss(time.perf_counter() - started)
+    if key is not None:
+        cache.set(key, value, timeout)
+    return value, False
+
+
+dashboard_cache_stats = CacheStats('dashboard')
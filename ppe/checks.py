@@ -0,0 +1,19 @@
+"""
+ppe 应用的系统检查（manage.py check / 启动时执行）
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """生产环境应设置 REDIS_URL：数据版本号只有在多个进程共用的缓存里才可靠（见 ppe/caching.py）"""
+    if settings.DEBUG or not isinstance(caches['default'], LocMemCache):
+        return []
+    if settings.DATA_VERSION_CACHE:
+        hint = 'With several workers each one keeps its own data version, so stale stats and 304s persist.'
+    else:
+        hint = 'Dashboard caching, ETags and report reuse by data version are disabled until it is set.'
+    return [Warning('REDIS_URL is not set; the cache is per-process.', hint=hint, id='ppe.W001')]
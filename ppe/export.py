@@ -0,0 +1,163 @@
+"""
+检测事件导出（CSV / NDJSON，可选 gzip）
+按 (timestamp, id) keyset 分块读取，边查边写，内存占用与导出行数无关：
+- MySQL 驱动的 .iterator() 会把整个结果集读进客户端内存，所以这里不用它，改为每块一条带游标条件的查询
+- 输出攒到约 64KB 再交给 StreamingHttpResponse，避免每行一次 write
+- ASGI 下 Django 会把同步迭代器整个读进内存再发送，所以 ASGI 用异步生成器 stream()：
+  每一页的查询、序列化、压缩在线程里执行，事件循环只负责发送；WSGI 用同步的 blocks()
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from .serializers import DetectionEventRowSerializer
+from .violations import extract_violation_items, violation_label
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+BASE_FIELDS = ['id', 'timestamp', 'camera_id', 'person_name', 'person_id', 'is_resolved', 'detections']
+IMAGE_FIELDS = ['image', 'image_variants']
+
+
+def iter_pages(queryset, columns, chunk_size=CHUNK_SIZE):
+    """按 (timestamp, id) 升序分块读取 .values() 行，每次返回一页（list）"""
+    queryset = queryset.order_by('timestamp', 'id').values(*columns)
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(timestamp__gte=last[0]).exclude(timestamp=last[0], pk__lte=last[1])
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last = (rows[-1]['timestamp'], rows[-1]['id'])
+
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """逐行读取（分块查询）"""
+    for rows in iter_pages(queryset, columns, chunk_size):
+        yield from rows
+
+
+class EventExporter:
+    """
+    Args:
+        output: 'csv' 或 'ndjson'
+        include_images: 是否包含原图 / 缩略图 URL 列
+        compress: 是否 gzip 压缩
+    """
+
+    def __init__(self, request, output='csv', include_images=False, compress=False):
+        self.output = output
+        self.compress = compress
+        fields = BASE_FIELDS + (IMAGE_FIELDS if include_images else [])
+        self.row_serializer = DetectionEventRowSerializer(request, fields)
+
+    @property
+    def filename(self):
+        name = f"detection-events.{self.output}"
+        return name + '.gz' if self.compress else name
+
+    @property
+    def content_type(self):
+        if self.compress:
+            return 'application/gzip'
+        return 'text/csv' if self.output == 'csv' else 'application/x-ndjson'
+
+    def _record(self, row):
+        """一个事件一条记录（dict），违规类型从 detections 解析成可读标签"""
+        record = self.row_serializer.to_representation(row)
+        record['violations'] = [
+            violation_label(item['violation_class'])
+            for item in extract_violation_items(record['detections'])
+        ]
+        return record
+
+    def _line_pages(self, queryset):
+        """每页事件输出一批文本行（CSV 的表头放在第一批）"""
+        pages = iter_pages(queryset, self.row_serializer.columns, CHUNK_SIZE)
+        if self.output == 'ndjson':
+            for rows in pages:
+                yield [
+                    json.dumps(self._record(row), ensure_ascii=False, separators=(',', ':')) + '\n'
+                    for row in rows
+                ]
+            return
+
+        header = [f for f in self.row_serializer.fields if f != 'image_variants']
+        header.insert(header.index('detections'), 'violations')
+        if 'image_variants' in self.row_serializer.fields:
+            header.append('thumbnail')
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def render(values):
+            writer.writerow(values)
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return line
+
+        def values(record):
+            for field in header:
+                if field == 'violations':
+                    yield '; '.join(record['violations'])
+                elif field == 'detections':
+                    yield json.dumps(record['detections'], ensure_ascii=False)
+                elif field == 'thumbnail':
+                    yield record['image_variants'].get('thumb', '')
+                else:
+                    yield record[field]
+
+        # UTF-8 BOM：Excel 打开时中文不乱码
+        lines = ['\ufeff' + render(header)]
+        for rows in pages:
+            lines.extend(render(values(self._record(row))) for row in rows)
+            yield lines
+            lines = []
+        if lines:
+            yield lines
+
+    def _block_pages(self, queryset):
+        """每页事件输出一批字节块（约 64KB 一块，不足的留到下一页），最后一批包含剩余内容"""
+        compressor = zlib.compressobj(wbits=31) if self.compress else None
+        pending = []
+        size = 0
+        for lines in self._line_pages(queryset):
+            blocks = []
+            for line in lines:
+                data = line.encode('utf-8')
+                pending.append(data)
+                size += len(data)
+                if size >= FLUSH_BYTES:
+                    block = b''.join(pending)
+                    pending, size = [], 0
+                    block = compressor.compress(block) if compressor else block
+                    if block:
+                        blocks.append(block)
+            yield blocks
+        block = b''.join(pending)
+        if compressor:
+            block = compressor.compress(block) + compressor.flush()
+        yield [block] if block else []
+
+    def blocks(self, queryset):
+        """输出字节块（同步，WSGI）"""
+        for blocks in self._block_pages(queryset):
+            yield from blocks
+
+    async def stream(self, queryset):
+        """输出字节块（异步，ASGI）：每页在线程里查询、编码，发送完再取下一页"""
+        pages = self._block_pages(queryset)
+        next_page = sync_to_async(next)
+        while (blocks := await next_page(pages, None)) is not None:
+            for block in blocks:
+                yield block
@@ -0,0 +1,48 @@
+from django import forms
+
+
+class DetectionIngestForm(forms.Form):
+    """异步上报接口的表单校验（字段与 DetectionEventSerializer 保持一致）"""
+
+    # 违规抓拍照片（ImageField 会用 Pillow 校验是否为有效图片）
+    image = forms.ImageField()
+
+    # AI 识别结果，JSON 字符串
+    detections = forms.JSONField(required=False)
+
+    # 身份识别字段（没传时使用模型默认值）
+    person_name = forms.CharField(max_length=100, required=False)
+    person_id = forms.CharField(max_length=50, required=False)
+
+
+class DetectionEventFilterForm(forms.Form):
+    """事件列表的查询参数（每种过滤都有对应的 (customer, ..., timestamp) 索引）"""
+
+    camera_id = forms.CharField(max_length=50, required=False)
+
+    # true / false，不传表示全部
+    is_resolved = forms.TypedChoiceField(
+        choices=[('true', 'true'), ('false', 'false')],
+        coerce=lambda value: value == 'true',
+        empty_value=None,
+        required=False,
+    )
+
+    person_id = forms.CharField(max_length=50, required=False)
+
+    # 时间范围 [since, until)，ISO 8601 日期或时间
+    since = forms.DateTimeField(required=False)
+    until = forms.DateTimeField(required=False)
+
+    def filter(self, queryset):
+        data = self.cleaned_data
+        for field in ('camera_id', 'person_id'):
+            if data[field]:
+                queryset = queryset.filter(**{field: data[field]})
+        if data['is_resolved'] is not None:
+            queryset = queryset.filter(is_resolved=data['is_resolved'])
+        if data['since']:
+            queryset = queryset.filter(timestamp__gte=data['since'])
+        if data['until']:
+            queryset = queryset.filter(timestamp__lt=data['until'])
+        return queryset
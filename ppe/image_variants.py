@@ -0,0 +1,115 @@
+"""
+缩略图生成
+事件入库后由后台线程池生成 thumb / medium 两种尺寸，违规列表只加载缩略图。
+- 线程池大小和排队任务数都有上限，高峰期排不上的任务由 generate_image_variants 命令补齐
+- 同一个 blob 的缩略图只生成一次（路径由原图决定）
+- IMAGE_VARIANT_WORKERS=0 时不用线程池，提交后在当前线程里直接生成（测试默认如此）
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from .caching import bump_data_version
+from .storage import VARIANT_SIZES, content_addressed_storage, variant_name, variant_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = None
+
+
+def _get_executor():
+    """懒加载线程池（避免 manage.py 命令启动时就创建线程）"""
+    global _executor, _pending
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _pending = threading.BoundedSemaphore(
+                    getattr(settings, 'IMAGE_VARIANT_MAX_PENDING', 200)
+                )
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                    thread_name_prefix='image-variants',
+                )
+    return _executor
+
+
+def render_variants(image_name, overwrite=False):
+    """
+    为一张原图生成所有尺寸的缩略图（已存在则跳过，overwrite=True 时重新生成并覆盖）
+    缩略图总是保存在 variant_name() 决定的路径，回收原图时才能按路径删除
+    Returns:
+        dict: {'thumb': 'variants/thumb/...jpg', 'medium': ...}
+    """
+    from PIL import Image, ImageOps
+
+    names = {variant: variant_name(image_name, variant) for variant in VARIANT_SIZES}
+    missing = [v for v, name in names.items() if overwrite or not variant_storage.exists(name)]
+    if not missing:
+        return names
+
+    with content_addressed_storage.open(image_name, 'rb') as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original).convert('RGB')
+
+    for variant in missing:
+        img = original.copy()
+        img.thumbnail(VARIANT_SIZES[variant])
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=80, optimize=True)
+        # 同名文件直接覆盖（例如两个线程同时生成），不会另存为新名字
+        variant_storage.save(names[variant], ContentFile(buffer.getvalue()))
+    return names
+
+
+def generate_for_event(event_id):
+    """为单个事件生成缩略图并写回 image_variants"""
+    from .models import DetectionEvent
+
+    row = DetectionEvent.objects.filter(pk=event_id).values_list('image', 'customer_id').first()
+    if row is None or not row[0]:
+        return None
+    image_name, customer_id = row
+    names = render_variants(image_name)
+    # update() 不触发 post_save，不会影响引用计数等逻辑；事件列表的 ETag 包含缩略图，手动递增数据版本号
+    DetectionEvent.objects.filter(pk=event_id).update(image_variants=names)
+    bump_data_version(customer_id)
+    return names
+
+
+def _generate(event_id):
+    try:
+        generate_for_event(event_id)
+    except Exception as e:
+        logger.warning("Image variants failed: %s", e, extra={'event_id': event_id})
+
+
+def _run(event_id):
+    close_old_connections()
+    try:
+        _generate(event_id)
+    finally:
+        close_old_connections()
+        _pending.release()
+
+
+def schedule(event_id):
+    """
+    提交缩略图任务到后台线程池。
+    排队任务已满时直接放弃，返回 False（由 backfill 命令补齐）。
+    """
+    if getattr(settings, 'IMAGE_VARIANT_WORKERS', 2) == 0:
+        _generate(event_id)
+        return True
+    executor = _get_executor()
+    if not _pending.acquire(blocking=False):
+        logger.warning("Image variant queue full, skipped", extra={'event_id': event_id})
+        return False
+    executor.submit(_run, event_id)
+    return True
@@ -0,0 +1,182 @@
+"""
+实时推送（Server-Sent Events）
+事件入库 / 处理提交后发布到进程内的 LiveFeedBroker，/api/v1/ppe/live/ 的连接被唤醒后推给浏览器：
+- 每个客户一个环形缓冲，消息带递增 id，断线重连时按 Last-Event-ID 补发
+- 没有新消息时连接只在 asyncio.Event 上等待，定时发一个 keepalive，空闲时几乎不占资源
+- 发布方可能在任意线程（同步视图、线程池），通过 call_soon_threadsafe 唤醒订阅者所在的事件循环
+
+Broker 是进程内的：多 worker 部署时，其它进程写入的数据通过缓存里的数据版本号发现，
+收到 refresh 消息的页面重新拉取一次完整数据。
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .caching import get_data_version
+
+
+class Subscriber:
+    """一个 SSE 连接：保存所属事件循环，发布时跨线程唤醒"""
+
+    def __init__(self, customer_id):
+        self.customer_id = customer_id
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # 事件循环已关闭（连接已断开），忽略
+            pass
+
+
+class LiveFeedBroker:
+    """
+    进程内发布 / 订阅
+    缓冲区条目: (id, event_type, data)
+    """
+
+    def __init__(self, buffer_size=None):
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        # 以启动时间（微秒）作为起始 id：进程重启后不会与旧连接的 Last-Event-ID 混淆
+        self._ids = itertools.count(time.time_ns() // 1000)
+        self._last_issued = 0
+        self._buffers = {}
+        # 每个客户被挤出缓冲区的最后一条消息 id，Last-Event-ID 早于它说明漏了消息
+        self._evicted = {}
+        self._subscribers = defaultdict(set)
+
+    def _buffer(self, customer_id):
+        buffer = self._buffers.get(customer_id)
+        if buffer is None:
+            size = self._buffer_size or getattr(settings, 'LIVE_FEED_BUFFER_SIZE', 1000)
+            buffer = self._buffers[customer_id] = deque(maxlen=size)
+        return buffer
+
+    def publish(self, customer_id, event_type, data):
+        """发布一条消息（线程安全，应在事务提交后调用）"""
+        with self._lock:
+            message_id = self._last_issued = next(self._ids)
+            buffer = self._buffer(customer_id)
+            if len(buffer) == buffer.maxlen:
+                self._evicted[customer_id] = buffer[0][0]
+            buffer.append((message_id, event_type, data))
+            subscribers = list(self._subscribers.get(customer_id, ()))
+        for subscriber in subscribers:
+            subscriber.notify()
+        return message_id
+
+    def subscribe(self, customer_id):
+        subscriber = Subscriber(customer_id)
+        with self._lock:
+            self._subscribers[customer_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.customer_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.customer_id]
+
+    def last_id(self, customer_id):
+        with self._lock:
+            buffer = self._buffers.get(customer_id)
+            return buffer[-1][0] if buffer else None
+
+    def read_since(self, customer_id, last_id):
+        """
+        返回 (messages, complete)
+        complete=False 表示 last_id 之后的消息已被挤出缓冲区（或 id 来自其它进程），客户端需要整页刷新
+        """
+        with self._lock:
+            complete = self._evicted.get(customer_id, 0) <= last_id <= self._last_issued
+            buffer = self._buffers.get(customer_id)
+            messages = [m for m in buffer if m[0] > last_id] if buffer else []
+        return messages, complete
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+broker = LiveFeedBroker()
+
+
+def format_message(event_type, data, message_id=None):
+    """编码一条 SSE 消息"""
+    lines = []
+    if message_id is not None:
+        lines.append(f"id: {message_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def stream(customer_id, last_event_id=None, long_poll=False):
+    """
+    SSE 消息流（async generator）
+    Args:
+        last_event_id: 浏览器重连时带的 Last-Event-ID
+        long_poll: WSGI 下无法长时间流式输出，收到第一批消息（或一次 keepalive 超时）后结束，
+                   由 EventSource 自动重连，退化为长轮询
+    """
+    keepalive = getattr(settings, 'LIVE_FEED_KEEPALIVE', 15)
+    max_seconds = getattr(settings, 'LIVE_FEED_MAX_SECONDS', 300)
+    deadline = time.monotonic() + max_seconds
+
+    subscriber = broker.subscribe(customer_id)
+    try:
+        # EventSource 断线后的重连间隔（毫秒）
+        yield f"retry: {1000 if long_poll else 3000}\n\n"
+
+        if last_event_id is None:
+            last_id = broker.last_id(customer_id) or 0
+        else:
+            last_id = last_event_id
+            _, complete = broker.read_since(customer_id, last_id)
+            if not complete:
+                last_id = broker.last_id(customer_id) or 0
+                yield format_message('refresh', {'reason': 'missed'}, last_id)
+
+        version = await sync_to_async(get_data_version)(customer_id)
+        delivered = False
+
+        while time.monotonic() < deadline:
+            subscriber.wakeup.clear()
+            messages, _ = broker.read_since(customer_id, last_id)
+            if messages:
+                for message_id, event_type, data in messages:
+                    yield format_message(event_type, data, message_id)
+                last_id = messages[-1][0]
+                delivered = True
+                if long_poll:
+                    return
+                continue
+
+            try:
+                await asyncio.wait_for(subscriber.wakeup.wait(), timeout=keepalive)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            # 空闲：检查其它进程是否写入了数据（数据版本号变了但本进程没有推送过消息）
+            current = await sync_to_async(get_data_version)(customer_id)
+            if current != version and not delivered:
+                yield format_message('refresh', {'reason': 'changed'}, last_id or None)
+            version = current
+            delivered = False
+            yield ": keepalive\n\n"
+            if long_poll:
+                return
+    finally:
+        broker.unsubscribe(subscriber)
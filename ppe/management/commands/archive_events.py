@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Customer
+from ppe.archive import archive_batch
+from ppe.models import DetectionEvent
+
+
+class Command(BaseCommand):
+    help = "按客户的保留天数归档旧的检测事件：图片按天打包成 tar，事件移入归档表（分批删除）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer', type=int, action='append', help='只处理指定客户（可重复传入）')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批归档的事件数（默认 500）')
+        parser.add_argument('--max-batches', type=int, default=None, help='每个客户最多处理的批数（默认不限）')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要归档的事件数，不做修改')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.order_by('pk')
+        if options['customer']:
+            customers = customers.filter(pk__in=options['customer'])
+
+        total = 0
+        for customer in customers:
+            days = customer.effective_retention_days
+            if days is None:
+                continue
+            cutoff = timezone.now() - timedelta(days=days)
+
+            if options['dry_run']:
+                count = DetectionEvent.objects.for_customer(customer).filter(timestamp__lt=cutoff).count()
+                self.stdout.write(f"  {customer.name}: {count} event(s) older than {days} day(s)")
+                continue
+
+            archived = batches = 0
+            while options['max_batches'] is None or batches < options['max_batches']:
+                done = archive_batch(customer, cutoff, options['batch_size'])
+                if not done:
+                    break
+                archived += done
+                batches += 1
+                self.stdout.write(f"  {customer.name}: archived {archived} event(s) so far")
+            total += archived
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archived {total} event(s)"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ppe.models import DetectionEvent, ViolationItem
+
+
+class Command(BaseCommand):
+    help = "为历史 DetectionEvent 补建 ViolationItem 违规明细（按 id 分批处理）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的事件数（默认 1000）')
+        parser.add_argument('--rebuild', action='store_true', help='删除已有明细后全部重建')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['rebuild']:
+            deleted, _ = ViolationItem.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} existing item(s)")
+
+        last_id = 0
+        events_done = items_created = 0
+        while True:
+            batch = list(
+                DetectionEvent.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('pk', 'customer_id', 'timestamp', 'detections')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            # 跳过已经有明细的事件（可重复执行）
+            done_ids = set(
+                ViolationItem.objects.filter(event_id__in=[ev.pk for ev in batch])
+                .values_list('event_id', flat=True)
+            )
+            items = []
+            for ev in batch:
+                if ev.pk not in done_ids:
+                    items.extend(ViolationItem.build_for_event(ev))
+            with transaction.atomic():
+                ViolationItem.objects.bulk_create(items)
+
+            events_done += len(batch)
+            items_created += len(items)
+            self.stdout.write(f"  processed up to event {last_id} ({items_created} item(s) so far)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {events_done} event(s), created {items_created} violation item(s)"
+        ))
@@ -0,0 +1,112 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core import db_metrics
+from core.models import Customer
+from ppe.models import DetectionEvent
+from ppe.views import DashboardStatsView
+
+MODES = {
+    # 模式: (CONN_MAX_AGE, 是否启用连接池)
+    'no-persistence': (0, False),
+    'persistent': (600, False),
+    'pool': (0, True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "对比每个请求新建连接 / 持久连接 / 连接池（仅 PostgreSQL）下入库和 dashboard 的延迟。"
+        "按真实请求的生命周期发送 request_started / request_finished 信号，连接的关闭与复用和线上一致；"
+        "测试数据写在临时客户下，结束后删除"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='每种模式每个场景的请求数（默认 200）')
+        parser.add_argument('--modes', default=','.join(MODES), help=f"要测试的模式（默认 {','.join(MODES)}）")
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        original = (connection.settings_dict['CONN_MAX_AGE'], dict(connection.settings_dict.get('OPTIONS', {})))
+        customer = Customer.objects.create(name='Connection Benchmark')
+
+        rows = []
+        try:
+            for mode in options['modes'].split(','):
+                if not self._configure(connection, mode):
+                    continue
+                db_metrics.reset()
+                ingest = self._measure(options['requests'], lambda: self._ingest(customer))
+                dashboard = self._measure(
+                    options['requests'], lambda: DashboardStatsView.compute_stats(customer, timezone.now().date())
+                )
+                opened = db_metrics.snapshot()['databases'][DEFAULT_DB_ALIAS]['connections_opened']
+                rows.append((mode, ingest, dashboard, opened))
+        finally:
+            self._restore(connection, *original)
+            customer.delete()
+
+        self.stdout.write("=" * 78)
+        self.stdout.write(f"{connection.vendor}, {options['requests']} requests per scenario (ms)")
+        self.stdout.write(
+            f"  {'mode':<16}{'ingest p50':>12}{'ingest p95':>12}{'dash p50':>12}{'dash p95':>12}{'connects':>12}"
+        )
+        for mode, ingest, dashboard, opened in rows:
+            self.stdout.write(
+                f"  {mode:<16}{ingest[0]:>12.2f}{ingest[1]:>12.2f}{dashboard[0]:>12.2f}{dashboard[1]:>12.2f}"
+                f"{opened:>12}"
+            )
+        self.stdout.write("=" * 78)
+
+    def _configure(self, connection, mode):
+        if mode not in MODES:
+            self.stdout.write(self.style.WARNING(f"Unknown mode {mode!r}, skipped"))
+            return False
+        max_age, pool = MODES[mode]
+        if pool and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(f"Connection pooling needs PostgreSQL, '{mode}' skipped"))
+            return False
+
+        options = dict(connection.settings_dict.get('OPTIONS', {}))
+        options.pop('pool', None)
+        if pool:
+            options['pool'] = True
+        self._restore(connection, max_age, options)
+        return True
+
+    @staticmethod
+    def _restore(connection, max_age, options):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.settings_dict['OPTIONS'] = options
+
+    @staticmethod
+    def _ingest(customer):
+        with transaction.atomic():
+            DetectionEvent.objects.create(
+                customer=customer,
+                camera_id='CAM-BENCH',
+                image='',
+                detections={'violation': 'no_helmet', 'confidence': 0.93},
+            )
+
+    @staticmethod
+    def _measure(count, work):
+        """每次模拟一个完整请求（信号触发 close_old_connections），返回 (p50, p95) 毫秒"""
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            request_started.send(sender=Command)
+            try:
+                work()
+            finally:
+                request_finished.send(sender=Command)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), statistics.quantiles(timings, n=20)[-1]
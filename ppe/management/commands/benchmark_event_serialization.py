@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from core.models import Customer
+from ppe.models import DetectionEvent
+from ppe.serializers import DetectionEventSerializer, DetectionEventRowSerializer
+
+
+class Command(BaseCommand):
+    help = "对比事件列表两种序列化方式的吞吐：ModelSerializer vs .values() 快速路径（测试数据在事务里回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='测试行数（默认 10000）')
+        parser.add_argument('--repeat', type=int, default=3, help='每种方式重复次数，取最快一次（默认 3）')
+        parser.add_argument('--fields', default='id,camera_id,timestamp,is_resolved,image_variants',
+                            help='稀疏字段测试用的 fields 参数')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        request = RequestFactory().get('/api/v1/ppe/events/')
+
+        with transaction.atomic():
+            customer = self._seed(rows)
+            events = DetectionEvent.objects.for_customer(customer).order_by('-timestamp', '-id')
+
+            def model_serializer():
+                return DetectionEventSerializer(events, many=True, context={'request': request}).data
+
+            def values_path(fields=None):
+                row_serializer = DetectionEventRowSerializer(request, fields)
+                return row_serializer.many(events.values(*row_serializer.columns))
+
+            sparse = options['fields'].split(',')
+            results = [
+                ('ModelSerializer (__all__)', self._measure(model_serializer, options['repeat'])),
+                ('values() fast path', self._measure(values_path, options['repeat'])),
+                (f"values() + ?fields ({len(sparse)} fields)",
+                 self._measure(lambda: values_path(sparse), options['repeat'])),
+            ]
+
+            # 两种方式的输出必须一致
+            if list(model_serializer()) != values_path():
+                self.stdout.write(self.style.WARNING("Output of the two paths differs!"))
+
+            transaction.set_rollback(True)
+
+        baseline = results[0][1]
+        self.stdout.write("=" * 60)
+        self.stdout.write(f"{rows} rows, best of {options['repeat']}")
+        for label, seconds in results:
+            self.stdout.write(
+                f"  {label:<30} {seconds * 1000:8.1f} ms  {rows / seconds:10.0f} rows/s  x{baseline / seconds:.1f}"
+            )
+        self.stdout.write("=" * 60)
+
+    def _seed(self, rows):
+        customer = Customer.objects.create(name='Serialization Benchmark')
+        now = timezone.now()
+        DetectionEvent.objects.bulk_create(
+            (
+                DetectionEvent(
+                    customer=customer,
+                    camera_id=f"CAM-{i % 8:02d}",
+                    image=f"detections/cas/00/00/bench{i:06d}.jpg",
+                    image_variants={'thumb': f"variants/thumb/cas/00/00/bench{i:06d}.jpg"} if i % 2 else {},
+                    detections={'violation': 'no_helmet', 'confidence': 0.93},
+                    is_resolved=bool(i % 3),
+                    timestamp=now,
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000,
+        )
+        return customer
+
+    @staticmethod
+    def _measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
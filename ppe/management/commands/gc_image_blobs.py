@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ppe.models import DetectionEvent, ImageBlob
+from ppe.storage import CAS_PREFIX
+
+
+class Command(BaseCommand):
+    help = (
+        "回收内容寻址存储中引用计数为 0 的图片文件"
+        "（--recount 先按事件表重算引用计数，--scan-files 先登记没有记录的文件）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='按 DetectionEvent 实际引用重算 ref_count（修复异常中断导致的计数偏差）',
+        )
+        parser.add_argument(
+            '--scan-files', action='store_true',
+            help='扫描存储目录，回收没有 ImageBlob 记录的文件（保存事件的事务回滚后留下的）',
+        )
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='最近 N 分钟内被引用过的文件暂不回收（默认 60）',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self._recount()
+        if options['scan_files']:
+            adopted = ImageBlob.objects.adopt_orphan_files()
+            self.stdout.write(f"Found {adopted} file(s) without a blob record")
+
+        deleted = ImageBlob.objects.collect_garbage(
+            grace=timedelta(minutes=options['grace_minutes'])
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced blob(s)"))
+
+    def _recount(self):
+        counts = dict(
+            DetectionEvent.objects.filter(image__startswith=CAS_PREFIX)
+            .values('image')
+            .annotate(refs=Count('id'))
+            .values_list('image', 'refs')
+        )
+        fixed = 0
+        for blob in ImageBlob.objects.only('pk', 'name', 'ref_count').iterator():
+            refs = counts.get(blob.name, 0)
+            if blob.ref_count != refs:
+                ImageBlob.objects.filter(pk=blob.pk).update(ref_count=refs)
+                fixed += 1
+        self.stdout.write(f"Recounted references, fixed {fixed} blob(s)")
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ppe.caching import bump_data_version
+from ppe.image_variants import render_variants
+from ppe.models import DetectionEvent
+from ppe.storage import variant_storage
+
+
+class Command(BaseCommand):
+    help = "为还没有缩略图的历史事件补生成 thumb / medium 缩略图"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='并行线程数（默认 4），1 表示依次处理')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的图片数（默认 500）')
+        parser.add_argument('--force', action='store_true', help='已有缩略图的也重新生成并覆盖')
+
+    def handle(self, *args, **options):
+        events = DetectionEvent.objects.exclude(image='')
+        if not options['force']:
+            events = events.filter(image_variants={})
+
+        # 同一个 blob 可能被很多事件引用，按图片去重，每张图只处理一次
+        image_names = events.order_by().values_list('image', flat=True).distinct()
+
+        done = failed = 0
+        batch = []
+        with self._executor(options['workers']) as executor:
+            for name in image_names.iterator():
+                batch.append(name)
+                if len(batch) >= options['batch_size']:
+                    ok, err = self._process(executor, batch, options['force'])
+                    done, failed = done + ok, failed + err
+                    batch = []
+            if batch:
+                ok, err = self._process(executor, batch, options['force'])
+                done, failed = done + ok, failed + err
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {done} image(s), {failed} failed"
+        ))
+
+    def _executor(self, workers):
+        if workers > 1:
+            return ThreadPoolExecutor(max_workers=workers)
+        # 依次处理：在当前线程里执行（共用命令自己的数据库连接），map 与线程池的用法相同
+        return nullcontext(SimpleNamespace(map=map))
+
+    def _process(self, executor, names, force):
+        ok = err = 0
+        render = self._render
+        if isinstance(executor, ThreadPoolExecutor):
+            render = self._in_thread(render)
+        for name, result in zip(names, executor.map(lambda n: render(n, force), names)):
+            if result:
+                ok += 1
+            else:
+                err += 1
+        return ok, err
+
+    def _render(self, name, force):
+        try:
+            variants = render_variants(name, overwrite=force)
+            events = DetectionEvent.objects.filter(image=name)
+            if not force:
+                events = events.filter(image_variants={})
+            rows = list(events.order_by().values_list('customer_id', 'image_variants').distinct())
+            customer_ids = {customer_id for customer_id, _ in rows}
+            events.update(image_variants=variants)
+            # 旧版本在文件名冲突时另存为新名字，这些文件按路径回收不到，在这里删除
+            stale = {n for _, old in rows for n in (old or {}).values()} - set(variants.values())
+            for stale_name in stale:
+                variant_storage.delete(stale_name)
+            # update() 不触发信号，事件列表的 ETag 要靠数据版本号失效
+            for customer_id in customer_ids:
+                bump_data_version(customer_id)
+            return True
+        except Exception as e:
+            self.stderr.write(f"Failed to render variants for {name}: {e}")
+            return False
+
+    @staticmethod
+    def _in_thread(func):
+        """线程池中的线程在任务前后清理失效 / 超时的数据库连接"""
+        def wrapper(*args):
+            close_old_connections()
+            try:
+                return func(*args)
+            finally:
+                close_old_connections()
+        return wrapper
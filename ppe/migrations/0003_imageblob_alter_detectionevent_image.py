@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:03
+
+import django.utils.timezone
+import ppe.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ppe", "0002_detectionevent_person_id_detectionevent_person_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                (
+                    "last_referenced_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Image Blob",
+                "verbose_name_plural": "Image Blobs",
+            },
+        ),
+        migrations.AlterField(
+            model_name="detectionevent",
+            name="image",
+            field=models.ImageField(
+                storage=ppe.storage.detection_image_storage,
+                upload_to="detections/%Y/%m/%d/",
+            ),
+        ),
+    ]
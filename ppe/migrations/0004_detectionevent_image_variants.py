@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ppe", "0003_imageblob_alter_detectionevent_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="detectionevent",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_devicecredential"),
+        ("ppe", "0004_detectionevent_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "-timestamp"], name="ppe_event_cust_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "is_resolved", "-timestamp"],
+                name="ppe_event_cust_res_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "camera_id", "-timestamp"],
+                name="ppe_event_cust_cam_ts_idx",
+            ),
+        ),
+    ]
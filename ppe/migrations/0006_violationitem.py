@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_devicecredential"),
+        ("ppe", "0005_detectionevent_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ViolationItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField()),
+                ("violation_class", models.CharField(max_length=100)),
+                ("confidence", models.FloatField(blank=True, null=True)),
+                ("bbox", models.JSONField(blank=True, null=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="violation_items",
+                        to="core.customer",
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="violation_items",
+                        to="ppe.detectionevent",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Violation Item",
+                "verbose_name_plural": "Violation Items",
+                "indexes": [
+                    models.Index(
+                        fields=["customer", "violation_class", "-timestamp"],
+                        name="ppe_vitem_cust_cls_ts_idx",
+                    ),
+                    models.Index(
+                        fields=["customer", "-timestamp"], name="ppe_vitem_cust_ts_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_devicecredential"),
+        ("ppe", "0006_violationitem"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CameraEventCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("camera_id", models.CharField(max_length=50)),
+                ("total_count", models.BigIntegerField(default=0)),
+                ("unresolved_count", models.BigIntegerField(default=0)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="camera_event_counters",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Camera Event Counter",
+                "verbose_name_plural": "Camera Event Counters",
+                "unique_together": {("customer", "camera_id")},
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyEventRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("camera_id", models.CharField(max_length=50)),
+                ("event_count", models.BigIntegerField(default=0)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hourly_event_rollups",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Hourly Event Rollup",
+                "verbose_name_plural": "Hourly Event Rollups",
+                "unique_together": {("customer", "bucket", "camera_id")},
+            },
+        ),
+    ]
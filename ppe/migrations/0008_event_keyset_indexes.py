@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_devicecredential"),
+        ("ppe", "0007_event_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="detectionevent",
+            options={
+                "ordering": ["-timestamp", "-id"],
+                "verbose_name": "Detection Event",
+                "verbose_name_plural": "Detection Events",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="detectionevent",
+            name="ppe_event_cust_ts_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="detectionevent",
+            name="ppe_event_cust_res_ts_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="detectionevent",
+            name="ppe_event_cust_cam_ts_idx",
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "-timestamp", "-id"], name="ppe_event_cust_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "is_resolved", "-timestamp", "-id"],
+                name="ppe_event_cust_res_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "camera_id", "-timestamp", "-id"],
+                name="ppe_event_cust_cam_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="detectionevent",
+            index=models.Index(
+                fields=["customer", "person_id", "-timestamp", "-id"],
+                name="ppe_event_cust_person_ts_idx",
+            ),
+        ),
+    ]
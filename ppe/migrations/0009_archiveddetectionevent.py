@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_customer_retention_days"),
+        ("ppe", "0008_event_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedDetectionEvent",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("camera_id", models.CharField(max_length=50)),
+                ("timestamp", models.DateTimeField()),
+                ("detections", models.JSONField(default=dict)),
+                ("is_resolved", models.BooleanField(default=False)),
+                ("person_name", models.CharField(default="Unknown", max_length=100)),
+                ("person_id", models.CharField(default="N/A", max_length=50)),
+                ("image_archive", models.CharField(blank=True, max_length=255)),
+                ("image_member", models.CharField(blank=True, max_length=255)),
+                ("image_offset", models.PositiveBigIntegerField(default=0)),
+                ("image_size", models.PositiveBigIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_events",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Detection Event",
+                "verbose_name_plural": "Archived Detection Events",
+                "ordering": ["-timestamp", "-id"],
+                "indexes": [
+                    models.Index(
+                        fields=["customer", "-timestamp", "-id"],
+                        name="ppe_archive_cust_ts_idx",
+                    )
+                ],
+            },
+        ),
+    ]
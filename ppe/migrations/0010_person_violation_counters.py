@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_customer_retention_days"),
+        ("ppe", "0009_archiveddetectionevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersonViolationCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("person_id", models.CharField(max_length=50)),
+                ("month", models.DateField()),
+                ("event_count", models.BigIntegerField(default=0)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="person_violation_counters",
+                        to="core.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Person Violation Counter",
+                "verbose_name_plural": "Person Violation Counters",
+                "indexes": [
+                    models.Index(
+                        fields=["customer", "month", "-event_count"],
+                        name="ppe_person_cnt_month_idx",
+                    )
+                ],
+                "unique_together": {("customer", "person_id", "month")},
+            },
+        ),
+    ]
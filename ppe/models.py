@@ -1,5 +1,45 @@
-from django.db import models
+import os
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
 from core.models import Customer
+from .violations import VIOLATION_CLASS_MAX_LENGTH, extract_violation_items
+from .storage import (
+    CAS_PREFIX, VARIANT_SIZES, content_addressed_storage, detection_image_storage,
+    variant_name, variant_storage,
+)
+
+
+def day_bounds(day):
+    """
+    某一天在当前时区下的时间范围 [start, end)
+    用 timestamp 范围过滤代替 timestamp__date，才能走 (customer, timestamp) 索引
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+class DetectionEventQuerySet(models.QuerySet):
+    """DetectionEvent 的常用查询，条件顺序与复合索引保持一致"""
+
+    def for_customer(self, customer):
+        return self.filter(customer=customer)
+
+    def between(self, start, end):
+        """时间范围 [start, end)"""
+        return self.filter(timestamp__gte=start, timestamp__lt=end)
+
+    def on_date(self, day):
+        """某一天（当前时区）的事件"""
+        return self.between(*day_bounds(day))
+
+    def since_date(self, day):
+        """从某一天（当前时区）零点开始的事件"""
+        return self.filter(timestamp__gte=day_bounds(day)[0])
 
 
 class DetectionEvent(models.Model):
@@ -15,9 +55,12 @@ class DetectionEvent(models.Model):
     # 摄像头编号 (例如 "CAM-01")
     camera_id = models.CharField(max_length=50)
     
-    # 违规抓拍照片
-    image = models.ImageField(upload_to='detections/%Y/%m/%d/')
+    # 违规抓拍照片（内容寻址存储，实际路径为 detections/cas/ab/cd/<sha256>.jpg）
+    image = models.ImageField(upload_to='detections/%Y/%m/%d/', storage=detection_image_storage)
     
+    # 缩略图路径，由后台线程在入库后生成，例如 {'thumb': 'variants/thumb/...jpg'}
+    image_variants = models.JSONField(default=dict, blank=True)
+
     # AI 识别结果 (JSON 格式存储检测框等信息)
     # 例如: {'helmet': false, 'bbox': [10, 10, 100, 100]}
     detections = models.JSONField(default=dict)
@@ -32,10 +75,333 @@ class DetectionEvent(models.Model):
     person_name = models.CharField(max_length=100, default="Unknown", blank=True)
     person_id = models.CharField(max_length=50, default="N/A", blank=True)
 
+    objects = DetectionEventQuerySet.as_manager()
+
     class Meta:
-        ordering = ['-timestamp']
+        # id 作为同一时间戳的决胜字段，游标分页按 (timestamp, id) 翻页
+        ordering = ['-timestamp', '-id']
         verbose_name = 'Detection Event'
         verbose_name_plural = 'Detection Events'
+        # 热点查询都是先按 customer 过滤，再按时间 / 处理状态 / 摄像头 / 人员过滤并按 (时间, id) 倒序
+        indexes = [
+            models.Index(fields=['customer', '-timestamp', '-id'], name='ppe_event_cust_ts_idx'),
+            models.Index(fields=['customer', 'is_resolved', '-timestamp', '-id'], name='ppe_event_cust_res_ts_idx'),
+            models.Index(fields=['customer', 'camera_id', '-timestamp', '-id'], name='ppe_event_cust_cam_ts_idx'),
+            models.Index(fields=['customer', 'person_id', '-timestamp', '-id'], name='ppe_event_cust_person_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.camera_id} - {self.person_name} ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
+
+
+class ViolationItem(models.Model):
+    """违规明细 - 入库时从 detections JSON 拆出的每一条违规，按类型聚合可以直接在 SQL 里做"""
+
+    # 所属事件
+    event = models.ForeignKey(
+        DetectionEvent,
+        on_delete=models.CASCADE,
+        related_name='violation_items'
+    )
+
+    # 冗余字段（与 event 保持一致），让按客户 + 类型 + 时间的聚合只查这一张表
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='violation_items'
+    )
+    timestamp = models.DateTimeField()
+
+    # 违规类型，统一为小写下划线写法 (例如 "no_helmet")，解析时截断到这个长度
+    violation_class = models.CharField(max_length=VIOLATION_CLASS_MAX_LENGTH)
+
+    # 置信度 / 检测框（原始数据里没有时为空）
+    confidence = models.FloatField(null=True, blank=True)
+    bbox = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Violation Item'
+        verbose_name_plural = 'Violation Items'
+        indexes = [
+            models.Index(fields=['customer', 'violation_class', '-timestamp'], name='ppe_vitem_cust_cls_ts_idx'),
+            models.Index(fields=['customer', '-timestamp'], name='ppe_vitem_cust_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.violation_class} (event {self.event_id})"
+
+    @classmethod
+    def build_for_event(cls, event):
+        """根据事件的 detections 生成（未保存的）ViolationItem 列表"""
+        return [
+            cls(
+                event_id=event.pk,
+                customer_id=event.customer_id,
+                timestamp=event.timestamp,
+                **item
+            )
+            for item in extract_violation_items(event.detections)
+        ]
+
+
+class ArchivedDetectionEvent(models.Model):
+    """
+    归档的检测事件 - 超过保留期的事件由 archive_events 命令从 DetectionEvent 移到这里
+    主键沿用原事件 id；图片打包在按天的 tar 文件里，按偏移量直接读取
+    """
+
+    # 原 DetectionEvent 的 id
+    id = models.BigIntegerField(primary_key=True)
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='archived_events'
+    )
+    camera_id = models.CharField(max_length=50)
+    timestamp = models.DateTimeField()
+    detections = models.JSONField(default=dict)
+    is_resolved = models.BooleanField(default=False)
+    person_name = models.CharField(max_length=100, default='Unknown')
+    person_id = models.CharField(max_length=50, default='N/A')
+
+    # 图片所在的 tar 文件（相对 ARCHIVE_ROOT），以及文件数据在 tar 里的偏移量和长度
+    image_archive = models.CharField(max_length=255, blank=True)
+    image_member = models.CharField(max_length=255, blank=True)
+    image_offset = models.PositiveBigIntegerField(default=0)
+    image_size = models.PositiveBigIntegerField(default=0)
+
+    # 归档时间
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-timestamp', '-id']
+        verbose_name = 'Archived Detection Event'
+        verbose_name_plural = 'Archived Detection Events'
+        indexes = [
+            models.Index(fields=['customer', '-timestamp', '-id'], name='ppe_archive_cust_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"[archived] {self.camera_id} - {self.person_name} ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
+
+
+class CameraEventCounter(models.Model):
+    """每个客户每个摄像头的累计事件数 / 未处理数（入库、处理、删除时增量维护）"""
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='camera_event_counters'
+    )
+    camera_id = models.CharField(max_length=50)
+
+    # 累计事件数
+    total_count = models.BigIntegerField(default=0)
+
+    # 未处理事件数
+    unresolved_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['customer', 'camera_id']
+        verbose_name = 'Camera Event Counter'
+        verbose_name_plural = 'Camera Event Counters'
+
+    def __str__(self):
+        return f"{self.customer_id} / {self.camera_id}: {self.total_count} ({self.unresolved_count} unresolved)"
+
+
+class HourlyEventRollup(models.Model):
+    """按小时 + 摄像头汇总的事件数（dashboard 趋势图读这里，行数只随时间增长，与事件量无关）"""
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='hourly_event_rollups'
+    )
+
+    # 小时的起点 (UTC，例如 2026-01-21 08:00)
+    bucket = models.DateTimeField()
+    camera_id = models.CharField(max_length=50)
+
+    # 该小时内的事件数
+    event_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['customer', 'bucket', 'camera_id']
+        verbose_name = 'Hourly Event Rollup'
+        verbose_name_plural = 'Hourly Event Rollups'
+
+    def __str__(self):
+        return f"{self.customer_id} / {self.camera_id} @ {self.bucket:%Y-%m-%d %H:00}: {self.event_count}"
+
+
+class PersonViolationCounter(models.Model):
+    """每个人每月的违规次数（入库、删除时增量维护），"本月违规最多的人" 直接按索引取前 N 行"""
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='person_violation_counters'
+    )
+    person_id = models.CharField(max_length=50)
+
+    # 月份的第一天（本地时间，例如 2026-10-01）
+    month = models.DateField()
+
+    # 该月的事件数
+    event_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['customer', 'person_id', 'month']
+        verbose_name = 'Person Violation Counter'
+        verbose_name_plural = 'Person Violation Counters'
+        indexes = [
+            models.Index(fields=['customer', 'month', '-event_count'], name='ppe_person_cnt_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} / {self.person_id} @ {self.month:%Y-%m}: {self.event_count}"
+
+
+class ImageBlobManager(models.Manager):
+    """ImageBlob 的引用计数操作"""
+
+    def retain(self, name, size=0):
+        """增加一次引用；文件第一次出现时创建记录"""
+        now = timezone.now()
+        updated = self.filter(name=name).update(
+            ref_count=F('ref_count') + 1,
+            last_referenced_at=now,
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, size=size, ref_count=1, last_referenced_at=now)
+        except IntegrityError:
+            # 并发上传同一张图，别人先建好了记录
+            self.filter(name=name).update(
+                ref_count=F('ref_count') + 1,
+                last_referenced_at=now,
+            )
+
+    def release(self, name):
+        """减少一次引用（不会减到负数）"""
+        self.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    def release_for_events(self, events):
+        """
+        一条 UPDATE 释放一批事件的图片引用（同一文件被引用几次就减几次，不会减到负数）
+        用于删除客户等大批量删除，不逐行处理
+        """
+        counts = (
+            events.filter(image__startswith=CAS_PREFIX)
+            .values('image').annotate(refs=Count('id')).order_by()
+        )
+        refs = Subquery(counts.filter(image=OuterRef('name')).values('refs')[:1])
+        return self.filter(name__in=counts.values('image')).update(
+            ref_count=Greatest(F('ref_count') - refs, Value(0))
+        )
+
+    def adopt_orphan_files(self, batch_size=1000):
+        """
+        为磁盘上没有 ImageBlob 记录的文件补建记录（按事件表计引用数，最近引用时间取文件修改时间），没有引用的由 collect_garbage 回收
+        retain() 在保存事件的事务里执行，事务回滚后记录随之消失、文件却留在磁盘上，只能靠扫描文件找回
+        Returns:
+            int: 补建的记录数
+        """
+        root = content_addressed_storage.path(CAS_PREFIX)
+        adopted = 0
+        batch = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue  # 正在写入的临时文件
+                path = os.path.join(directory, filename)
+                batch[CAS_PREFIX + os.path.relpath(path, root).replace(os.sep, '/')] = path
+                if len(batch) >= batch_size:
+                    adopted += self._adopt(batch)
+                    batch = {}
+        if batch:
+            adopted += self._adopt(batch)
+        return adopted
+
+    def _adopt(self, paths):
+        known = set(self.filter(name__in=list(paths)).values_list('name', flat=True))
+        # 仍被事件引用的文件（例如记录被误删）按实际引用数登记，不会被回收
+        refs = dict(
+            DetectionEvent.objects.filter(image__in=[name for name in paths if name not in known])
+            .values('image').annotate(refs=Count('id')).order_by()
+            .values_list('image', 'refs')
+        )
+        blobs = []
+        for name, path in paths.items():
+            if name in known:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            blobs.append(self.model(
+                name=name, size=stat.st_size, ref_count=refs.get(name, 0),
+                last_referenced_at=datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+            ))
+        # 并发上传刚登记了同一个文件时跳过（等它的事务结束后唯一约束冲突）
+        self.bulk_create(blobs, ignore_conflicts=True)
+        return len(blobs)
+
+    def collect_garbage(self, names=None, grace=timedelta(0)):
+        """
+        回收引用计数为 0 的文件
+        Args:
+            names: 只检查这些文件；None 表示全表扫描
+            grace: 最近 grace 时间内还被引用过的文件暂不回收
+        Returns:
+            int: 删除的文件数
+        """
+        candidates = self.filter(
+            ref_count=0,
+            last_referenced_at__lte=timezone.now() - grace,
+        )
+        if names is not None:
+            candidates = candidates.filter(name__in=names)
+
+        deleted = 0
+        for pk in candidates.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                # 行锁：与 retain() 的 UPDATE 互斥，锁住后再确认一次计数
+                blob = self.select_for_update().filter(pk=pk, ref_count=0).first()
+                if blob is None:
+                    continue
+                content_addressed_storage.delete(blob.name)
+                for variant in VARIANT_SIZES:
+                    variant_storage.delete(variant_name(blob.name, variant))
+                blob.delete()
+                deleted += 1
+        return deleted
+
+
+class ImageBlob(models.Model):
+    """内容寻址存储中的图片文件 - 相同字节只存一份，按引用计数回收"""
+
+    # 存储路径，例如 detections/cas/ab/cd/abcd....jpg
+    name = models.CharField(max_length=255, unique=True)
+
+    # 文件大小（字节）
+    size = models.PositiveBigIntegerField(default=0)
+
+    # 引用该文件的 DetectionEvent 数量
+    ref_count = models.PositiveIntegerField(default=0)
+
+    # 最近一次被引用的时间
+    last_referenced_at = models.DateTimeField(default=timezone.now)
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        verbose_name = 'Image Blob'
+        verbose_name_plural = 'Image Blobs'
+
+    def __str__(self):
+        return f"{self.name} (refs: {self.ref_count})"
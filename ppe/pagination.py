@@ -0,0 +1,97 @@
+"""
+事件列表的游标（keyset）分页
+按 (timestamp, id) 倒序翻页，下一页的条件是"比上一页最后一条更早"，
+不用 OFFSET，翻到第几页都只扫描一页的索引范围。
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class EventCursorPagination(BasePagination):
+    """
+    游标分页，响应格式: {"results": [...], "next": "<下一页 URL 或 null>"}
+    - ?cursor=   上一页返回的游标
+    - ?page_size= 每页条数（默认 50，最多 200）
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by('-timestamp', '-id')
+        if position is not None:
+            timestamp, pk = position
+            # timestamp <= t 走索引范围扫描；同一时间戳再用 id 排除已返回的行
+            queryset = queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, pk__gte=pk)
+
+        # 多取一条判断是否还有下一页
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    @staticmethod
+    def get_position(row):
+        """(timestamp, id)，支持模型实例和 .values() 返回的 dict"""
+        if isinstance(row, dict):
+            return row['timestamp'], row['id']
+        return row.timestamp, row.pk
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            timestamp, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode_cursor(position):
+        timestamp, pk = position
+        raw = f"{timestamp.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'next': self.get_next_link(),
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'results': schema,
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            },
+        }
@@ -0,0 +1,120 @@
+"""
+Dashboard 汇总表维护
+CameraEventCounter / HourlyEventRollup / PersonViolationCounter 在事件入库、处理、删除时增量更新，
+dashboard、人员排行只读这几张小表，耗时不随 DetectionEvent 的行数增长。
+- 增量更新在调用方的事务里执行，事件写入失败时汇总一起回滚
+- 对不上时（批量 SQL 修改、历史数据）用 rebuild_event_rollups 命令从原始事件重建
+"""
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CameraEventCounter, HourlyEventRollup, PersonViolationCounter
+
+# 未识别身份的事件（person_id 为默认值）不计入人员统计
+UNKNOWN_PERSON_IDS = ('', 'N/A')
+
+
+def hour_bucket(ts):
+    """事件时间所在小时的起点"""
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def month_bucket(ts):
+    """事件时间所在月份的第一天（本地时间）"""
+    return timezone.localdate(ts).replace(day=1)
+
+
+def _bump(model, keys, **deltas):
+    """
+    计数 upsert: 先 UPDATE col = col + delta，没有行再 INSERT
+    并发插入同一行时唯一约束冲突，回退到 UPDATE
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        model.objects.filter(**keys).update(**updates)
+
+
+def snapshot(event):
+    """
+    事件中影响汇总的字段 (customer_id, camera_id, is_resolved, timestamp, person_id)
+    字段被 defer 时返回 None（这种实例不参与增量维护）
+    """
+    values = event.__dict__
+    keys = ('customer_id', 'camera_id', 'is_resolved', 'timestamp', 'person_id')
+    if any(values.get(key) is None for key in keys):
+        return None
+    return tuple(values[key] for key in keys)
+
+
+def apply(state, sign=1):
+    """把一个事件状态计入（sign=1）或移出（sign=-1）汇总"""
+    customer_id, camera_id, is_resolved, timestamp, person_id = state
+    with transaction.atomic():
+        _bump(
+            CameraEventCounter,
+            {'customer_id': customer_id, 'camera_id': camera_id},
+            total_count=sign,
+            unresolved_count=0 if is_resolved else sign,
+        )
+        _bump(
+            HourlyEventRollup,
+            {'customer_id': customer_id, 'bucket': hour_bucket(timestamp), 'camera_id': camera_id},
+            event_count=sign,
+        )
+        if person_id not in UNKNOWN_PERSON_IDS:
+            _bump(
+                PersonViolationCounter,
+                {'customer_id': customer_id, 'person_id': person_id, 'month': month_bucket(timestamp)},
+                event_count=sign,
+            )
+
+
+def apply_change(old_state, new_state):
+    """已有事件被修改：只改了处理状态时调整未处理数，否则移出旧状态再计入新状态"""
+    if old_state == new_state:
+        return
+    if old_state is None or new_state is None:
+        return
+    if old_state[:2] == new_state[:2] and old_state[3:] == new_state[3:]:
+        adjust_unresolved(old_state[0], old_state[1], -1 if new_state[2] else 1)
+        return
+    with transaction.atomic():
+        apply(old_state, sign=-1)
+        apply(new_state)
+
+
+def adjust_unresolved(customer_id, camera_id, delta):
+    """处理 / 重新打开事件时调整未处理数"""
+    _bump(
+        CameraEventCounter,
+        {'customer_id': customer_id, 'camera_id': camera_id},
+        total_count=0,
+        unresolved_count=delta,
+    )
+
+
+def stats_delta(old_state, new_state):
+    """
+    事件状态变化对 dashboard 统计的影响，用于实时推送
+    Returns:
+        [{'camera_id', 'date', 'total', 'unresolved'}, ...]（已合并，不含全 0 的项）
+    """
+    changes = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        _, camera_id, is_resolved, timestamp, _ = state
+        key = (camera_id, timezone.localdate(timestamp).isoformat())
+        total, unresolved = changes.get(key, (0, 0))
+        changes[key] = (total + sign, unresolved + (0 if is_resolved else sign))
+    return [
+        {'camera_id': camera_id, 'date': date, 'total': total, 'unresolved': unresolved}
+        for (camera_id, date), (total, unresolved) in changes.items()
+        if total or unresolved
+    ]
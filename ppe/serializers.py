@@ -1,12 +1,172 @@
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
-from .models import DetectionEvent
+from .models import DetectionEvent, ArchivedDetectionEvent
+from .storage import VARIANT_SIZES, variant_storage
 
 
 class DetectionEventSerializer(serializers.ModelSerializer):
     """检测事件序列化器"""
-    
+
+    # 缩略图 URL: {'thumb': ..., 'medium': ...}；还没生成时回退到原图
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = DetectionEvent
         fields = '__all__'
         # customer 字段只读，由后台自动设置，防止前端篡改
         read_only_fields = ('customer',)
+
+    def get_image_variants(self, obj):
+        if not obj.image:
+            return {}
+        request = self.context.get('request')
+        variants = {}
+        for variant in VARIANT_SIZES:
+            name = obj.image_variants.get(variant)
+            url = variant_storage.url(name) if name else obj.image.url
+            variants[variant] = request.build_absolute_uri(url) if request else url
+        return variants
+
+
+class BulkResolveSerializer(serializers.Serializer):
+    """
+    批量处理事件的请求参数：ids 或过滤条件（camera_id / person_id / since / until）至少提供一项
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    camera_id = serializers.CharField(max_length=50, required=False)
+    person_id = serializers.CharField(max_length=50, required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    # true: 标记为已处理；false: 重新打开
+    is_resolved = serializers.BooleanField(default=True)
+
+    FILTER_FIELDS = ('ids', 'camera_id', 'person_id', 'since', 'until')
+
+    def validate(self, attrs):
+        if not any(attrs.get(f) for f in self.FILTER_FIELDS):
+            raise serializers.ValidationError(
+                'Provide ids or at least one filter (camera_id, person_id, since, until).'
+            )
+        return attrs
+
+    def filter(self, queryset):
+        data = self.validated_data
+        if data.get('ids'):
+            queryset = queryset.filter(pk__in=data['ids'])
+        for field in ('camera_id', 'person_id'):
+            if data.get(field):
+                queryset = queryset.filter(**{field: data[field]})
+        if data.get('since'):
+            queryset = queryset.filter(timestamp__gte=data['since'])
+        if data.get('until'):
+            queryset = queryset.filter(timestamp__lt=data['until'])
+        return queryset
+
+
+class ArchivedDetectionEventSerializer(serializers.ModelSerializer):
+    """归档事件序列化器（图片从按天的 tar 中读取，URL 指向归档图片接口）"""
+
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedDetectionEvent
+        fields = (
+            'id', 'camera_id', 'image', 'detections', 'timestamp', 'is_resolved',
+            'person_name', 'person_id', 'archived_at',
+        )
+
+    def get_image(self, obj):
+        if not obj.image_archive:
+            return None
+        url = reverse('archived-event-image', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class DetectionEventRowSerializer:
+    """
+    事件列表的快速路径：直接序列化 .values() 查出的 dict，不创建模型实例、不走 DRF 字段
+    输出与 DetectionEventSerializer 一致；fields 指定时只返回这些字段（?fields=id,camera_id）
+    """
+
+    # 输出字段 -> 需要查询的列（顺序与 DetectionEventSerializer 一致）
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'image_variants': ('image', 'image_variants'),
+        'camera_id': ('camera_id',),
+        'image': ('image',),
+        'detections': ('detections',),
+        'timestamp': ('timestamp',),
+        'is_resolved': ('is_resolved',),
+        'person_name': ('person_name',),
+        'person_id': ('person_id',),
+        'customer': ('customer_id',),
+    }
+
+    # 游标分页需要的列，总是查询
+    CURSOR_COLUMNS = ('id', 'timestamp')
+
+    def __init__(self, request=None, fields=None):
+        if fields:
+            unknown = [f for f in fields if f not in self.FIELD_COLUMNS]
+            if unknown:
+                raise serializers.ValidationError({'fields': [f"Unknown field(s): {', '.join(unknown)}"]})
+            self.fields = [f for f in self.FIELD_COLUMNS if f in fields]
+        else:
+            self.fields = list(self.FIELD_COLUMNS)
+
+        columns = list(self.CURSOR_COLUMNS)
+        for field in self.fields:
+            columns.extend(c for c in self.FIELD_COLUMNS[field] if c not in columns)
+        self.columns = columns
+
+        # URL 前缀每个请求只算一次，逐行只做字符串拼接
+        image_storage = DetectionEvent._meta.get_field('image').storage
+        self.image_base = self._absolute(request, image_storage.base_url)
+        self.variant_base = self._absolute(request, variant_storage.base_url)
+
+    @staticmethod
+    def _absolute(request, url):
+        return request.build_absolute_uri(url) if request else url
+
+    def _timestamp(self, value):
+        # 与 DRF DateTimeField 的输出格式一致
+        value = timezone.localtime(value).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    def _image(self, row):
+        name = row['image']
+        return self.image_base + filepath_to_uri(name) if name else None
+
+    def _image_variants(self, row):
+        if not row['image']:
+            return {}
+        stored = row['image_variants'] or {}
+        variants = {}
+        for variant in VARIANT_SIZES:
+            name = stored.get(variant)
+            variants[variant] = self.variant_base + filepath_to_uri(name) if name else self._image(row)
+        return variants
+
+    def to_representation(self, row):
+        data = {}
+        for field in self.fields:
+            if field == 'image_variants':
+                data[field] = self._image_variants(row)
+            elif field == 'image':
+                data[field] = self._image(row)
+            elif field == 'timestamp':
+                data[field] = self._timestamp(row['timestamp'])
+            elif field == 'customer':
+                data[field] = row['customer_id']
+            else:
+                data[field] = row[field]
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
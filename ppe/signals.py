@@ -0,0 +1,145 @@
+"""
+ppe 应用的信号处理
+"""
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from core.models import Customer
+
+from . import archive, image_variants, rollups
+from .caching import bump_data_version
+from .live_feed import broker
+from .models import DetectionEvent, ImageBlob, ViolationItem
+from .serializers import DetectionEventRowSerializer
+from .storage import is_content_addressed
+
+
+@receiver(post_init, sender=DetectionEvent)
+def remember_original_state(sender, instance, **kwargs):
+    """记录加载时的图片路径和汇总字段，保存时用来判断哪些内容被修改"""
+    instance._original_image_name = _image_name(instance)
+    instance._original_rollup_state = rollups.snapshot(instance)
+
+
+@receiver(post_save, sender=DetectionEvent)
+def release_replaced_image(sender, instance, created, **kwargs):
+    """图片被替换（例如后台重新上传）时，释放旧图片的引用"""
+    old_name = getattr(instance, '_original_image_name', '')
+    new_name = _image_name(instance)
+    if not created and old_name != new_name and is_content_addressed(old_name):
+        _release(old_name)
+    instance._original_image_name = new_name
+
+
+@receiver(post_save, sender=DetectionEvent)
+def schedule_image_variants(sender, instance, created, **kwargs):
+    """新事件提交后，后台生成缩略图"""
+    if created and _image_name(instance):
+        transaction.on_commit(lambda: image_variants.schedule(instance.pk))
+
+
+@receiver(post_save, sender=DetectionEvent)
+def sync_violation_items(sender, instance, created, update_fields=None, **kwargs):
+    """入库时把 detections 拆成 ViolationItem；之后 detections 被修改则重建"""
+    if not created:
+        if update_fields is not None and 'detections' not in update_fields:
+            return
+        ViolationItem.objects.filter(event_id=instance.pk).delete()
+    ViolationItem.objects.bulk_create(ViolationItem.build_for_event(instance))
+
+
+@receiver(post_save, sender=DetectionEvent)
+def update_rollups(sender, instance, created, **kwargs):
+    """入库计入汇总表；处理状态 / 摄像头 / 时间被修改时调整汇总"""
+    new_state = rollups.snapshot(instance)
+    if created:
+        old_state = None
+        if new_state is not None:
+            rollups.apply(new_state)
+    else:
+        old_state = getattr(instance, '_original_rollup_state', None)
+        if old_state is None:
+            # 加载时字段被 defer，无法计算增量
+            new_state = None
+        rollups.apply_change(old_state, new_state)
+    instance._original_rollup_state = rollups.snapshot(instance)
+    _publish_stats(instance.customer_id, rollups.stats_delta(old_state, new_state))
+
+
+@receiver(post_delete, sender=DetectionEvent)
+def remove_from_rollups(sender, instance, origin=None, **kwargs):
+    """
+    事件删除时从汇总表移出；删除客户时汇总行会被级联删除，不再回写
+    归档不算删除：归档的事件仍计入汇总（未处理数由 archive.archive_batch 批量扣减）
+    """
+    if _customer_deleted(origin) or archive.is_archiving():
+        return
+    state = rollups.snapshot(instance)
+    if state is not None:
+        rollups.apply(state, sign=-1)
+        _publish_stats(instance.customer_id, rollups.stats_delta(state, None))
+
+
+@receiver(post_save, sender=DetectionEvent)
+def publish_new_event(sender, instance, created, **kwargs):
+    """新事件提交后推送给正在查看的页面（格式与事件列表接口一致，图片为相对 URL）"""
+    if not created:
+        return
+    row_serializer = DetectionEventRowSerializer()
+    row = {column: getattr(instance, column) for column in row_serializer.columns}
+    row['image'] = _image_name(instance)
+    data = row_serializer.to_representation(row)
+    customer_id = instance.customer_id
+    transaction.on_commit(lambda: broker.publish(customer_id, 'event', data))
+
+
+@receiver(post_save, sender=DetectionEvent)
+@receiver(post_delete, sender=DetectionEvent)
+def bump_customer_data_version(sender, instance, origin=None, **kwargs):
+    """事件入库 / 修改 / 删除提交后递增客户的数据版本号，dashboard 等缓存随之失效"""
+    if _customer_deleted(origin):
+        return
+    customer_id = instance.customer_id
+    transaction.on_commit(lambda: bump_data_version(customer_id))
+
+
+@receiver(post_delete, sender=DetectionEvent)
+def release_deleted_image(sender, instance, origin=None, **kwargs):
+    """事件删除（含批量清理）时释放图片引用，引用归零立即回收文件；删除客户时见 release_customer_images"""
+    if _customer_deleted(origin):
+        return
+    name = _image_name(instance)
+    if is_content_addressed(name):
+        _release(name)
+
+
+@receiver(pre_delete, sender=Customer)
+def release_customer_images(sender, instance, **kwargs):
+    """删除客户前一次性释放其全部事件的图片引用（级联删除事件时不再逐行释放），提交后回收"""
+    if ImageBlob.objects.release_for_events(DetectionEvent.objects.filter(customer=instance)):
+        transaction.on_commit(ImageBlob.objects.collect_garbage)
+
+
+def _customer_deleted(origin):
+    """
+    删除是否由删除客户引起（post_delete 的 origin 是发起删除的对象或 QuerySet）
+    这时汇总表、数据版本号、实时推送都随客户一起作废，不需要逐行处理
+    """
+    return isinstance(origin, Customer) or getattr(origin, 'model', None) is Customer
+
+
+def _image_name(instance):
+    """读取图片路径；字段被 defer 时返回空串，不触发额外查询"""
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or ''
+
+
+def _publish_stats(customer_id, delta):
+    if delta:
+        transaction.on_commit(lambda: broker.publish(customer_id, 'stats', {'changes': delta}))
+
+
+def _release(name):
+    ImageBlob.objects.release(name)
+    transaction.on_commit(lambda: ImageBlob.objects.collect_garbage(names=[name]))
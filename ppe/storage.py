@@ -0,0 +1,117 @@
+"""
+内容寻址图片存储
+DetectionEvent 的抓拍图片按内容的 SHA-256 命名，相同字节只存一份：
+- 路径按哈希前缀分片: detections/cas/ab/cd/abcd....jpg，单个目录不会堆积几十万文件
+- 每个文件在 ImageBlob 表里有一条引用计数，事件删除时释放，计数归零后回收
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+CAS_PREFIX = 'detections/cas/'
+
+# 缩略图规格: 名称 -> 最大边长 (宽, 高)
+VARIANT_SIZES = {
+    'thumb': (320, 320),
+    'medium': (960, 960),
+}
+
+
+def blob_name(digest, ext):
+    """根据内容哈希生成分片后的存储路径"""
+    return f"{CAS_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_content_addressed(name):
+    """是否为内容寻址存储中的文件（老数据仍在 detections/YYYY/MM/DD/ 下）"""
+    return bool(name) and name.startswith(CAS_PREFIX)
+
+
+def variant_name(image_name, variant):
+    """
+    原图对应的缩略图路径，例如
+    detections/cas/ab/cd/abcd.png -> variants/thumb/cas/ab/cd/abcd.jpg
+    同一个 blob 的缩略图也只生成一份
+    """
+    base = os.path.splitext(image_name)[0]
+    if base.startswith('detections/'):
+        base = base[len('detections/'):]
+    return f"variants/{variant}/{base}.jpg"
+
+
+class FixedNameStorage(FileSystemStorage):
+    """
+    文件名由调用方决定的存储：同名时覆盖，不改名避让
+    写临时文件再 os.replace，并发写同一个文件也不会读到半个文件
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        self._write_atomic(name, content)
+        return name
+
+    def _write_atomic(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class ContentAddressedStorage(FixedNameStorage):
+    """
+    按内容哈希命名的文件存储（同名即同内容，已存在时不再写入）
+    upload_to 生成的目录会被忽略，只保留原文件的扩展名。
+    """
+
+    def _save(self, name, content):
+        from .models import ImageBlob
+
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        ext = os.path.splitext(name)[1].lower() or '.jpg'
+        name = blob_name(digest.hexdigest(), ext)
+
+        # 先登记引用再落盘：与 collect_garbage 的行锁配合，
+        # 保证不会出现"刚确认文件存在就被回收"的竞争
+        ImageBlob.objects.retain(name, size)
+
+        if not self.exists(name):
+            self._write_atomic(name, content)
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+# 缩略图是派生文件，路径由原图决定：总是写到这个路径（重新生成时覆盖），回收原图时按路径删除
+variant_storage = FixedNameStorage()
+
+
+def detection_image_storage():
+    """DetectionEvent.image 使用的存储（callable，迁移文件里只记录引用）"""
+    return content_addressed_storage
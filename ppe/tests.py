@@ -1,3 +1,1409 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Customer, DeviceCredential, GeneratedReport, UserProfile, Module, Subscription
+from core.utils.notification_service import NotificationService
+from core.utils.report_generator import generate_daily_report, generate_report
+from . import image_variants, live_feed
+from .archive import DayArchive
+from .caching import bump_data_version, get_data_version
+from .models import (
+    DetectionEvent, ArchivedDetectionEvent, CameraEventCounter, HourlyEventRollup, ImageBlob,
+    PersonViolationCounter, ViolationItem, day_bounds,
+)
+from .serializers import DetectionEventSerializer
+from .storage import VARIANT_SIZES, variant_name, variant_storage
+from .violations import VIOLATION_CLASS_MAX_LENGTH, extract_violation_items
+
+
+def asgi_get(client, path, query_string='', on_body=None):
+    """
+    经 ASGIHandler 发送 GET（带上 client 的登录 cookie），返回响应的各个 body 块；on_body 在每块发出时调用
+    直接调用 handle()，跳过 __call__ 的 ThreadSensitiveContext：sync_to_async 回到测试线程，查询在测试事务里执行
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'query_string': query_string.encode(),
+        'headers': [(b'host', b'testserver'), (b'cookie', client.cookies.output(header='', sep=';').strip().encode())],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+    received = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # 客户端不断开
+        await asyncio.Event().wait()
+
+    chunks = []
+
+    async def send(message):
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if on_body is not None:
+                on_body(message['body'])
+            chunks.append(message['body'])
+
+    async_to_sync(ASGIHandler().handle)(scope, receive, send)
+    return chunks
+
+
+class QueryPlanTests(TestCase):
+    """
+    热点查询的执行计划回归测试
+    对种子数据跑 dashboard / 列表 / 报告，对其中每条查询 ppe_ 表的 SELECT 执行 EXPLAIN，
+    出现全表扫描、或按时间倒序却需要额外排序时失败（说明查询用不上复合索引了）。
+    """
+
+    CAMERAS = ['CAM-01', 'CAM-02', 'CAM-03', 'CAM-04']
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.customers = [Customer.objects.create(name=f"Customer {i}") for i in range(4)]
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+
+        events = []
+        for c_idx, customer in enumerate(cls.customers):
+            Subscription.objects.create(
+                customer=customer, module=ppe, expiration_date=now + timedelta(days=30)
+            )
+            for i in range(300):
+                events.append(DetectionEvent(
+                    customer=customer,
+                    camera_id=cls.CAMERAS[i % len(cls.CAMERAS)],
+                    image=f"detections/cas/00/00/{c_idx:02d}{i:04d}.jpg",
+                    detections={'violation': 'no_helmet'},
+                    is_resolved=(i % 3 == 0),
+                    person_id=f"P{i % 20:03d}",
+                ))
+        DetectionEvent.objects.bulk_create(events)
+
+        # timestamp 是 auto_now_add，批量写入后再分散到过去 30 天
+        for offset, pk in enumerate(DetectionEvent.objects.values_list('pk', flat=True)):
+            DetectionEvent.objects.filter(pk=pk).update(
+                timestamp=now - timedelta(hours=offset % (30 * 24))
+            )
+        # bulk_create / update() 不触发信号，从原始事件重建汇总表
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+
+        cls.customer = cls.customers[0]
+        cls.user = User.objects.create_user('operator', password='pass-1234')
+        UserProfile.objects.create(user=cls.user, customer=cls.customer)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'mysql':
+                cursor.execute(f'ANALYZE TABLE {DetectionEvent._meta.db_table}')
+
+    def _explain(self, sql):
+        """
+        返回 (全表扫描的表名列表, 是否额外排序)
+        额外排序说明 ORDER BY timestamp 没有用上 (customer, ..., timestamp) 索引
+        """
+        full_scans = []
+        sorts = False
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    match = re.match(r'SCAN (\w+)', row[-1])
+                    if match:
+                        full_scans.append(match.group(1))
+                    sorts = sorts or bool(re.search(r'TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY', row[-1]))
+            elif connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}')
+                columns = [col[0] for col in cursor.description]
+                for row in cursor.fetchall():
+                    plan = dict(zip(columns, row))
+                    if plan['type'] in ('ALL', 'index'):
+                        full_scans.append(plan['table'])
+                    sorts = sorts or 'filesort' in (plan.get('Extra') or '')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                for (line,) in cursor.fetchall():
+                    match = re.search(r'Seq Scan on (\w+)', line)
+                    if match:
+                        full_scans.append(match.group(1))
+                    sorts = sorts or bool(re.search(r'->\s+Sort|^Sort', line.strip()))
+        return full_scans, sorts
+
+    def assertNoFullScans(self, captured_queries):
+        checked = 0
+        for query in captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or 'ppe_' not in sql:
+                continue
+            checked += 1
+            full_scans, sorts = self._explain(sql)
+            scanned = [t for t in full_scans if t.startswith('ppe_')]
+            self.assertEqual(scanned, [], f"Full table scan on {scanned}:\n{sql}")
+            if re.search(r'ORDER BY \S*timestamp\S* DESC', sql):
+                self.assertFalse(sorts, f"ORDER BY timestamp is not served by an index:\n{sql}")
+        self.assertGreater(checked, 0, 'No ppe queries were captured')
+
+    def test_dashboard_queries_use_indexes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(ctx.captured_queries)
+
+    def test_event_list_queries_use_indexes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/ppe/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(ctx.captured_queries)
+
+    def test_filtered_event_queries_use_indexes(self):
+        events = DetectionEvent.objects.for_customer(self.customer)
+        querysets = [
+            events.filter(is_resolved=False),
+            events.filter(camera_id='CAM-02'),
+            events.filter(person_id='P007'),
+            events.since_date(timezone.now().date() - timedelta(days=6)),
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            for qs in querysets:
+                list(qs[:50])
+        self.assertNoFullScans(ctx.captured_queries)
+
+    def test_event_list_pages_use_indexes(self):
+        since = (timezone.now() - timedelta(days=10)).isoformat()
+        urls = [
+            '/api/v1/ppe/events/?page_size=20',
+            '/api/v1/ppe/events/?page_size=20&camera_id=CAM-03',
+            '/api/v1/ppe/events/?page_size=20&is_resolved=false',
+            '/api/v1/ppe/events/?page_size=10&person_id=P011',
+            '/api/v1/ppe/events/?' + urlencode({'page_size': 20, 'since': since}),
+        ]
+        for url in urls:
+            # 第二页带游标，检查 keyset 条件同样走索引
+            next_url = self.client.get(url).json()['next']
+            self.assertIsNotNone(next_url, url)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNoFullScans(ctx.captured_queries)
+
+    def test_cursor_pagination_walks_every_event_once(self):
+        # 制造相同时间戳，验证 id 决胜
+        DetectionEvent.objects.for_customer(self.customer).filter(camera_id='CAM-01').update(
+            timestamp=timezone.now() - timedelta(days=1)
+        )
+        seen = []
+        url = '/api/v1/ppe/events/?page_size=35'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 35)
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+
+        expected = list(
+            DetectionEvent.objects.for_customer(self.customer)
+            .order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/v1/ppe/events/?is_resolved=maybe').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/ppe/events/?since=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/ppe/events/?cursor=@@@').status_code, 404)
+
+    @mock.patch('core.utils.report_generator._generate_report_with_llm', return_value=None)
+    def test_daily_report_queries_use_indexes(self, _llm):
+        with CaptureQueriesContext(connection) as ctx:
+            report = generate_daily_report(self.customer)
+        self.assertIn('Daily Safety Report', report)
+        self.assertNoFullScans(ctx.captured_queries)
+
+
+class RollupTests(TestCase):
+    """汇总表的增量维护结果必须与 rebuild_event_rollups 从原始事件重算的结果一致"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Rollup Co')
+
+    def _rollups(self):
+        counters = sorted(
+            CameraEventCounter.objects.filter(customer=self.customer, total_count__gt=0)
+            .values_list('camera_id', 'total_count', 'unresolved_count')
+        )
+        buckets = sorted(
+            HourlyEventRollup.objects.filter(customer=self.customer, event_count__gt=0)
+            .values_list('bucket', 'camera_id', 'event_count')
+        )
+        return counters, buckets
+
+    def test_incremental_rollups_match_rebuild(self):
+        events = [
+            DetectionEvent.objects.create(
+                customer=self.customer, camera_id=camera, image='detections/x.jpg'
+            )
+            for camera in ['CAM-01', 'CAM-01', 'CAM-02', 'CAM-03']
+        ]
+        events[0].is_resolved = True
+        events[0].save()
+        events[1].camera_id = 'CAM-02'
+        events[1].timestamp -= timedelta(days=2)
+        events[1].save()
+        events[2].delete()
+
+        incremental = self._rollups()
+        self.assertEqual(
+            incremental[0],
+            [('CAM-01', 1, 0), ('CAM-02', 1, 1), ('CAM-03', 1, 1)],
+        )
+
+        call_command('rebuild_event_rollups', customer=[self.customer.pk], stdout=io.StringIO())
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_deleting_customer_drops_rollups(self):
+        DetectionEvent.objects.create(
+            customer=self.customer, camera_id='CAM-01', image='detections/x.jpg', person_id='P-001'
+        )
+        customer_id = self.customer.pk
+        self.customer.delete()
+        for model in (CameraEventCounter, HourlyEventRollup, PersonViolationCounter):
+            self.assertFalse(model.objects.filter(customer_id=customer_id).exists())
+
+    def test_deleting_customer_releases_images_in_bulk(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        other = Customer.objects.create(name='Other Co')
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            events = []
+            for customer, payload in [
+                (self.customer, b'shared'), (self.customer, b'shared'), (self.customer, b'own'), (other, b'shared'),
+            ]:
+                event = DetectionEvent(customer=customer, camera_id='CAM-01')
+                event.image.save('capture.jpg', ContentFile(payload))
+                events.append(event)
+            shared, own = events[0].image.name, events[2].image.name
+            self.assertEqual(ImageBlob.objects.get(name=shared).ref_count, 3)
+
+            with CaptureQueriesContext(connection) as ctx:
+                self.customer.delete()
+        blob_table = connection.ops.quote_name(ImageBlob._meta.db_table)
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith(f'UPDATE {blob_table}')]), 1)
+        self.assertEqual(ImageBlob.objects.get(name=shared).ref_count, 1)
+        self.assertFalse(ImageBlob.objects.filter(name=own).exists())
+
+    def test_dashboard_reads_rollups(self):
+        user = User.objects.create_user('viewer', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        for camera in ['CAM-01', 'CAM-01', 'CAM-02']:
+            DetectionEvent.objects.create(customer=self.customer, camera_id=camera, image='detections/x.jpg')
+
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/v1/ppe/dashboard/').json()
+        event_table = connection.ops.quote_name(DetectionEvent._meta.db_table)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if event_table in q['sql']],
+            'Dashboard should not query the event table',
+        )
+        self.assertEqual(data['total_events'], 3)
+        self.assertEqual(data['unresolved_count'], 3)
+        self.assertEqual(data['camera_stats'][0], {'camera_id': 'CAM-01', 'count': 2})
+        self.assertEqual(data['recent_trend'][-1]['count'], 3)
+
+
+class DashboardCacheTests(TestCase):
+    """dashboard 响应按数据版本号缓存：数据不变时命中，入库 / 处理后重新计算"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Cache Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('viewer', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+    def test_cached_until_data_changes(self):
+        first = self.client.get('/api/v1/ppe/dashboard/')
+        second = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event = DetectionEvent.objects.create(
+                customer=self.customer, camera_id='CAM-01', image='detections/x.jpg'
+            )
+        response = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['unresolved_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.is_resolved = True
+            event.save()
+        response = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['unresolved_count'], 0)
+
+    @override_settings(DATA_VERSION_CACHE=False)
+    def test_versioning_disabled_without_shared_cache(self):
+        first = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertNotIn('ETag', first)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        second = self.client.get('/api/v1/ppe/dashboard/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual((second.status_code, second['X-Cache']), (200, 'MISS'))
+
+        # 其它 worker 写入的数据（本进程没有收到信号）也能立即看到
+        DetectionEvent.objects.create(customer=self.customer, camera_id='CAM-01', image='detections/x.jpg')
+        self.assertEqual(self.client.get('/api/v1/ppe/dashboard/').json()['total_events'], 1)
+
+    @override_settings(DEBUG=False, DATA_VERSION_CACHE=False)
+    def test_system_check_warns_about_per_process_cache(self):
+        from .checks import check_shared_cache
+        [warning] = check_shared_cache(None)
+        self.assertEqual(warning.id, 'ppe.W001')
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(DATABASE_REPLICA_ALIAS='replica')
+    def test_cached_stats_are_read_from_primary(self):
+        # 副本可用时：按版本号缓存的结果也必须从主库读（测试里没有 replica 库，读副本会直接报错）
+        with mock.patch('core.db_router.replica_alias', return_value='replica'):
+            response = self.client.get('/api/v1/ppe/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+
+class EventListFastPathTests(TestCase):
+    """列表快速路径（.values() + dict 序列化）的输出必须与 DetectionEventSerializer 一致"""
+
+    def setUp(self):
+        cache.clear()
+        customer = self.customer = Customer.objects.create(name='List Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('viewer', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=customer)
+        self.client.force_login(user)
+
+        for i in range(5):
+            DetectionEvent.objects.create(
+                customer=customer,
+                camera_id=f"CAM-{i}",
+                image=f"detections/cas/ab/cd/abcd{i} x.jpg",
+                image_variants={'thumb': f"variants/thumb/cas/ab/cd/abcd{i} x.jpg"} if i % 2 else {},
+                detections={'violation': 'no_vest', 'confidence': 0.9},
+                is_resolved=bool(i % 2),
+            )
+        self.events = DetectionEvent.objects.for_customer(customer).order_by('-timestamp', '-id')
+
+    def test_matches_model_serializer(self):
+        response = self.client.get('/api/v1/ppe/events/')
+        expected = DetectionEventSerializer(
+            self.events, many=True, context={'request': response.wsgi_request}
+        ).data
+        self.assertEqual(response.json()['results'], expected)
+
+    def test_sparse_fields(self):
+        data = self.client.get('/api/v1/ppe/events/?fields=timestamp,camera_id').json()
+        self.assertEqual(list(data['results'][0]), ['camera_id', 'timestamp'])
+
+        response = self.client.get('/api/v1/ppe/events/?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get_returns_304_without_queries_on_ppe_tables(self):
+        for url in ['/api/v1/ppe/dashboard/', '/api/v1/ppe/events/?page_size=10']:
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertFalse([q for q in ctx.captured_queries if 'ppe_' in q['sql']], url)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                DetectionEvent.objects.create(
+                    customer=self.customer, camera_id='CAM-01', image='detections/x.jpg'
+                )
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class LiveFeedTests(TestCase):
+    """实时推送: 发布后唤醒等待中的连接、按 Last-Event-ID 补发、漏消息时要求刷新"""
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_publish_from_another_thread_wakes_stream(self):
+        stream = live_feed.stream(customer_id=9001)
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.05)
+        self.assertFalse(pending.done())
+
+        publisher = threading.Thread(
+            target=live_feed.broker.publish, args=(9001, 'stats', {'changes': []})
+        )
+        publisher.start()
+        message = await asyncio.wait_for(pending, timeout=2)
+        publisher.join()
+        self.assertIn('event: stats', message)
+        await stream.aclose()
+
+    async def test_resume_from_last_event_id(self):
+        ids = [live_feed.broker.publish(9002, 'event', {'id': i}) for i in range(3)]
+        stream = live_feed.stream(customer_id=9002, last_event_id=ids[0])
+        await anext(stream)
+        self.assertIn(f"id: {ids[1]}", await anext(stream))
+        self.assertIn(f"id: {ids[2]}", await anext(stream))
+        await stream.aclose()
+
+    @override_settings(LIVE_FEED_BUFFER_SIZE=2)
+    async def test_missed_messages_request_refresh(self):
+        ids = [live_feed.broker.publish(9003, 'event', {'id': i}) for i in range(4)]
+        stream = live_feed.stream(customer_id=9003, last_event_id=ids[0])
+        await anext(stream)
+        self.assertIn('event: refresh', await anext(stream))
+        await stream.aclose()
+
+    def test_ingest_publishes_event_and_stats(self):
+        customer = Customer.objects.create(name='Live Co')
+        with self.captureOnCommitCallbacks(execute=True):
+            event = DetectionEvent.objects.create(
+                customer=customer, camera_id='CAM-01', image='detections/x.jpg'
+            )
+        messages, _ = live_feed.broker.read_since(customer.pk, 0)
+        types = {event_type: data for _, event_type, data in messages}
+        self.assertEqual(types['event']['id'], event.pk)
+        self.assertEqual(types['stats']['changes'][0]['unresolved'], 1)
+
+    @override_settings(LIVE_FEED_KEEPALIVE=0.1)
+    def test_live_endpoint_long_polls_under_wsgi(self):
+        self.assertEqual(self.client.get('/api/v1/ppe/live/').status_code, 401)
+
+        customer = Customer.objects.create(name='Live Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('viewer', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=customer)
+        self.client.force_login(user)
+
+        response = self.client.get('/api/v1/ppe/live/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response).decode()
+        self.assertIn(': keepalive', body)
+
+
+class IngestTests(TestCase):
+    """异步上报接口：设备 Key 认证、表单校验、入库；ASGI 下中间件链不降级为同步"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.customer = Customer.objects.create(name='Ingest Co')
+        self.credential, self.raw_key = DeviceCredential.issue(self.customer, 'CAM-07')
+
+    @staticmethod
+    def _image(color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('capture.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_middleware_chain_is_not_adapted_under_asgi(self):
+        with override_settings(DEBUG=True), mock.patch('django.core.handlers.base.logger') as logger:
+            handler = ASGIHandler()
+        adapted = [c.args for c in logger.debug.call_args_list if 'adapted' in c.args[0]]
+        self.assertEqual(adapted, [])
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    async def test_missing_or_invalid_key_is_rejected(self):
+        response = await self.async_client.post('/api/v1/ppe/events/ingest/', {'image': self._image()})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Device')
+
+        response = await self.async_client.post(
+            '/api/v1/ppe/events/ingest/', {'image': self._image()}, headers={'X-Device-Key': self.raw_key + 'x'}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    @mock.patch('ppe.views.NotificationService.enqueue_whatsapp_alert')
+    async def test_ingest_creates_event_for_device_camera(self, enqueue):
+        response = await self.async_client.post(
+            '/api/v1/ppe/events/ingest/',
+            {'image': self._image(), 'detections': json.dumps({'violation': 'no_helmet'}), 'person_id': 'P-1'},
+            headers={'Authorization': f'Device {self.raw_key}'},
+        )
+        self.assertEqual(response.status_code, 201)
+        event = await DetectionEvent.objects.aget(pk=response.json()['id'])
+        self.assertEqual((event.customer_id, event.camera_id, event.person_id), (self.customer.pk, 'CAM-07', 'P-1'))
+        self.assertEqual(event.detections, {'violation': 'no_helmet'})
+        enqueue.assert_called_once()
+
+    @mock.patch('ppe.views.NotificationService.enqueue_whatsapp_alert')
+    async def test_failed_insert_does_not_keep_image_reference(self, enqueue):
+        image = self._image()
+        headers = {'X-Device-Key': self.raw_key}
+        response = await self.async_client.post('/api/v1/ppe/events/ingest/', {'image': image}, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        blob = await ImageBlob.objects.aget()
+
+        with mock.patch.object(DetectionEvent.objects, 'create', side_effect=IntegrityError('insert failed')):
+            for upload in (image, self._image('blue')):
+                upload.seek(0)
+                with self.assertRaises(IntegrityError):
+                    await self.async_client.post('/api/v1/ppe/events/ingest/', {'image': upload}, headers=headers)
+
+        # 已有图片的引用计数不变，新图片没有留下引用记录
+        await blob.arefresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(await ImageBlob.objects.acount(), 1)
+        self.assertEqual(await DetectionEvent.objects.acount(), 1)
+
+    async def test_invalid_image_is_rejected(self):
+        response = await self.async_client.post(
+            '/api/v1/ppe/events/ingest/',
+            {'image': SimpleUploadedFile('capture.jpg', b'not an image')},
+            headers={'X-Device-Key': self.raw_key},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+        self.assertFalse(await DetectionEvent.objects.aexists())
+
+
+class ContentAddressedStorageTests(TestCase):
+    """抓拍图片按内容哈希存储：相同字节只存一份，引用归零回收，事务回滚留下的文件由 gc_image_blobs 找回"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.customer = Customer.objects.create(name='Blob Co')
+
+    def _event(self, payload, customer=None):
+        event = DetectionEvent(customer=customer or self.customer, camera_id='CAM-01')
+        with self.captureOnCommitCallbacks(execute=False):
+            event.image.save('capture.JPG', ContentFile(payload))
+        return event
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(settings.MEDIA_ROOT, name))
+
+    def test_identical_images_are_stored_once(self):
+        first, second = self._event(b'same-frame'), self._event(b'same-frame')
+        other = self._event(b'other-frame')
+
+        digest = hashlib.sha256(b'same-frame').hexdigest()
+        self.assertEqual(first.image.name, f"detections/cas/{digest[:2]}/{digest[2:4]}/{digest}.jpg")
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertNotEqual(other.image.name, first.image.name)
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).ref_count, 2)
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).size, len(b'same-frame'))
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+
+    def test_delete_releases_reference_and_collects_unused_file(self):
+        first, second = self._event(b'same-frame'), self._event(b'same-frame')
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(self._exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(self._exists(name))
+
+    def test_customer_delete_releases_its_references_only(self):
+        other = Customer.objects.create(name='Other Co')
+        shared = self._event(b'shared-frame').image.name
+        own = self._event(b'own-frame').image.name
+        self._event(b'shared-frame', customer=other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.delete()
+        self.assertEqual(ImageBlob.objects.get(name=shared).ref_count, 1)
+        self.assertTrue(self._exists(shared))
+        self.assertFalse(ImageBlob.objects.filter(name=own).exists())
+        self.assertFalse(self._exists(own))
+
+    def test_gc_collects_files_left_by_rolled_back_saves(self):
+        kept = self._event(b'kept-frame').image.name
+        event = DetectionEvent(customer=self.customer, camera_id='CAM-01')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            event.image.save('capture.jpg', ContentFile(b'rolled-back'))
+            raise RuntimeError
+        orphan = event.image.name
+        self.assertTrue(self._exists(orphan))
+        self.assertFalse(ImageBlob.objects.filter(name=orphan).exists())
+        # 记录丢失但仍被事件引用的文件不能回收
+        ImageBlob.objects.filter(name=kept).delete()
+
+        out = io.StringIO()
+        call_command('gc_image_blobs', '--scan-files', stdout=out)
+        self.assertIn('Found 2 file(s) without a blob record', out.getvalue())
+        self.assertIn('Deleted 0 unreferenced blob(s)', out.getvalue())  # 还在宽限期内
+        self.assertEqual(ImageBlob.objects.get(name=kept).ref_count, 1)
+
+        out = io.StringIO()
+        call_command('gc_image_blobs', '--scan-files', '--grace-minutes', '0', stdout=out)
+        self.assertIn('Found 0 file(s)', out.getvalue())
+        self.assertIn('Deleted 1 unreferenced blob(s)', out.getvalue())
+        self.assertFalse(self._exists(orphan))
+        self.assertTrue(self._exists(kept))
+
+
+class ImageVariantTests(TestCase):
+    """缩略图：提交后生成并写回事件（数据版本号递增），同一个 blob 只生成一次，补生成命令"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.customer = Customer.objects.create(name='Variant Co')
+
+    def _event(self, size=(1600, 1200)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'blue').save(buffer, 'JPEG')
+        event = DetectionEvent(customer=self.customer, camera_id='CAM-01')
+        event.image.save('capture.jpg', ContentFile(buffer.getvalue()))
+        return event
+
+    def _variant_size(self, name):
+        with variant_storage.open(name) as f:
+            return Image.open(f).size
+
+    def test_variants_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            event = self._event()
+        version = get_data_version(self.customer.pk)
+        # IMAGE_VARIANT_WORKERS 在测试里默认为 0：提交时同步生成
+        event.refresh_from_db()
+        self.assertEqual(set(event.image_variants), set(VARIANT_SIZES))
+        self.assertEqual(self._variant_size(event.image_variants['thumb']), (320, 240))
+        self.assertEqual(self._variant_size(event.image_variants['medium']), (960, 720))
+
+        # 写回 image_variants 后数据版本号递增，事件列表的 ETag 随之变化
+        image_variants.generate_for_event(event.pk)
+        self.assertNotEqual(get_data_version(self.customer.pk), version)
+
+    def test_render_writes_fixed_names_and_skips_existing(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            event = self._event()
+        names = image_variants.render_variants(event.image.name)
+        self.assertEqual(names, {v: variant_name(event.image.name, v) for v in VARIANT_SIZES})
+        with mock.patch.object(variant_storage, 'save') as save:
+            self.assertEqual(image_variants.render_variants(event.image.name), names)
+        save.assert_not_called()
+
+        # overwrite=True 覆盖同名文件，不另存为新名字
+        with variant_storage.open(names['thumb'], 'wb') as f:
+            f.write(b'stale')
+        self.assertEqual(image_variants.render_variants(event.image.name, overwrite=True), names)
+        self.assertEqual(self._variant_size(names['thumb']), (320, 240))
+        self.assertEqual(os.listdir(os.path.dirname(variant_storage.path(names['thumb']))),
+                         [os.path.basename(names['thumb'])])
+
+    def test_force_rerenders_and_removes_renamed_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            event = self._event()
+        event.refresh_from_db()
+        names = dict(event.image_variants)
+        # 旧版本在文件名冲突时另存的文件
+        renamed = variant_storage.save(names['medium'].replace('.jpg', '_AbC123.jpg'), ContentFile(b'old'))
+        DetectionEvent.objects.filter(pk=event.pk).update(image_variants={**names, 'medium': renamed})
+        with variant_storage.open(names['thumb'], 'wb') as f:
+            f.write(b'stale')
+
+        out = io.StringIO()
+        call_command('generate_image_variants', '--workers', '1', '--force', stdout=out)
+        self.assertIn('Generated variants for 1 image(s), 0 failed', out.getvalue())
+        event.refresh_from_db()
+        self.assertEqual(event.image_variants, names)
+        self.assertEqual(self._variant_size(names['thumb']), (320, 240))
+        self.assertFalse(variant_storage.exists(renamed))
+
+    def test_backfill_command_fills_missing_variants(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            event = self._event((100, 50))
+        version = get_data_version(self.customer.pk)
+        out = io.StringIO()
+        call_command('generate_image_variants', '--workers', '1', stdout=out)
+        self.assertIn('Generated variants for 1 image(s), 0 failed', out.getvalue())
+        event.refresh_from_db()
+        self.assertEqual(self._variant_size(event.image_variants['thumb']), (100, 50))
+        self.assertNotEqual(get_data_version(self.customer.pk), version)
+
+
+class ArchiveTests(TestCase):
+    """超过保留期的事件归档：图片进入按天 tar，原事件删除，归档接口可读"""
+
+    def setUp(self):
+        cache.clear()
+        self.archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_root)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.settings_override = override_settings(ARCHIVE_ROOT=self.archive_root, MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.customer = Customer.objects.create(name='Archive Co', retention_days=30)
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('viewer', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+    def _event(self, age_days, payload):
+        event = DetectionEvent(customer=self.customer, camera_id='CAM-01')
+        with self.captureOnCommitCallbacks(execute=True):
+            event.image.save('capture.jpg', ContentFile(payload))
+        DetectionEvent.objects.filter(pk=event.pk).update(
+            timestamp=timezone.now() - timedelta(days=age_days)
+        )
+        return event
+
+    def _rollups(self):
+        return (
+            list(CameraEventCounter.objects.filter(customer=self.customer).values_list(
+                'camera_id', 'total_count', 'unresolved_count')),
+            sorted(HourlyEventRollup.objects.filter(customer=self.customer).values_list('bucket', 'event_count')),
+        )
+
+    def test_archive_moves_old_events_and_images(self):
+        old = [self._event(40, b'old-image-%d' % i) for i in range(3)]
+        shared = self._event(41, b'old-image-0')  # 与 old[0] 内容相同
+        recent = self._event(1, b'recent-image')
+
+        DetectionEvent.objects.filter(pk=old[2].pk).update(is_resolved=True)
+
+        # _event() 用 update() 改时间，先按改后的时间重建汇总
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+        rollups_before = self._rollups()
+        self.assertEqual(rollups_before[0], [('CAM-01', 5, 4)])
+        last_message = live_feed.broker.last_id(self.customer.pk) or 0
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_events', batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(list(DetectionEvent.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(ArchivedDetectionEvent.objects.count(), 4)
+        # 图片引用已释放并回收
+        self.assertFalse(ImageBlob.objects.filter(name=old[1].image.name).exists())
+        self.assertTrue(ImageBlob.objects.filter(name=recent.image.name).exists())
+
+        # 归档的事件仍计入总数，但不再算作未处理（归档后无法处理）；重建汇总表的结果一致
+        rollups_after = self._rollups()
+        self.assertEqual(rollups_after, ([('CAM-01', 5, 1)], rollups_before[1]))
+        messages, _ = live_feed.broker.read_since(self.customer.pk, last_message)
+        changes = [c for _, event_type, data in messages if event_type == 'stats' for c in data['changes']]
+        self.assertEqual(sum(c['unresolved'] for c in changes), -3)
+        self.assertFalse([c for c in changes if c['total']])
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+        self.assertEqual(self._rollups(), rollups_after)
+
+        for event, payload in [(old[2], b'old-image-2'), (shared, b'old-image-0')]:
+            data = self.client.get(f'/api/v1/ppe/archive/events/{event.pk}/').json()
+            response = self.client.get(data['image'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, payload)
+
+        listing = self.client.get('/api/v1/ppe/archive/events/?page_size=3').json()
+        self.assertEqual(len(listing['results']), 3)
+        self.assertIsNotNone(listing['next'])
+
+
+    def test_day_archive_is_locked_while_writing(self):
+        storage = DetectionEvent._meta.get_field('image').storage
+        first = self._event(40, b'first')
+        second = self._event(40, b'second')
+        writer = DayArchive('1/2020/01/01.tar')
+        writer.add(first.image.name, storage)
+
+        opened = threading.Event()
+
+        def append():
+            other = DayArchive('1/2020/01/01.tar')
+            opened.set()
+            other.add(second.image.name, storage)
+            other.close()
+
+        thread = threading.Thread(target=append)
+        thread.start()
+        self.assertFalse(opened.wait(timeout=0.2))
+        writer.close()
+        thread.join(timeout=5)
+        self.assertTrue(opened.is_set())
+        with tarfile.open(os.path.join(self.archive_root, '1/2020/01/01.tar')) as tar:
+            self.assertEqual(tar.getnames(), [first.image.name, second.image.name])
+
+
+class BulkResolveTests(TestCase):
+    """批量处理：只改本公司的事件，汇总表与重建结果一致，缓存版本号递增"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Bulk Co')
+        other = Customer.objects.create(name='Other Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('supervisor', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+        for customer in (self.customer, other):
+            for i in range(6):
+                DetectionEvent.objects.create(
+                    customer=customer, camera_id=f"CAM-{i % 2}", image='detections/x.jpg'
+                )
+
+    def _rollups(self):
+        return sorted(
+            CameraEventCounter.objects.filter(total_count__gt=0)
+            .values_list('customer_id', 'camera_id', 'total_count', 'unresolved_count')
+        )
+
+    def test_bulk_resolve_by_filter_keeps_rollups_consistent(self):
+        version = self.client.get('/api/v1/ppe/dashboard/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    '/api/v1/ppe/events/bulk-resolve/', {'camera_id': 'CAM-0'}, content_type='application/json'
+                )
+        self.assertEqual(response.json(), {'updated': 3, 'unresolved_count': 3})
+        event_table = connection.ops.quote_name(DetectionEvent._meta.db_table)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith(f'UPDATE {event_table}')]
+        self.assertEqual(len(updates), 1)
+        # 事件不读进 Python：只有一条按 (客户, 摄像头, 日期) 聚合的查询
+        [select] = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and event_table in q['sql']]
+        self.assertIn('GROUP BY', select)
+
+        incremental = self._rollups()
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+        self.assertEqual(self._rollups(), incremental)
+        self.assertEqual(DetectionEvent.objects.filter(is_resolved=True).count(), 3)
+        self.assertNotEqual(self.client.get('/api/v1/ppe/dashboard/')['ETag'], version)
+
+    def test_bulk_resolve_by_ids_is_scoped_to_customer(self):
+        ids = list(DetectionEvent.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            '/api/v1/ppe/events/bulk-resolve/', {'ids': ids}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['updated'], 6)
+        self.assertEqual(DetectionEvent.objects.filter(is_resolved=True).count(), 6)
+        self.assertFalse(
+            DetectionEvent.objects.filter(customer=self.customer, is_resolved=False).exists()
+        )
+
+        # 重复调用不会重复扣减未处理数
+        response = self.client.post(
+            '/api/v1/ppe/events/bulk-resolve/', {'ids': ids}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'updated': 0, 'unresolved_count': 0})
+
+    def test_concurrent_change_between_count_and_update_is_retried(self):
+        from . import bulk_update
+        real = bulk_update._pending_changes
+        customer_id = self.customer.pk
+        # 第一次聚合之后有一条事件被其它请求处理了：UPDATE 的行数少一条
+        stale = [(customer_id, 'CAM-0', timezone.localdate(), 1)]
+        calls = []
+        last_id = live_feed.broker.last_id(customer_id) or 0
+
+        def pending(targets):
+            calls.append(1)
+            return real(targets) + (stale if len(calls) == 1 else [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(bulk_update, '_pending_changes', side_effect=pending):
+                updated = bulk_update.set_resolved(DetectionEvent.objects.filter(customer_id=customer_id))
+        self.assertEqual((updated, len(calls)), (6, 2))
+        incremental = self._rollups()
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+        self.assertEqual(self._rollups(), incremental)
+
+        messages, _ = live_feed.broker.read_since(customer_id, last_id)
+        [stats] = [data for _, event_type, data in messages if event_type == 'stats']
+        self.assertEqual(
+            sorted((c['camera_id'], c['unresolved']) for c in stats['changes']), [('CAM-0', -3), ('CAM-1', -3)]
+        )
+        self.assertEqual({c['date'] for c in stats['changes']}, {timezone.localdate().isoformat()})
+
+    def test_bulk_resolve_requires_a_filter(self):
+        response = self.client.post('/api/v1/ppe/events/bulk-resolve/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    """导出：分块读取不丢行、不重复，过滤条件生效，gzip 解压后与明文一致"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Export Co')
+        other = Customer.objects.create(name='Other Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('supervisor', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+        # 同一时间戳的多条事件跨越分块边界
+        now = timezone.now()
+        for i in range(7):
+            DetectionEvent.objects.create(
+                customer=self.customer, camera_id=f"CAM-{i % 2}", image='detections/x.jpg',
+                timestamp=now - timedelta(minutes=i // 3),
+                detections={'items': [{'class': 'no_helmet', 'confidence': 0.9}]},
+            )
+        DetectionEvent.objects.create(customer=other, camera_id='CAM-0', image='detections/x.jpg')
+
+    def _get(self, query):
+        response = self.client.get('/api/v1/ppe/events/export/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_streams_all_rows_in_chunks(self):
+        with mock.patch('ppe.export.CHUNK_SIZE', 2):
+            body = self._get('output=csv&images=1')
+        rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+        expected = DetectionEvent.objects.for_customer(self.customer).order_by('timestamp', 'id')
+        self.assertEqual([int(r['id']) for r in rows], [e.pk for e in expected])
+        self.assertIn('thumbnail', rows[0])
+        self.assertTrue(rows[0]['image'].startswith('http'))
+        self.assertEqual(rows[0]['violations'], 'No Helmet')
+
+    def test_ndjson_export_applies_filters(self):
+        body = self._get('output=ndjson&camera_id=CAM-0')
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertEqual({r['camera_id'] for r in records}, {'CAM-0'})
+        self.assertNotIn('image', records[0])
+
+    def test_gzip_export_matches_plain_output(self):
+        plain = self._get('output=ndjson')
+        response = self.client.get('/api/v1/ppe/events/export/?output=ndjson&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    @mock.patch('ppe.export.FLUSH_BYTES', 1)
+    @mock.patch('ppe.export.CHUNK_SIZE', 2)
+    def test_asgi_export_sends_each_page_before_reading_the_next(self):
+        event_table = connection.ops.quote_name(DetectionEvent._meta.db_table)
+        # on_body 在事件循环的线程里执行，直接读测试线程连接上的查询记录
+        queries_log = connection.queries_log
+        pages_read = []
+
+        def on_body(body):
+            pages_read.append(len([q for q in queries_log if f'FROM {event_table}' in q['sql']]))
+
+        with CaptureQueriesContext(connection):
+            chunks = asgi_get(self.client, '/api/v1/ppe/events/export/', 'output=ndjson', on_body)
+
+        self.assertEqual(pages_read[0], 1)
+        self.assertEqual(pages_read[-1], 4)
+        records = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual(len(records), 7)
+
+    def test_invalid_output_is_rejected(self):
+        response = self.client.get('/api/v1/ppe/events/export/?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class ViolationExtractionTests(SimpleTestCase):
+    """detections 的三种格式统一解析；设备上报的异常值不能让事件写入失败"""
+
+    def test_formats(self):
+        self.assertEqual(extract_violation_items({'violation': 'No Helmet', 'confidence': '0.9', 'bbox': [1, 2, 3, 4]}), [
+            {'violation_class': 'no_helmet', 'confidence': 0.9, 'bbox': [1, 2, 3, 4]},
+        ])
+        self.assertEqual(extract_violation_items({'class': 'no-vest'}), [
+            {'violation_class': 'no_vest', 'confidence': None, 'bbox': None},
+        ])
+        self.assertEqual(extract_violation_items({'items': [
+            {'class': 'no_helmet', 'confidence': 0.95, 'bbox': 'bad'}, 'junk', {'confidence': 0.5}, {'violation': ' '},
+        ]}), [{'violation_class': 'no_helmet', 'confidence': 0.95, 'bbox': None}])
+        self.assertEqual(extract_violation_items(None), [])
+        self.assertEqual(extract_violation_items({'items': []}), [])
+
+    def test_items_take_precedence_over_top_level(self):
+        detections = {'violation': 'no_vest', 'items': [{'class': 'no_helmet'}]}
+        self.assertEqual([it['violation_class'] for it in extract_violation_items(detections)], ['no_helmet'])
+        self.assertEqual(NotificationService._extract_violation_details(detections), 'No Helmet')
+        # items 里没有可用标签时也不退回顶层字段
+        detections = {'violation': 'no_vest', 'items': [{'confidence': 0.5}]}
+        self.assertEqual(NotificationService._extract_violation_details(detections), 'Safety violation detected')
+
+    def test_long_labels_are_clamped(self):
+        [item] = extract_violation_items({'class': 'x' * 99 + ' y' * 10})
+        self.assertEqual(len(item['violation_class']), VIOLATION_CLASS_MAX_LENGTH - 1)
+        self.assertFalse(item['violation_class'].endswith('_'))
+        [item] = extract_violation_items({'class': 'z' * 500})
+        self.assertEqual(item['violation_class'], 'z' * VIOLATION_CLASS_MAX_LENGTH)
+
+    def test_non_finite_confidence_is_dropped(self):
+        for value in ('nan', 'inf', '-Infinity', float('nan'), 10 ** 400):
+            [item] = extract_violation_items({'class': 'no_helmet', 'confidence': value})
+            self.assertIsNone(item['confidence'], value)
+
+
+class ViolationItemBackfillTests(TestCase):
+    """入库时拆出的明细与 backfill_violation_items 命令"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Items Co')
+
+    def _event(self, detections):
+        return DetectionEvent.objects.create(
+            customer=self.customer, camera_id='CAM-1', image='detections/x.jpg', detections=detections
+        )
+
+    def test_untrusted_values_are_saved(self):
+        event = self._event({'items': [{'class': 'n' * 300, 'confidence': 'NaN'}]})
+        item = ViolationItem.objects.get(event=event)
+        self.assertEqual(item.violation_class, 'n' * VIOLATION_CLASS_MAX_LENGTH)
+        self.assertIsNone(item.confidence)
+
+    def test_backfill_creates_missing_items_once(self):
+        events = [
+            self._event({'violation': 'no_helmet', 'confidence': 0.8}),
+            self._event({'items': [{'class': 'no_helmet'}, {'class': 'no_vest'}]}),
+            self._event({}),
+        ]
+        expected = sorted(ViolationItem.objects.values_list('event_id', 'violation_class', 'confidence'))
+        # 模拟明细表上线之前的历史数据
+        ViolationItem.objects.filter(event__in=events[:2]).delete()
+        self.assertEqual(ViolationItem.objects.count(), 0)
+
+        out = io.StringIO()
+        call_command('backfill_violation_items', batch_size=2, stdout=out)
+        self.assertIn('created 3 violation item(s)', out.getvalue())
+        self.assertEqual(sorted(ViolationItem.objects.values_list('event_id', 'violation_class', 'confidence')), expected)
+
+        # 重复执行不会重复创建；--rebuild 删除后重建出相同的结果
+        call_command('backfill_violation_items', stdout=io.StringIO())
+        self.assertEqual(ViolationItem.objects.count(), 3)
+        out = io.StringIO()
+        call_command('backfill_violation_items', rebuild=True, stdout=out)
+        self.assertIn('Deleted 3 existing item(s)', out.getvalue())
+        self.assertEqual(sorted(ViolationItem.objects.values_list('event_id', 'violation_class', 'confidence')), expected)
+
+
+class PersonHistoryTests(TestCase):
+    """人员统计：增量维护与重建一致，排行只读计数表"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='People Co')
+        ppe = Module.objects.create(name='PPE Detection', slug='ppe')
+        Subscription.objects.create(
+            customer=self.customer, module=ppe, expiration_date=timezone.now() + timedelta(days=30)
+        )
+        user = User.objects.create_user('supervisor', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+        for person_id, name, count in [('E-1', 'Alice', 3), ('E-2', 'Bob', 1), ('N/A', 'Unknown', 2)]:
+            for _ in range(count):
+                DetectionEvent.objects.create(
+                    customer=self.customer, camera_id='CAM-01', image='detections/x.jpg',
+                    person_id=person_id, person_name=name,
+                )
+
+    def _counters(self):
+        return sorted(
+            PersonViolationCounter.objects.filter(customer=self.customer, event_count__gt=0)
+            .values_list('person_id', 'month', 'event_count')
+        )
+
+    def test_incremental_counters_match_rebuild(self):
+        moved = DetectionEvent.objects.filter(person_id='E-1').first()
+        moved.timestamp -= timedelta(days=40)
+        moved.save()
+        DetectionEvent.objects.filter(person_id='E-2').first().delete()
+        renamed = DetectionEvent.objects.filter(person_id='N/A').first()
+        renamed.person_id = 'E-2'
+        renamed.save()
+
+        incremental = self._counters()
+        self.assertEqual([(p, c) for p, _, c in incremental], [('E-1', 1), ('E-1', 2), ('E-2', 1)])
+        call_command('rebuild_event_rollups', customer=[self.customer.pk], stdout=io.StringIO())
+        self.assertEqual(self._counters(), incremental)
+
+    def test_top_offenders_reads_counters(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/v1/ppe/people/top-offenders/?limit=1').json()
+        self.assertEqual(data['results'], [{'person_id': 'E-1', 'person_name': 'Alice', 'count': 3}])
+        counter_table = connection.ops.quote_name(PersonViolationCounter._meta.db_table)
+        self.assertEqual(len([q for q in ctx.captured_queries if counter_table in q['sql']]), 1)
+
+        response = self.client.get('/api/v1/ppe/people/top-offenders/?month=2026-13')
+        self.assertEqual(response.status_code, 400)
+
+    def test_person_history(self):
+        data = self.client.get('/api/v1/ppe/people/E-1/history/?limit=2').json()
+        self.assertEqual(data['person_name'], 'Alice')
+        self.assertEqual(data['total_count'], 3)
+        self.assertEqual(len(data['recent']), 2)
+        self.assertEqual(self.client.get('/api/v1/ppe/people/E-9/history/').status_code, 404)
+
+
+@mock.patch('core.utils.report_generator._generate_report_with_llm', return_value=None)
+class ReportAggregationTests(TestCase):
+    """报告统计在数据库里聚合：不读取 detections / 图片列，周报、月报的查询数与日报相同"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Report Co')
+        self.day = timezone.localdate()
+        noon = day_bounds(self.day)[0] + timedelta(hours=12)
+        samples = [
+            ('CAM-01', {'items': [{'class': 'no_helmet'}, {'class': 'No Vest'}]}, noon),
+            ('CAM-01', {'items': [{'class': 'no-helmet'}]}, noon),
+            ('CAM-02', {'violation': 'no_helmet'}, noon),
+            ('CAM-02', {}, noon),
+            ('CAM-03', {'violation': 'no_vest'}, noon - timedelta(days=40)),
+        ]
+        for camera_id, detections, timestamp in samples:
+            event = DetectionEvent.objects.create(
+                customer=self.customer, camera_id=camera_id, image='detections/x.jpg', detections=detections
+            )
+            # timestamp 是 auto_now_add，创建后再改（整条保存会同步 ViolationItem 的时间）
+            event.timestamp = timestamp
+            event.save()
+
+    def test_daily_counts(self, _llm):
+        with CaptureQueriesContext(connection) as ctx:
+            report = generate_daily_report(self.customer)
+        self.assertIn('a total of **5** violation(s)', report)
+        self.assertIn('- **No Helmet**: 3 incident(s) (Critical!)', report)
+        self.assertIn('- **General**: 1 incident(s)\n- **No Vest**: 1 incident(s)', report)
+        self.assertIn('Most violations occurred at **CAM-01**', report)
+        tables = [connection.ops.quote_name(m._meta.db_table) for m in (DetectionEvent, ViolationItem)]
+        aggregations = [q['sql'] for q in ctx.captured_queries if any(t in q['sql'] for t in tables)]
+        self.assertEqual(len(aggregations), 3)
+        for sql in aggregations:
+            self.assertNotIn('"detections"', sql)
+            self.assertNotIn('"image"', sql)
+
+    def test_weekly_and_monthly_ranges(self, _llm):
+        self.assertIn('Weekly Safety Report', generate_report(self.customer, 'weekly'))
+        monthly = generate_report(self.customer, 'monthly', self.day - timedelta(days=40))
+        self.assertIn('Monthly Safety Report', monthly)
+        self.assertIn('This month, we detected a total of **1** violation(s)', monthly)
+        self.assertIn('at **CAM-03**', monthly)
+
+        empty = generate_daily_report(self.customer, self.day - timedelta(days=1))
+        self.assertIn('**no violations**', empty)
+        self.assertIn('No camera hotspot data available for', empty)
+
+
+@override_settings(LLM_API_KEY='test-key')
+@mock.patch('core.utils.report_generator._generate_report_with_llm', return_value='## LLM report')
+class ReportCacheTests(TestCase):
+    """已生成的报告按 (客户, 周期, 日期) 保存，数据没变时不重新聚合、不调用 LLM"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Cached Co')
+        self._add_event()
+
+    def _add_event(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DetectionEvent.objects.create(
+                customer=self.customer, camera_id='CAM-01', image='detections/x.jpg',
+                detections={'violation': 'no_helmet'},
+            )
+
+    def _event_queries(self, ctx):
+        table = connection.ops.quote_name(DetectionEvent._meta.db_table)
+        return [q for q in ctx.captured_queries if table in q['sql']]
+
+    def test_unchanged_data_is_served_from_storage(self, llm):
+        self.assertEqual(generate_daily_report(self.customer), '## LLM report')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(generate_daily_report(self.customer), '## LLM report')
+        self.assertEqual(llm.call_count, 1)
+        self.assertFalse(self._event_queries(ctx))
+
+        # 版本号变了但本期统计没变：只重新聚合
+        bump_data_version(self.customer.pk)
+        generate_daily_report(self.customer)
+        self.assertEqual(llm.call_count, 1)
+
+        self._add_event()
+        generate_daily_report(self.customer)
+        self.assertEqual(llm.call_count, 2)
+        generate_daily_report(self.customer, refresh=True)
+        self.assertEqual(llm.call_count, 3)
+        self.assertEqual(GeneratedReport.objects.get().source, 'llm')
+
+    @override_settings(DATABASE_REPLICA_ALIAS='replica')
+    def test_report_inputs_are_read_from_primary(self, llm):
+        with mock.patch('core.db_router.replica_alias', return_value='replica'):
+            self.assertEqual(generate_daily_report(self.customer), '## LLM report')
+        self.assertEqual(GeneratedReport.objects.get().data_version, get_data_version(self.customer.pk))
+
+    @override_settings(DATA_VERSION_CACHE=False)
+    def test_without_data_version_only_stats_hash_is_trusted(self, llm):
+        self.assertEqual(generate_daily_report(self.customer), '## LLM report')
+        self.assertIsNone(GeneratedReport.objects.get().data_version)
+        generate_daily_report(self.customer)
+        self.assertEqual(llm.call_count, 1)
+
+        # 信号没有递增版本号（其它 worker 写入）：靠统计结果的摘要发现数据变了
+        DetectionEvent.objects.create(
+            customer=self.customer, camera_id='CAM-02', image='detections/x.jpg', detections={'violation': 'no_vest'},
+        )
+        generate_daily_report(self.customer)
+        self.assertEqual(llm.call_count, 2)
+
+    def test_llm_failure_is_not_stored(self, llm):
+        llm.return_value = None
+        self.assertIn('Daily Safety Report', generate_daily_report(self.customer))
+        self.assertFalse(GeneratedReport.objects.exists())
+        generate_daily_report(self.customer)
+        self.assertEqual(llm.call_count, 2)
+
+    def test_pregenerate_command(self, llm):
+        Customer.objects.create(name='Inactive Co', is_active=False)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        out = io.StringIO()
+        call_command('pregenerate_reports', workers=1, stdout=out)
+        self.assertIn('1 saved, 0 not saved, 0 failed', out.getvalue())
+        report = GeneratedReport.objects.get()
+        self.assertEqual((report.customer, report.period, report.date), (self.customer, 'daily', yesterday))
+
+        call_command(
+            'pregenerate_reports', '--workers=1', '--period=weekly', f'--date={yesterday}', stdout=io.StringIO()
+        )
+        self.assertTrue(GeneratedReport.objects.filter(period='weekly').exists())
+
+
+@override_settings(LLM_API_KEY='test-key')
+class ReportStreamTests(TestCase):
+    """流式报告：LLM 每输出一段就发给浏览器，LLM 不可达时立即返回模板报告"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Stream Co')
+        Subscription.objects.create(
+            customer=self.customer,
+            module=Module.objects.create(name='AI Reporting', slug='ppe_llm'),
+            expiration_date=timezone.now() + timedelta(days=30),
+        )
+        user = User.objects.create_user('reader', password='pass-1234')
+        UserProfile.objects.create(user=user, customer=self.customer)
+        self.client.force_login(user)
+
+    def _stream(self):
+        response = self.client.get('/api/v1/report/generate/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    @mock.patch('core.utils.report_generator.requests.post')
+    def test_tokens_are_streamed_and_saved(self, post):
+        lines = [
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            '',
+            'data: {"choices": [{"delta": {"content": "## 🛡️ Report"}}]}',
+            'data: {"choices": [{"delta": {"content": "\\nAll good."}}]}',
+            'data: [DONE]',
+        ]
+        post.return_value.__enter__.return_value.iter_lines.return_value = lines
+        with self.assertLogs('core.utils.report_generator', 'INFO') as logs:
+            self.assertEqual(self._stream(), ['## 🛡️ Report', '\nAll good.'])
+        self.assertTrue(post.call_args.kwargs['stream'])
+        self.assertIs(post.call_args.kwargs['json']['stream'], True)
+        [first_token] = [r for r in logs.records if r.getMessage() == 'LLM report first token']
+        self.assertGreaterEqual(first_token.ttft_ms, 0)
+
+        self.assertEqual(GeneratedReport.objects.get().content, '## 🛡️ Report\nAll good.')
+        # 数据没变：直接返回已保存的报告
+        self.assertEqual(self._stream(), ['## 🛡️ Report\nAll good.'])
+        self.assertEqual(post.call_count, 1)
+
+    @mock.patch('core.utils.report_generator.requests.post')
+    def test_unreachable_llm_falls_back_to_template(self, post):
+        post.side_effect = requests.exceptions.ConnectionError('refused')
+        chunks = self._stream()
+        self.assertEqual(len(chunks), 1)
+        self.assertIn('Daily Safety Report - Stream Co', chunks[0])
+        self.assertFalse(GeneratedReport.objects.exists())
+
+    @mock.patch('core.utils.report_generator.requests.post')
+    def test_asgi_sends_first_token_before_generation_finishes(self, post):
+        first_sent = threading.Event()
+
+        def lines():
+            yield 'data: {"choices": [{"delta": {"content": "## Report"}}]}'
+            # 整个响应被缓冲时第一段发不出去，这里会等到超时
+            self.assertTrue(first_sent.wait(timeout=5), 'first token was not sent before generation finished')
+            yield 'data: {"choices": [{"delta": {"content": "\\nDone."}}]}'
+            yield 'data: [DONE]'
+
+        post.return_value.__enter__.return_value.iter_lines.return_value = lines()
+        chunks = asgi_get(self.client, '/api/v1/report/generate/', 'stream=1', lambda body: first_sent.set())
+        self.assertEqual(chunks, [b'## Report', b'\nDone.'])
+        self.assertEqual(GeneratedReport.objects.get().content, '## Report\nDone.')
+
+    def test_json_response_without_stream(self):
+        with mock.patch('core.utils.report_generator._generate_report_with_llm', return_value='## Full'):
+            self.assertEqual(self.client.get('/api/v1/report/generate/').json(), {'report': '## Full'})
+        self.assertEqual(self.client.get('/api/v1/report/generate/?period=yearly').status_code, 400)
@@ -1,7 +1,21 @@
 from django.urls import path
-from .views import DetectionEventListCreateView, DashboardStatsView
+from .views import (
+    DetectionEventListCreateView, DashboardStatsView, DashboardCacheStatsView,
+    EventExportView, BulkResolveView, PersonHistoryView, TopOffendersView, ArchivedEventListView, ArchivedEventDetailView, ArchivedEventImageView,
+    ingest_event_view, live_feed_view,
+)
 
 urlpatterns = [
     path('events/', DetectionEventListCreateView.as_view(), name='detection-list-create'),
+    path('events/ingest/', ingest_event_view, name='detection-ingest'),  # 异步上报（ASGI，设备 Key）
+    path('events/export/', EventExportView.as_view(), name='detection-export'),  # CSV / NDJSON 导出
+    path('events/bulk-resolve/', BulkResolveView.as_view(), name='detection-bulk-resolve'),  # 批量处理
+    path('archive/events/', ArchivedEventListView.as_view(), name='archived-event-list'),  # 归档事件查询
+    path('archive/events/<int:pk>/', ArchivedEventDetailView.as_view(), name='archived-event-detail'),
+    path('archive/events/<int:pk>/image/', ArchivedEventImageView.as_view(), name='archived-event-image'),
+    path('people/top-offenders/', TopOffendersView.as_view(), name='person-top-offenders'),  # 本月违规排行
+    path('people/<str:person_id>/history/', PersonHistoryView.as_view(), name='person-history'),  # 个人违规历史
     path('dashboard/', DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('live/', live_feed_view, name='live-feed'),  # 实时推送 (SSE)
+    path('dashboard/cache-stats/', DashboardCacheStatsView.as_view(), name='dashboard-cache-stats'),  # 仅管理员
 ]
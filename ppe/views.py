@@ -1,32 +1,88 @@
-from django.shortcuts import render
-from django.db.models import Count
+from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
+from django.views.decorators.csrf import csrf_exempt
+from datetime import datetime, timedelta
+import mimetypes
+
+from asgiref.sync import sync_to_async
 
 from rest_framework import generics
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
-from .models import DetectionEvent
-from .serializers import DetectionEventSerializer
+from . import live_feed, rollups
+from .bulk_update import set_resolved
+from .export import EventExporter
+from .archive import read_image
+from .caching import (
+    dashboard_cache_stats, data_etag, get_data_version, get_or_compute, not_modified, set_etag,
+)
+from .forms import DetectionIngestForm, DetectionEventFilterForm
+from .pagination import EventCursorPagination
+from .models import (
+    DetectionEvent, ArchivedDetectionEvent, CameraEventCounter, HourlyEventRollup, PersonViolationCounter,
+    day_bounds,
+)
+from .serializers import (
+    DetectionEventSerializer, DetectionEventRowSerializer, ArchivedDetectionEventSerializer,
+    BulkResolveSerializer,
+)
+from core.authentication import (
+    DeviceWriteOnly, DeviceUser, NotDevice, device_key_cache, get_device_key, get_request_customer,
+)
+from core.db_router import analytics_db
+from core.entitlements import get_user_customer_id
 from core.utils.notification_service import NotificationService
 
 
 class DetectionEventListCreateView(generics.ListCreateAPIView):
     """
     检测事件列表和创建视图
-    - GET: 获取当前用户所属公司的所有检测事件
+    - GET: 获取当前用户所属公司的检测事件（按时间倒序游标分页）
+      过滤参数: camera_id, is_resolved, person_id, since, until
     - POST: 创建新的检测事件（自动关联到当前用户的公司）
+      摄像头使用设备 Key 认证时，customer 和 camera_id 以设备凭证为准
     """
     serializer_class = DetectionEventSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+    pagination_class = EventCursorPagination
 
     def get_queryset(self):
         """只返回当前用户所属 Customer 的数据"""
-        return DetectionEvent.objects.filter(
-            customer=self.request.user.userprofile.customer
-        )
+        return DetectionEvent.objects.for_customer(get_request_customer(self.request))
+
+    def filter_queryset(self, queryset):
+        """按查询参数过滤，参数格式错误返回 400"""
+        form = DetectionEventFilterForm(self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        return form.filter(queryset)
+
+    def list(self, request, *args, **kwargs):
+        """
+        列表快速路径：.values() 只查需要的列，按 dict 序列化（不创建模型实例）
+        ?fields=id,camera_id,timestamp 只返回部分字段
+        """
+        # 数据没变时直接 304，不查事件表（ETag 由数据版本号 + 完整查询参数决定）
+        customer = get_request_customer(request)
+        etag = data_etag(customer.pk, 'events', request.build_absolute_uri())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        fields = [f for f in request.query_params.get('fields', '').split(',') if f]
+        row_serializer = DetectionEventRowSerializer(request, fields)
+        queryset = self.filter_queryset(self.get_queryset()).values(*row_serializer.columns)
+        page = self.paginate_queryset(queryset)
+        return set_etag(self.get_paginated_response(row_serializer.many(page)), etag)
 
     def perform_create(self, serializer):
         """保存时自动设置 customer 为当前用户所属的公司，并触发报警"""
@@ -34,56 +90,192 @@ class DetectionEventListCreateView(generics.ListCreateAPIView):
         person_name = self.request.data.get('person_name', 'Unknown')
         person_id = self.request.data.get('person_id', 'N/A')
         
-        # 保存事件，包含身份信息
-        event = serializer.save(
-            customer=self.request.user.userprofile.customer,
-            person_name=person_name,
-            person_id=person_id
-        )
+        extra = {}
+        if isinstance(self.request.user, DeviceUser):
+            # 设备 Key 绑定了摄像头，防止一台设备冒充其它摄像头上报
+            extra['camera_id'] = self.request.user.camera_id
+
+        # 保存事件，包含身份信息（与汇总表的更新在同一个事务里）
+        with transaction.atomic():
+            event = serializer.save(
+                customer=get_request_customer(self.request),
+                person_name=person_name,
+                person_id=person_id,
+                **extra
+            )
         
-        # 触发 WhatsApp 报警（异步发送，不阻塞 API 响应）
-        try:
-            NotificationService.send_whatsapp_alert(event)
-        except Exception as e:
-            # 报警失败不应影响事件保存，仅记录错误
-            print(f"[Notification Error] Failed to send alert for event {event.id}: {e}")
+        # 触发 WhatsApp 报警（事务提交后放入后台线程池，不阻塞 API 响应）
+        transaction.on_commit(lambda: NotificationService.enqueue_whatsapp_alert(event))
+
+
+class EventExportView(APIView):
+    """
+    导出检测事件（流式输出，内存占用与行数无关）
+    - ?output=csv（默认）或 ndjson
+    - ?gzip=1 输出 .gz 文件；?images=1 包含原图 / 缩略图 URL 列
+    - 过滤参数与事件列表一致: camera_id, is_resolved, person_id, since, until
+    """
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+
+    def get(self, request):
+        form = DetectionEventFilterForm(request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        output = request.query_params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            raise ValidationError({'output': ['Must be "csv" or "ndjson".']})
+
+        exporter = EventExporter(
+            request,
+            output=output,
+            include_images=request.query_params.get('images') in ('1', 'true'),
+            compress=request.query_params.get('gzip') in ('1', 'true'),
+        )
+        # 流式响应在视图返回后才查询，这里先定好用哪个库（有只读副本且未固定到主库时读副本）
+        events = form.filter(DetectionEvent.objects.for_customer(get_request_customer(request))).using(analytics_db())
+
+        # ASGI 用异步生成器，否则 Django 会先把整个文件读进内存
+        content = exporter.stream(events) if isinstance(request._request, ASGIRequest) else exporter.blocks(events)
+        response = StreamingHttpResponse(content, content_type=exporter.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{exporter.filename}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class BulkResolveView(APIView):
+    """
+    批量处理事件（交班时一次关闭几百条）
+    - POST: {"ids": [...]} 或 {"camera_id", "person_id", "since", "until"}，可选 "is_resolved": false 重新打开
+    只修改当前用户所属公司的事件；返回修改的行数和最新的未处理数
+    """
+    permission_classes = [IsAuthenticated, NotDevice]
+
+    def post(self, request):
+        serializer = BulkResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        customer = get_request_customer(request)
+        events = serializer.filter(DetectionEvent.objects.for_customer(customer))
+        updated = set_resolved(events, resolved=serializer.validated_data['is_resolved'])
+
+        unresolved = CameraEventCounter.objects.filter(customer=customer).aggregate(
+            total=Sum('unresolved_count')
+        )['total'] or 0
+        return Response({'updated': updated, 'unresolved_count': unresolved})
+
+
+class ArchivedEventListView(generics.ListAPIView):
+    """
+    归档事件查询（超过保留期、已从事件表移出的事件）
+    - GET: 分页和过滤参数与事件列表一致（camera_id, is_resolved, person_id, since, until）
+    """
+    serializer_class = ArchivedDetectionEventSerializer
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+    pagination_class = EventCursorPagination
+
+    def get_queryset(self):
+        return ArchivedDetectionEvent.objects.filter(customer=get_request_customer(self.request))
+
+    def filter_queryset(self, queryset):
+        form = DetectionEventFilterForm(self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        return form.filter(queryset)
+
+
+class ArchivedEventDetailView(generics.RetrieveAPIView):
+    """按原事件 id 查询单个归档事件"""
+    serializer_class = ArchivedDetectionEventSerializer
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+
+    def get_queryset(self):
+        return ArchivedDetectionEvent.objects.filter(customer=get_request_customer(self.request))
+
+
+class ArchivedEventImageView(APIView):
+    """归档事件的抓拍图片（从按天的 tar 中按偏移量读取）"""
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+
+    def get(self, request, pk):
+        archived = get_object_or_404(
+            ArchivedDetectionEvent, pk=pk, customer=get_request_customer(request)
+        )
+        data = read_image(archived)
+        if data is None:
+            return Response({'detail': 'No image archived for this event.'}, status=404)
+        content_type = mimetypes.guess_type(archived.image_member)[0] or 'application/octet-stream'
+        response = HttpResponse(data, content_type=content_type)
+        # 归档后内容不会再变
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
 
 
 class DashboardStatsView(APIView):
     """
     Dashboard 统计数据接口
     返回用于渲染图表的统计数据
+    结果按客户缓存，key 带数据版本号：有新事件 / 处理事件之前一直命中缓存
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
 
     def get(self, request):
-        # 获取当前用户所属公司的所有检测事件
-        customer = request.user.userprofile.customer
-        events = DetectionEvent.objects.filter(customer=customer)
+        customer = get_request_customer(request)
+        today = timezone.now().date()
+
+        # 浏览器已有最新数据时直接 304
+        etag = data_etag(customer.pk, 'dashboard', today)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        # key 带上日期：没有新数据时，7 天趋势的窗口也要在零点后滚动；未启用版本号时不缓存
+        version = get_data_version(customer.pk)
+        key = f"ppe:dashboard:{customer.pk}:{version}:{today}" if version is not None else None
+        stats, hit = get_or_compute(
+            key,
+            lambda: self.compute_stats(customer, today),
+            dashboard_cache_stats,
+            settings.DASHBOARD_CACHE_TTL,
+        )
+        response = Response(stats)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return set_etag(response, etag)
+
+    @staticmethod
+    def compute_stats(customer, today):
+        """
+        从汇总表计算（由 ppe/rollups.py 在入库、处理时增量维护），不扫描事件表
+        读主库：结果按当前数据版本号缓存，副本有延迟时旧数据会一直挂在新版本号下
+        """
+        counters = list(
+            CameraEventCounter.objects.filter(customer=customer, total_count__gt=0)
+            .values('camera_id', 'total_count', 'unresolved_count')
+        )
 
         # 1. 总违规数
-        total_events = events.count()
+        total_events = sum(c['total_count'] for c in counters)
 
         # 2. 未处理的违规数
-        unresolved_count = events.filter(is_resolved=False).count()
+        unresolved_count = sum(c['unresolved_count'] for c in counters)
 
         # 3. 按摄像头分组统计 (用于饼图)
-        camera_stats = list(
-            events.values('camera_id')
-            .annotate(count=Count('id'))
-            .order_by('-count')
+        camera_stats = sorted(
+            ({'camera_id': c['camera_id'], 'count': c['total_count']} for c in counters),
+            key=lambda c: -c['count']
         )
 
         # 4. 过去 7 天每天的违规数量 (用于折线图)
-        today = timezone.now().date()
         seven_days_ago = today - timedelta(days=6)
         
-        # 按日期分组统计
+        # 按日期汇总小时桶（最多 7 * 24 * 摄像头数 行）
         daily_stats = dict(
-            events.filter(timestamp__date__gte=seven_days_ago)
-            .values('timestamp__date')
-            .annotate(count=Count('id'))
-            .values_list('timestamp__date', 'count')
+            HourlyEventRollup.objects.filter(
+                customer=customer, bucket__gte=day_bounds(seven_days_ago)[0]
+            )
+            .annotate(date=TruncDate('bucket'))
+            .values('date')
+            .annotate(count=Sum('event_count'))
+            .values_list('date', 'count')
         )
         
         # 补全过去 7 天的数据（没有记录的日期填 0）
@@ -95,9 +287,223 @@ class DashboardStatsView(APIView):
                 'count': daily_stats.get(date, 0)
             })
 
-        return Response({
+        return {
             'total_events': total_events,
             'unresolved_count': unresolved_count,
             'camera_stats': camera_stats,
             'recent_trend': recent_trend,
+        }
+
+
+class PersonHistoryView(APIView):
+    """
+    某个人的违规历史
+    - 每月违规次数（来自 PersonViolationCounter）
+    - 最近 ?limit=20 条事件（按 (customer, person_id, timestamp) 索引读取）
+    更早的事件用 events/?person_id=... 游标翻页
+    """
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+
+    def get(self, request, person_id):
+        customer = get_request_customer(request)
+        limit = _int_param(request, 'limit', default=20, maximum=100)
+
+        monthly = list(
+            PersonViolationCounter.objects.filter(customer=customer, person_id=person_id, event_count__gt=0)
+            .order_by('-month')
+            .values_list('month', 'event_count')
+        )
+        row_serializer = DetectionEventRowSerializer(request)
+        recent = row_serializer.many(
+            DetectionEvent.objects.for_customer(customer)
+            .filter(person_id=person_id)
+            .values(*row_serializer.columns)[:limit]
+        )
+        if not monthly and not recent:
+            raise NotFound("No events for this person.")
+
+        return Response({
+            'person_id': person_id,
+            'person_name': recent[0]['person_name'] if recent else None,
+            'total_count': sum(count for _, count in monthly),
+            'monthly': [{'month': month.strftime('%Y-%m'), 'count': count} for month, count in monthly],
+            'recent': recent,
         })
+
+
+class TopOffendersView(APIView):
+    """
+    某月违规次数最多的人（默认本月前 20 名）
+    ?month=2026-10&limit=20
+    直接按 (customer, month, -event_count) 索引取前 N 行，不对事件表做 group by
+    """
+    permission_classes = [IsAuthenticated, DeviceWriteOnly]
+
+    def get(self, request):
+        customer = get_request_customer(request)
+        limit = _int_param(request, 'limit', default=20, maximum=100)
+        month = request.query_params.get('month')
+        if month:
+            try:
+                month = datetime.strptime(month, '%Y-%m').date()
+            except ValueError:
+                raise ValidationError({'month': ['Expected YYYY-MM.']})
+        else:
+            month = rollups.month_bucket(timezone.now())
+
+        etag = data_etag(customer.pk, 'top-offenders', month, limit)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        # 姓名取该人最近一条事件上的（每人一次索引查找）
+        latest_name = (
+            DetectionEvent.objects.filter(customer=customer, person_id=OuterRef('person_id'))
+            .order_by('-timestamp', '-id')
+            .values('person_name')[:1]
+        )
+        rows = (
+            PersonViolationCounter.objects.filter(customer=customer, month=month, event_count__gt=0)
+            .order_by('-event_count', 'person_id')
+            .annotate(person_name=Subquery(latest_name))
+            .values('person_id', 'person_name', 'event_count')[:limit]
+        )
+        return set_etag(Response({
+            'month': month.strftime('%Y-%m'),
+            'results': [
+                {'person_id': r['person_id'], 'person_name': r['person_name'], 'count': r['event_count']}
+                for r in rows
+            ],
+        }), etag)
+
+
+class DashboardCacheStatsView(APIView):
+    """
+    Dashboard 缓存命中率和重算耗时（仅管理员）
+    - GET: 返回统计
+    - DELETE: 清零统计
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(dashboard_cache_stats.snapshot())
+
+    def delete(self, request):
+        dashboard_cache_stats.reset()
+        return Response(status=204)
+
+
+def _int_param(request, name, default, maximum):
+    """读取正整数查询参数，超过上限时取上限"""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: ['Must be an integer.']})
+    if value < 1:
+        raise ValidationError({name: ['Must be at least 1.']})
+    return min(value, maximum)
+
+
+def _validate_ingest_form(request):
+    """解析 multipart 表单并校验图片（CPU / 磁盘操作，在线程里执行）"""
+    form = DetectionIngestForm(request.POST, request.FILES)
+    form.is_valid()
+    return form
+
+
+def _create_event(upload, **fields):
+    """
+    在一个事务里保存图片、写入事件（post_save 信号同时更新汇总表、ViolationItem）
+    写入失败时图片的引用计数随之回滚；新写盘的文件由 gc_image_blobs --scan-files 回收
+    """
+    image_field = DetectionEvent._meta.get_field('image')
+    with transaction.atomic():
+        # 内容寻址存储，重复的图片不会再写一次
+        fields['image'] = image_field.storage.save(
+            image_field.generate_filename(None, upload.name), upload, max_length=image_field.max_length
+        )
+        return DetectionEvent.objects.create(**fields)
+
+
+@csrf_exempt
+async def ingest_event_view(request):
+    """
+    异步事件上报接口（ASGI） - 摄像头使用设备 Key 调用
+    - 请求体由 ASGI 服务器异步读完，慢速上传不占用工作线程
+    - 表单解析、图片写盘放到线程里执行，不阻塞事件循环
+    - 图片引用、事件和汇总表在同一个事务里写入，报警放进后台线程池
+    使用 Basic Auth 的旧摄像头继续走 DetectionEventListCreateView。
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+
+    raw_key = get_device_key(request.META)
+    credential = await device_key_cache.aresolve(raw_key) if raw_key else None
+    if credential is None:
+        response = JsonResponse({'detail': 'Invalid or missing device key.'}, status=401)
+        response['WWW-Authenticate'] = 'Device'
+        return response
+
+    form = await sync_to_async(_validate_ingest_form)(request)
+    if not form.is_valid():
+        return JsonResponse(form.errors, status=400)
+    data = form.cleaned_data
+
+    # async ORM 没有事务，图片、事件和汇总表的写入放到线程里的 atomic 中执行
+    event = await sync_to_async(_create_event)(
+        data['image'],
+        customer=credential.customer,
+        camera_id=credential.camera_id,
+        detections=data['detections'] or {},
+        person_name=data['person_name'] or 'Unknown',
+        person_id=data['person_id'] or 'N/A',
+    )
+
+    # 触发 WhatsApp 报警（只入队，不等待发送结果）
+    NotificationService.enqueue_whatsapp_alert(event)
+
+    return JsonResponse({
+        'id': event.id,
+        'camera_id': event.camera_id,
+        'image': request.build_absolute_uri(event.image.url),
+        'timestamp': event.timestamp.isoformat(),
+    }, status=201)
+
+
+async def live_feed_view(request):
+    """
+    实时推送接口（Server-Sent Events） - dashboard / 违规列表页面用 EventSource 订阅
+    消息类型:
+    - event:   新入库的事件（格式与事件列表接口一致）
+    - stats:   统计增量 {'changes': [{'camera_id', 'date', 'total', 'unresolved'}]}
+    - refresh: 漏了消息或其它进程写入了数据，页面需要重新拉取完整数据
+    ASGI 下是长连接；WSGI 下（runserver）每次收到一批消息后结束，由 EventSource 重连（长轮询）。
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    customer_id = await sync_to_async(get_user_customer_id)(user)
+    if customer_id is None:
+        return JsonResponse({'detail': 'User has no customer.'}, status=403)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(
+        live_feed.stream(
+            customer_id,
+            last_event_id=last_event_id,
+            long_poll=not isinstance(request, ASGIRequest),
+        ),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # 关闭 nginx 的响应缓冲，消息才能立即送达
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,72 @@
+"""
+违规明细解析
+detections JSON 至少有三种格式，统一在这里解析：
+- {'items': [{'class': 'no_helmet', 'confidence': 0.95, 'bbox': [...]}, ...]}
+- {'violation': 'no_helmet', 'confidence': 0.9, 'bbox': [...]}
+- {'class': 'no_helmet'}
+有 items（非空列表）时只看 items，顶层的 violation / class 被忽略（报警、报告、导出都一样）；
+旧的报警逻辑在 items 里没有可用标签时会退回顶层字段，现在不会。
+入库时解析一次写入 ViolationItem 表，报告 / 报警不再各自重复解析。
+设备上报的数据不可信：类型截断到 ViolationItem.violation_class 的长度，
+NaN / inf 置信度当作没有（MySQL 等数据库不接受，会让整个事件写入失败）。
+"""
+import math
+
+# 与 ViolationItem.violation_class 的 max_length 一致
+VIOLATION_CLASS_MAX_LENGTH = 100
+
+
+def normalize_violation_class(raw):
+    """统一违规类型的写法: 'No Helmet' / 'no-helmet' / 'no_helmet' -> 'no_helmet'（超长的截断）"""
+    s = str(raw).strip().lower().replace("-", " ").replace("_", " ")
+    return "_".join(s.split())[:VIOLATION_CLASS_MAX_LENGTH].rstrip("_")
+
+
+def violation_label(violation_class):
+    """可读标签: no_helmet -> No Helmet"""
+    s = str(violation_class or "").replace("_", " ").strip()
+    return s.title() if s else "Unknown"
+
+
+def _to_float(value):
+    """转换为有限的浮点数，无法转换或 NaN / inf 时返回 None"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _to_bbox(value):
+    return value if isinstance(value, (list, tuple)) else None
+
+
+def extract_violation_items(detections):
+    """
+    从 detections JSON 中提取违规明细
+    Returns:
+        list[dict]: [{'violation_class': 'no_helmet', 'confidence': 0.95, 'bbox': [...]}, ...]
+    """
+    out = []
+    if not isinstance(detections, dict):
+        return out
+
+    items = detections.get("items")
+    if items and isinstance(items, list):
+        candidates = [it for it in items if isinstance(it, dict)]
+    else:
+        candidates = [detections]
+
+    for it in candidates:
+        label = it.get("class") or it.get("violation")
+        if not label:
+            continue
+        violation_class = normalize_violation_class(label)
+        if not violation_class:
+            continue
+        out.append({
+            'violation_class': violation_class,
+            'confidence': _to_float(it.get("confidence")),
+            'bbox': _to_bbox(it.get("bbox")),
+        })
+    return out